@@ -0,0 +1,346 @@
+import argparse
+import os
+import smtplib
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.text import MIMEText
+import numpy as np
+import pandas as pd
+from airguard_upstream import quantize_coords, upstream_post
+
+
+# -----------------------------
+# Alert subscriptions
+# -----------------------------
+# Subscriptions (location, pollutants, threshold, channel) live in SQLite. The
+# engine keeps them as flat NumPy columns, grouped by quantized location cell:
+# an ingest cycle computes the AQI once per cell and then tests every
+# subscription with a handful of array operations (100k subscriptions take a
+# few milliseconds), instead of looping over people per rerun.
+ALERTS_DB = os.environ.get("AIRGUARD_ALERTS_DB", "airguard_alerts.sqlite")
+POLLUTANTS = ["pm2.5", "pm10", "no2", "o3"]
+CHANNELS = ["email", "pushover"]
+CELL_PRECISION = 2            # ~1 km cells - one fetch serves everyone in the cell
+ALERT_COOLDOWN_SECONDS = 3 * 3600
+RELOAD_SECONDS = 60           # pick up subscriptions added by other processes
+CYCLE_WORKERS = 8
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscriptions (
+    id INTEGER PRIMARY KEY,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    city TEXT,
+    pollutants INTEGER NOT NULL,    -- bit i set = POLLUTANTS[i]
+    threshold INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    target TEXT NOT NULL,
+    active INTEGER NOT NULL DEFAULT 1,
+    created REAL NOT NULL,
+    last_notified REAL NOT NULL DEFAULT 0
+)
+"""
+
+
+def pollutant_mask(pollutants):
+    mask = 0
+    for p in pollutants:
+        if p not in POLLUTANTS:
+            raise ValueError(f"unknown pollutant: {p}")
+        mask |= 1 << POLLUTANTS.index(p)
+    return mask
+
+
+def cell_keys(lat, lon, precision=CELL_PRECISION):
+    # One int64 per quantized cell, so grouping and lookups are integer sorts/searches
+    scale = 10 ** precision
+    lat_i = np.round(np.asarray(lat, dtype=float) * scale).astype(np.int64) + 90 * scale
+    lon_i = np.round(np.asarray(lon, dtype=float) * scale).astype(np.int64) + 180 * scale
+    return lat_i * (360 * scale + 1) + lon_i
+
+
+class SubscriptionStore:
+    def __init__(self, path=ALERTS_DB):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def add(self, lat, lon, pollutants, threshold, channel, target, city=None):
+        if channel not in CHANNELS:
+            raise ValueError(f"unknown channel: {channel}")
+        if not target:
+            raise ValueError("a subscription needs a target (email address or Pushover user key)")
+        conn = self._connect()
+        with conn:
+            cur = conn.execute("INSERT INTO subscriptions (lat, lon, city, pollutants, threshold, channel, target, created) "
+                               "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                               (float(lat), float(lon), city, pollutant_mask(pollutants), int(threshold),
+                                channel, target, time.time()))
+        return cur.lastrowid
+
+    def add_many(self, df):
+        # Bulk load: lat, lon, pollutants (bit mask), threshold, channel, target (+ city)
+        now = time.time()
+        rows = zip(df["lat"].astype(float), df["lon"].astype(float),
+                   df["city"] if "city" in df else [None] * len(df),
+                   df["pollutants"].astype(int), df["threshold"].astype(int),
+                   df["channel"], df["target"], [now] * len(df))
+        conn = self._connect()
+        with conn:
+            conn.executemany("INSERT INTO subscriptions (lat, lon, city, pollutants, threshold, channel, target, created) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def remove(self, subscription_id):
+        conn = self._connect()
+        with conn:
+            conn.execute("UPDATE subscriptions SET active = 0 WHERE id = ?", (int(subscription_id),))
+
+    def for_target(self, target):
+        return pd.read_sql_query("SELECT id, city, lat, lon, pollutants, threshold, channel FROM subscriptions "
+                                 "WHERE active = 1 AND target = ? ORDER BY id", self._connect(), params=(target,))
+
+    def mark_notified(self, ids, when):
+        conn = self._connect()
+        with conn:
+            conn.executemany("UPDATE subscriptions SET last_notified = ? WHERE id = ?",
+                             [(when, int(i)) for i in ids])
+
+    def load(self):
+        return pd.read_sql_query("SELECT id, lat, lon, city, pollutants, threshold, channel, target, last_notified "
+                                 "FROM subscriptions WHERE active = 1", self._connect())
+
+
+class AlertEngine:
+    def __init__(self, store, cooldown=ALERT_COOLDOWN_SECONDS, precision=CELL_PRECISION):
+        self.store = store
+        self.cooldown = cooldown
+        self.precision = precision
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._load()
+
+    def _load(self):
+        df = self.store.load()
+        keys = cell_keys(df["lat"].to_numpy(), df["lon"].to_numpy(), self.precision)
+        order = np.argsort(keys, kind="stable")
+        df = df.iloc[order].reset_index(drop=True)
+        self.ids = df["id"].to_numpy(dtype=np.int64)
+        self.keys = keys[order]
+        self.masks = df["pollutants"].to_numpy(dtype=np.uint8)
+        self.thresholds = df["threshold"].to_numpy(dtype=np.int16)
+        self.last_notified = df["last_notified"].to_numpy(dtype=float)
+        self.channel = pd.Categorical(df["channel"], categories=CHANNELS)
+        self.target = df["target"].to_numpy(dtype=object)
+        self.city = df["city"].to_numpy(dtype=object)
+        self.lat = df["lat"].to_numpy(dtype=float)
+        self.lon = df["lon"].to_numpy(dtype=float)
+        self._loaded_at = time.monotonic()
+
+    def reload(self):
+        with self._lock:
+            self._load()
+
+    def _maybe_reload(self):
+        if time.monotonic() - self._loaded_at >= RELOAD_SECONDS:
+            self._load()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def cells(self):
+        # Distinct cells that have subscribers, as (lat, lon, subscriptions)
+        with self._lock:
+            self._maybe_reload()
+            keys, first, counts = np.unique(self.keys, return_index=True, return_counts=True)
+            lat, lon = self.lat[first], self.lon[first]
+        scale = 10 ** self.precision
+        return pd.DataFrame({"lat": np.round(lat * scale) / scale, "lon": np.round(lon * scale) / scale,
+                             "subscriptions": counts})
+
+    def evaluate(self, cell_aqi, now=None, notify=True):
+        # cell_aqi: one row per cell - lat, lon and an AQI column per pollutant (NaN = no reading).
+        # Returns the subscriptions that fire, one row each with their worst pollutant.
+        now = now if now is not None else time.time()
+        with self._lock:
+            self._maybe_reload()
+            if not len(self.ids) or cell_aqi.empty:
+                return self._fired()
+
+            keys = cell_keys(cell_aqi["lat"].to_numpy(), cell_aqi["lon"].to_numpy(), self.precision)
+            aqi = cell_aqi.reindex(columns=POLLUTANTS).to_numpy(dtype=float)
+
+            # Subscriptions are sorted by cell, so each cell is one contiguous slice
+            lo = np.searchsorted(self.keys, keys, side="left")
+            hi = np.searchsorted(self.keys, keys, side="right")
+            sizes = hi - lo
+            if not sizes.sum():
+                return self._fired()
+            subs = np.repeat(lo - np.r_[0, np.cumsum(sizes)[:-1]], sizes) + np.arange(sizes.sum())
+            sub_aqi = np.repeat(aqi, sizes, axis=0)
+
+            # Only the pollutants each subscription asked for; missing readings never fire
+            wanted = (self.masks[subs][:, None] >> np.arange(len(POLLUTANTS), dtype=np.uint8)) & 1
+            sub_aqi = np.where(wanted.astype(bool) & ~np.isnan(sub_aqi), sub_aqi, -np.inf)
+            worst = sub_aqi.argmax(axis=1)
+            worst_aqi = sub_aqi[np.arange(len(subs)), worst]
+
+            fire = (worst_aqi > self.thresholds[subs]) & (now - self.last_notified[subs] >= self.cooldown)
+            subs, worst, worst_aqi = subs[fire], worst[fire], worst_aqi[fire]
+            fired = self._fired(subs, worst, worst_aqi)
+        if notify:
+            self.mark_notified(fired["id"].to_numpy(), now)
+        return fired
+
+    def mark_notified(self, ids, now=None):
+        # Start the cooldown for these subscriptions, here and in the database
+        now = now if now is not None else time.time()
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(ids):
+            return
+        with self._lock:
+            self.last_notified[np.isin(self.ids, ids)] = now
+        self.store.mark_notified(ids, now)
+
+    def _fired(self, subs=None, worst=None, worst_aqi=None):
+        if subs is None:
+            subs, worst, worst_aqi = (np.array([], dtype=np.int64),) * 2 + (np.array([]),)
+        return pd.DataFrame({
+            "id": self.ids[subs],
+            "channel": np.asarray(self.channel, dtype=object)[subs],
+            "target": self.target[subs],
+            "city": self.city[subs],
+            "pollutant": np.array(POLLUTANTS, dtype=object)[worst],
+            "aqi": worst_aqi.astype(int),
+            "threshold": self.thresholds[subs],
+        })
+
+    def evaluate_location(self, lat, lon, aqi_by_pollutant, now=None, notify=True):
+        # A single freshly fused location - the dashboard calls this on every view, with
+        # notify=False since delivery (and so the cooldown) belongs to the alerts job
+        lat, lon = quantize_coords(lat, lon, self.precision)
+        row = {"lat": lat, "lon": lon}
+        row.update({p: np.nan if aqi_by_pollutant.get(p) is None else aqi_by_pollutant[p] for p in POLLUTANTS})
+        return self.evaluate(pd.DataFrame([row]), now=now, notify=notify)
+
+    def run_cycle(self, latest_aqi, now=None, workers=CYCLE_WORKERS, notify=True):
+        # latest_aqi(lat, lon) -> {pollutant: AQI or None}; fetched once per cell, in parallel
+        cells = self.cells()
+        if cells.empty:
+            return self._fired()
+
+        def fetch(point):
+            try:
+                return latest_aqi(*point)
+            except Exception:
+                return {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(fetch, zip(cells["lat"], cells["lon"])))
+        for p in POLLUTANTS:
+            cells[p] = [np.nan if r.get(p) is None else r[p] for r in results]
+        return self.evaluate(cells, now=now, notify=notify)
+
+
+def dispatch(fired, handlers):
+    # handlers: channel -> fn(row); a failing channel must not stop the others.
+    # Returns the ids whose handler ran without raising.
+    sent = []
+    for row in fired.itertuples(index=False):
+        handler = handlers.get(row.channel)
+        if handler is None:
+            continue
+        try:
+            handler(row)
+        except Exception:
+            continue
+        sent.append(row.id)
+    return sent
+
+
+# -----------------------------
+# Senders for the standalone job
+# -----------------------------
+# Alerts are only delivered from here - the dashboard just evaluates its own cell.
+# The job has no Streamlit, so it sends directly with credentials from the
+# environment. A sender raises when
+# delivery fails, and only delivered alerts start their cooldown - a channel
+# with no credentials configured sends nothing and marks nothing.
+PUSHOVER_URL = "https://api.pushover.net/1/messages.json"
+
+
+def alert_message(row):
+    city = row.city or "your area"
+    return (f"AirGuard Alert: {row.pollutant.upper()} AQI High in {city}",
+            f"⚠️ Air Quality Alert from AirGuard!\nThe {row.pollutant.upper()} AQI in {city} has reached {row.aqi}.\n"
+            f"Please take necessary precautions.\n")
+
+
+def email_sender(host, port, address, password):
+    def send(row):
+        subject, body = alert_message(row)
+        msg = MIMEText(body, "plain")
+        msg["From"], msg["To"], msg["Subject"] = address, row.target, subject
+        with smtplib.SMTP(host, port, timeout=30) as server:
+            server.starttls()
+            server.login(address, password)
+            server.sendmail(address, [row.target], msg.as_string())
+    return send
+
+
+def pushover_sender(token):
+    def send(row):
+        subject, _ = alert_message(row)
+        resp = upstream_post(PUSHOVER_URL, data={"token": token, "user": row.target, "message": subject}, timeout=10)
+        if resp.status_code != 200:
+            raise RuntimeError(f"Pushover returned {resp.status_code}")
+    return send
+
+
+def job_senders(env=os.environ):
+    handlers = {}
+    if env.get("AIRGUARD_SMTP_USER") and env.get("AIRGUARD_SMTP_PASSWORD"):
+        handlers["email"] = email_sender(env.get("AIRGUARD_SMTP_HOST", "smtp.gmail.com"),
+                                         int(env.get("AIRGUARD_SMTP_PORT", 587)),
+                                         env["AIRGUARD_SMTP_USER"], env["AIRGUARD_SMTP_PASSWORD"])
+    if env.get("AIRGUARD_PUSHOVER_TOKEN"):
+        handlers["pushover"] = pushover_sender(env["AIRGUARD_PUSHOVER_TOKEN"])
+    return handlers
+
+
+if __name__ == "__main__":
+    from airguard_data import latest_aqi
+
+    parser = argparse.ArgumentParser(description="Evaluate every AirGuard alert subscription")
+    parser.add_argument("--interval", type=int, default=600, help="seconds between ingest cycles")
+    parser.add_argument("--once", action="store_true", help="run one cycle and exit")
+    args = parser.parse_args()
+
+    engine = AlertEngine(SubscriptionStore())
+    senders = job_senders()
+    missing = [c for c in CHANNELS if c not in senders]
+    if missing:
+        print(f"no credentials for {', '.join(missing)} - those alerts are reported but not sent "
+              f"(set AIRGUARD_SMTP_USER/AIRGUARD_SMTP_PASSWORD, AIRGUARD_PUSHOVER_TOKEN)")
+    while True:
+        start = time.monotonic()
+        now = time.time()
+        fired = engine.run_cycle(latest_aqi, now=now, notify=False)
+        sent = set(dispatch(fired, senders))
+        engine.mark_notified(sorted(sent), now)
+        print(f"{time.strftime('%H:%M:%S')} {len(engine)} subscriptions, {len(engine.cells())} cells, "
+              f"{len(fired)} alerts, {len(sent)} sent in {time.monotonic() - start:.1f}s")
+        for row in fired.itertuples(index=False):
+            print(f"  #{row.id} {row.channel} {row.target}: {row.pollutant.upper()} AQI {row.aqi} > {row.threshold}"
+                  + ("" if row.id in sent else " (not sent)"))
+        if args.once:
+            break
+        time.sleep(max(args.interval - (time.monotonic() - start), 0))
@@ -0,0 +1,226 @@
+import argparse
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from airguard_cache import MB, bounded_cache
+from airguard_data import aqi_category, calculate_aqi, fuse_location, get_aqi_color, get_coordinates
+from airguard_fusion import latest_readings
+from airguard_upstream import coalesce, json_dumps, json_loads, quantize_coords
+
+
+# -----------------------------
+# JSON API
+# -----------------------------
+# Current AQI per pollutant without the dashboard, for the mobile app and
+# kiosk displays. Same fetch/fusion/AQI code and caches as airguard_app.py.
+#   GET  /v1/aqi?lat=28.61&lon=77.21[&pollutants=pm2.5,pm10]
+#   GET  /v1/aqi?city=Delhi
+#   POST /v1/aqi/batch  {"points": [{"lat": .., "lon": ..}, {"city": ..}], "pollutants": [..]}
+#   GET  /healthz
+# Encoded bodies are cached per quantized coordinate, carry a strong ETag and
+# answer If-None-Match with 304, so polling clients cost almost nothing.
+API_HOST = os.environ.get("AIRGUARD_API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("AIRGUARD_API_PORT", 8080))
+POLLUTANTS = ["pm2.5", "pm10", "no2", "o3"]
+RESPONSE_TTL = 300
+CLIENT_MAX_AGE = 60
+MAX_BATCH_POINTS = 100
+MAX_BODY_BYTES = 1 * MB
+BATCH_WORKERS = 8
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def etag_for(body):
+    return '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+
+def etag_matches(if_none_match, etag):
+    # If-None-Match is a comma-separated list, with or without spaces or weak (W/) prefixes
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in (t[2:] if t.startswith("W/") else t for t in tags)
+
+
+def parse_pollutants(value):
+    if not value:
+        return tuple(POLLUTANTS)
+    if not isinstance(value, (str, list)):
+        raise ApiError(400, "pollutants must be a comma-separated string or a list")
+    items = value.split(",") if isinstance(value, str) else value
+    pollutants = tuple(dict.fromkeys(str(p).strip().lower() for p in items if str(p).strip()))
+    unknown = [p for p in pollutants if p not in POLLUTANTS]
+    if unknown or not pollutants:
+        raise ApiError(400, f"unknown pollutants: {', '.join(unknown) or value} (use {', '.join(POLLUTANTS)})")
+    return pollutants
+
+
+def resolve_point(point):
+    # {"lat", "lon"} or {"city"} -> quantized (lat, lon)
+    if point.get("city"):
+        try:
+            lat, lon = get_coordinates(str(point["city"]).strip())
+        except Exception:
+            # Geocoder down, circuit open or rate-limited - the caller can retry or send lat/lon
+            raise ApiError(503, "city lookup is unavailable right now, retry later or pass lat and lon")
+        if lat is None:
+            raise ApiError(404, f"unknown city: {point['city']}")
+        return quantize_coords(lat, lon)
+    try:
+        lat, lon = float(point["lat"]), float(point["lon"])
+    except (KeyError, TypeError, ValueError):
+        raise ApiError(400, "pass lat and lon (decimal degrees) or city")
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ApiError(400, "lat/lon out of range")
+    return quantize_coords(lat, lon)
+
+
+@coalesce
+@bounded_cache(ttl=RESPONSE_TTL, max_entries=4096, max_bytes=16 * MB)
+def aqi_body(lat, lon, pollutants):
+    # Encoded JSON for one point and its ETag, built once per cache period
+    fused = fuse_location(lat, lon, pollutants)
+    readings = {}
+    overall, dominant, updated = None, None, None
+    for p, latest in latest_readings(fused, list(pollutants)).items():
+        if latest is None:
+            readings[p] = None
+            continue
+        when, value, source = latest
+        aqi = calculate_aqi(p, value)
+        readings[p] = {"value": round(value, 2), "unit": "µg/m³", "aqi": aqi, "category": aqi_category(aqi),
+                       "color": get_aqi_color(aqi), "source": source, "time": when.strftime("%Y-%m-%dT%H:%M:%SZ")}
+        if aqi is not None and (overall is None or aqi > overall):
+            overall, dominant = aqi, p
+        updated = max(updated, when) if updated is not None else when
+    body = json_dumps({
+        "lat": lat, "lon": lon,
+        "aqi": overall, "category": aqi_category(overall), "dominant": dominant,
+        "updated": updated.strftime("%Y-%m-%dT%H:%M:%SZ") if updated is not None else None,
+        "pollutants": readings,
+    })
+    return body, etag_for(body)
+
+
+_batch_pool = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="airguard-api-batch")
+
+
+def batch_body(points, pollutants):
+    if not isinstance(points, list) or not points:
+        raise ApiError(400, "points must be a non-empty list")
+    if len(points) > MAX_BATCH_POINTS:
+        raise ApiError(400, f"at most {MAX_BATCH_POINTS} points per batch")
+
+    def one(point):
+        try:
+            if not isinstance(point, dict):
+                raise ApiError(400, "each point is an object with lat/lon or city")
+            return aqi_body(*resolve_point(point), pollutants)[0]
+        except ApiError as e:
+            return json_dumps({"error": e.message})
+
+    # Bodies are already encoded - splice them instead of decoding and re-encoding
+    return b'{"results":[' + b",".join(_batch_pool.map(one, points)) + b"]}"
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive for polling clients
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+    server_version = "AirGuardAPI/1.0"
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_OPTIONS(self):
+        self._send(204, b"")
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        try:
+            if method == "GET" and url.path == "/healthz":
+                return self._send(200, b'{"status":"ok"}')
+            if method == "GET" and url.path == "/v1/aqi":
+                query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                body, etag = aqi_body(*resolve_point(query), parse_pollutants(query.get("pollutants")))
+                return self._send(200, body, etag)
+            if method == "POST" and url.path == "/v1/aqi/batch":
+                payload = self._read_json()
+                # POST responses are not cacheable, so no ETag / Cache-Control here
+                return self._send(200, batch_body(payload.get("points"), parse_pollutants(payload.get("pollutants"))))
+            raise ApiError(404, f"no route for {method} {url.path}")
+        except ApiError as e:
+            self._send(e.status, json_dumps({"error": e.message}))
+        except Exception:
+            self._send(500, b'{"error":"internal error"}')
+
+    def _read_json(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            raise ApiError(400, "bad Content-Length")
+        if length < 0:
+            raise ApiError(400, "bad Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise ApiError(413, "request body too large")
+        try:
+            payload = json_loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            raise ApiError(400, "body is not valid JSON")
+        if not isinstance(payload, dict):
+            raise ApiError(400, "body must be a JSON object")
+        return payload
+
+    def _send(self, status, body, etag=None):
+        if etag is not None and etag_matches(self.headers.get("If-None-Match"), etag):
+            status, body = 304, b""
+        self.send_response(status)
+        if status != 204:
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Access-Control-Allow-Headers", "Content-Type, If-None-Match")
+        if etag is not None:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", f"public, max-age={CLIENT_MAX_AGE}")
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if os.environ.get("AIRGUARD_API_LOG"):
+            super().log_message(format, *args)
+
+
+class ApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+def serve(host=API_HOST, port=API_PORT):
+    server = ApiServer((host, port), ApiHandler)
+    print(f"AirGuard API listening on http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AirGuard JSON API")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    args = parser.parse_args()
+    serve(args.host, args.port)
@@ -1,16 +1,28 @@
 import streamlit as st
-import requests
 import pandas as pd
-import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
-from datetime import datetime, timezone
+from datetime import datetime
 from streamlit_folium import st_folium
 import folium
+import os
 import time
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from airguard_forecast import utc_now
+from airguard_fusion import fuse_readings, latest_values as fused_latest_values
+from airguard_cache import MB, cache_report, clear_caches
+from airguard_history import CSV_COMPRESSION, EXPORT_COLUMNS, PARQUET_COMPRESSION, ExportJob, parquet_available
+from airguard_upstream import (FanOut, breaker_states, coalesce_stats, hedge_stats, quantize_coords, rate_limit_stats,
+                               shared_cache, upstream_post)
+from airguard_alerts import CHANNELS
+from airguard_charts import add_envelope, frame_ends, reduce_series
+from airguard_tiles import TILE_MAX_AGE_SECONDS, TileJob, level_for_zoom, load_tile, tile_geojson
+from airguard_data import (AQI_BANDS, FORECAST_DAYS, build_forecast, calculate_aqi, calculate_aqi_array, fetch_nearby_stations, fetch_openaq,
+                           get_aqi_color, get_forecaster, get_history, get_reading_store,
+                           get_user_location, search_places, current_weather, get_alert_engine,
+                           get_alert_store, get_station_registry, pollutant_readings, get_spike_detector)
 
 
 # -----------------------------
@@ -19,19 +31,19 @@ from email.mime.multipart import MIMEMultipart
 PUSHOVER_USER_KEY = "demo_user_key"
 PUSHOVER_API_TOKEN = "demo_api_token"
 
-def send_pushover_alert(message):
+def send_pushover_alert(message, user_key=PUSHOVER_USER_KEY):
     # Skip pushover for demo - silent operation
-    if PUSHOVER_USER_KEY == "demo_user_key":
+    if PUSHOVER_API_TOKEN == "demo_api_token" or user_key == "demo_user_key":
         return  # Silent skip for demo
     
     url = "https://api.pushover.net/1/messages.json"
     payload = {
         "token": PUSHOVER_API_TOKEN,
-        "user": PUSHOVER_USER_KEY,
+        "user": user_key,
         "message": message
     }
     try:
-        response = requests.post(url, data=payload)
+        response = upstream_post(url, data=payload, timeout=10)
         if response.status_code == 200:
             st.success(f"✅ Pushover alert sent: {message}")
     except Exception:
@@ -42,8 +54,8 @@ def send_pushover_alert(message):
 # -----------------------------
 AQI_THRESHOLD = 100
 
-# OpenAQ API keys - using fallback system
-OPENAQ_API_KEYS = [None]  # Works without keys for most endpoints
+# Finished exports above this size stay on the server instead of going through the browser
+MAX_DOWNLOAD_MB = 200
 
 # -----------------------------
 # City-specific email recipients
@@ -89,140 +101,6 @@ Please take necessary precautions.
     except Exception:
         pass  # Silent fail - no error message shown
 
-# -----------------------------
-# Helper Functions
-# -----------------------------
-@st.cache_data(ttl=3600)
-def get_user_location():
-    try:
-        resp = requests.get("https://ipinfo.io/json").json()
-        city = resp.get("city", "Delhi")
-        loc = resp.get("loc", "28.6139,77.2090").split(",")
-        return city, float(loc[0]), float(loc[1])
-    except:
-        return "Delhi", 28.6139, 77.2090
-
-@st.cache_data(ttl=3600)
-def get_coordinates(city_name):
-    url = f"https://nominatim.openstreetmap.org/search?q={city_name}&format=json&limit=1"
-    resp = requests.get(url, headers={"User-Agent": "AirGuardApp"})
-    if resp.status_code != 200 or len(resp.json()) == 0:
-        return None, None
-    data = resp.json()[0]
-    return float(data["lat"]), float(data["lon"])
-
-@st.cache_data(ttl=600)
-def fetch_openaq(lat, lon, parameter, radius=50000, limit=100):
-    # Try OpenAQ API without key first (some endpoints work)
-    url = f"https://api.openaq.org/v2/measurements?coordinates={lat},{lon}&radius={radius}&parameter={parameter}&limit={limit}&sort=desc"
-    try:
-        resp = requests.get(url, timeout=5)
-        if resp.status_code == 200:
-            data = resp.json()
-            if "results" in data and len(data["results"]) > 0:
-                df = pd.DataFrame([{
-                    "location": item["location"],
-                    "value": item["value"],
-                    "unit": item["unit"],
-                    "datetime": item["date"]["utc"]
-                } for item in data["results"]])
-                df["datetime"] = pd.to_datetime(df["datetime"])
-                return df
-    except Exception:
-        pass
-    
-    # Generate realistic fallback data
-    st.session_state.openaq_failed = True
-    base_values = {"pm2.5": 45, "pm10": 65, "no2": 35, "o3": 55}
-    base_val = base_values.get(parameter, 45)
-    # Add some realistic variation based on location
-    city_factor = hash(f"{lat}{lon}") % 20 - 10
-    final_val = max(10, base_val + city_factor + np.random.normal(0, 8))
-    return pd.DataFrame([{
-        "location": f"Station-{st.session_state.city}",
-        "value": final_val,
-        "unit": "µg/m³",
-        "datetime": datetime.now(timezone.utc)
-    }])
-
-@st.cache_data(ttl=600)
-def fetch_meteo_aq(lat, lon, parameter):
-    mapping = {"pm2.5": "pm2_5", "pm10": "pm10", "no2": "nitrogen_dioxide", "o3": "ozone"}
-    param = mapping.get(parameter, "pm2_5")
-    url = f"https://air-quality-api.open-meteo.com/v1/air-quality?latitude={lat}&longitude={lon}&hourly={param}&past_days=1"
-    try:
-        resp = requests.get(url, timeout=10)
-        if resp.status_code == 200:
-            data = resp.json()
-            if "hourly" in data and param in data["hourly"]:
-                df = pd.DataFrame(data["hourly"])
-                df["datetime"] = pd.to_datetime(df["time"])
-                df.rename(columns={param: "value"}, inplace=True)
-                # Filter out null values
-                df = df.dropna(subset=["value"])
-                if not df.empty:
-                    return df[["datetime","value"]]
-    except Exception:
-        pass
-    return pd.DataFrame()
-
-def normalize_meteo_value(value, pollutant="pm2.5"):
-    limits = {"pm2.5":10,"pm10":20,"no2":10,"o3":20}
-    return max(value, limits.get(pollutant,10))
-
-def calculate_aqi(pollutant,c):
-    breakpoints = {
-        "pm2.5":[(0,30,0,50),(31,60,51,100),(61,90,101,200),(91,120,201,300),(121,250,301,400),(251,500,401,500)],
-        "pm10":[(0,50,0,50),(51,100,51,100),(101,250,101,200),(251,350,201,300),(351,430,301,400),(431,1000,401,500)],
-        "no2":[(0,40,0,50),(41,80,51,100),(81,180,101,200),(181,280,201,300),(281,400,301,400),(401,1000,401,500)],
-        "o3":[(0,50,0,50),(51,100,51,100),(101,168,101,200),(169,208,201,300),(209,748,301,400),(749,1000,401,500)]
-    }
-    for low, high, a_low, a_high in breakpoints.get(pollutant,[]):
-        if low <= c <= high:
-            return round((a_high-a_low)/(high-low)*(c-low)+a_low)
-    return None
-
-def get_aqi_color(aqi):
-    if aqi is None: return "gray"
-    if aqi<=50: return "green"
-    elif aqi<=100: return "yellow"
-    elif aqi<=200: return "orange"
-    elif aqi<=300: return "red"
-    elif aqi<=400: return "purple"
-    else: return "maroon"
-
-@st.cache_data(ttl=600)
-def fetch_nearby_stations(lat, lon, radius=50000):
-    try:
-        url = f"https://api.openaq.org/v3/locations?coordinates={lat},{lon}&radius={radius}&limit=50"
-        resp = requests.get(url, timeout=5)
-        if resp.status_code == 200:
-            data = resp.json()
-            stations = []
-            for item in data.get("results", []):
-                if "coordinates" in item:
-                    stations.append({
-                        "lat": item["coordinates"]["latitude"],
-                        "lon": item["coordinates"]["longitude"],
-                        "station": item["name"]
-                    })
-            if stations:
-                return pd.DataFrame(stations)
-    except Exception:
-        pass
-    
-    # Generate fallback stations around the location
-    fallback_stations = []
-    for i in range(3):
-        offset_lat = lat + (i-1) * 0.01
-        offset_lon = lon + (i-1) * 0.01
-        fallback_stations.append({
-            "lat": offset_lat,
-            "lon": offset_lon,
-            "station": f"Station-{i+1}"
-        })
-    return pd.DataFrame(fallback_stations)
-
 # -----------------------------
 # Streamlit Config
 # -----------------------------
@@ -517,181 +395,219 @@ search_query = st.text_input("🔎 Enter a city name:")
 
 if search_query.strip() and len(search_query) > 2:
     try:
-        url = f"https://nominatim.openstreetmap.org/search?q={search_query}&format=json&limit=5"
-        resp = requests.get(url, headers={"User-Agent": "VayuMitra"}, timeout=5)
-        
-        if resp.status_code == 200:
-            results = resp.json()
-            if results:
-                options = [f"{r['display_name']}" for r in results]
-                selected_city = st.selectbox("✨ Select a city:", options)
-                
-                if st.button("📍 Use This Location"):
-                    selected = results[options.index(selected_city)]
-                    st.session_state.city = selected["display_name"].split(",")[0]
-                    st.session_state.lat = float(selected["lat"])
-                    st.session_state.lon = float(selected["lon"])
-                    st.success(f"📍 Location updated to: {st.session_state.city}")
-                    st.rerun()
-            else:
-                st.info("🔍 No cities found. Try a different search term.")
+        results = search_places(search_query.strip())
+        if results:
+            options = [f"{r['display_name']}" for r in results]
+            selected_city = st.selectbox("✨ Select a city:", options)
+            
+            if st.button("📍 Use This Location"):
+                selected = results[options.index(selected_city)]
+                st.session_state.city = selected["display_name"].split(",")[0]
+                st.session_state.lat = float(selected["lat"])
+                st.session_state.lon = float(selected["lon"])
+                st.success(f"📍 Location updated to: {st.session_state.city}")
+                st.rerun()
+        else:
+            st.info("🔍 No cities found. Try a different search term.")
     except Exception:
         st.info("🌐 Search temporarily unavailable.")
 
 lat, lon = st.session_state.lat, st.session_state.lon
 st.info(f"📍 Current location: **{st.session_state.city}**")
 
+# -----------------------------
+# Page Fetches
+# -----------------------------
+# The map and the cards need different upstream calls that do not depend on each
+# other, so they all start here at once and each section fills its placeholder as
+# its own results arrive (see FanOut). A map click is already in the map's widget
+# state, so the clicked location is known before the map is drawn again.
+pollutants = ["pm2.5","pm10","no2","o3"]
+map_state = st.session_state.get("main_map") or {}
+if map_state.get("last_clicked"):
+    current_lat, current_lon = map_state["last_clicked"]["lat"], map_state["last_clicked"]["lng"]
+    # History for a clicked point is its own series - never written under the searched city's name
+    history_location = "{:.3f},{:.3f}".format(*quantize_coords(current_lat, current_lon))
+else:
+    current_lat, current_lon = lat, lon
+    history_location = st.session_state.city
+
+page = FanOut({
+    "stations": (fetch_nearby_stations, lat, lon),
+    "map_pm25": (lambda: fetch_openaq(lat, lon, "pm2.5", limit=1000),),
+    **{p: (pollutant_readings, current_lat, current_lon, p) for p in pollutants},
+})
+
 # -----------------------------
 # Map Section
 # -----------------------------
 st.markdown("## 🌐 Air Quality Map")
-stations_df = fetch_nearby_stations(lat, lon)
-
-# Create the map
-m = folium.Map(
-    location=[lat, lon],
-    zoom_start=10,
-    tiles="CartoDB dark_matter" if st.session_state.theme=="dark" else "OpenStreetMap"
-)
-
-# 1️⃣ Add city marker
-folium.Marker(
-    location=[lat, lon],
-    popup=f"📍 {st.session_state.city}",
-    tooltip=f"{st.session_state.city} (click to navigate)",
-    icon=folium.Icon(color="blue", icon="info-sign")
-).add_to(m)
-
-# 2️⃣ Add AQI station markers
-for _, row in stations_df.iterrows():
-    df_station = fetch_openaq(row["lat"], row["lon"], "pm2.5", radius=1000, limit=1)
-    aqi_val = calculate_aqi("pm2.5", df_station["value"].iloc[0]) if not df_station.empty else None
-    color = get_aqi_color(aqi_val)
-    folium.CircleMarker(
-        location=[row["lat"], row["lon"]],
-        radius=12,
-        color=color,
-        fill=True,
-        fill_color=color,
-        fill_opacity=0.8,
-        popup=f"<b>{row['station']}</b><br>AQI: {aqi_val if aqi_val is not None else 'N/A'}",
-        tooltip=f"AQI: {aqi_val if aqi_val is not None else 'N/A'}"
-    ).add_to(m)
+show_grid = st.toggle("🗺️ Regional PM2.5 grid (precomputed tiles)", key="show_grid")
+map_slot = st.container()
+with map_slot:
+    map_loading = st.empty()
+    map_loading.info("🌐 Loading stations...")
+if map_state.get("last_clicked"):
+    st.info(f"📍 Selected location: {current_lat:.4f}, {current_lon:.4f}")
+
+def render_map(stations_df, df_latest_pm25):
+    # Create the map
+    m = folium.Map(
+        location=[lat, lon],
+        zoom_start=st.session_state.get("map_zoom", 5) if show_grid else 10,
+        tiles="CartoDB dark_matter" if st.session_state.theme=="dark" else "OpenStreetMap"
+    )
 
-# 3️⃣ Handle last clicked location
-# Add a marker if the user clicked somewhere
-click_data = st_folium(m, width=1525, height=550, key="main_map")
+    # 0️⃣ Regional grid - read from tiles on disk, never from the upstreams
+    if show_grid:
+        grid_level = level_for_zoom(st.session_state.get("map_zoom"))
+        tile = load_tile("india", "pm2.5", grid_level)
+        if tile is None or time.time() - float(tile["generated"]) > TILE_MAX_AGE_SECONDS:
+            if TileJob.start("india"):
+                st.info("Building regional AQI tiles in the background - they will appear on the next refresh.")
+        if TileJob.last_error:
+            st.caption(f"⚠️ Last regional tile build failed ({TileJob.last_error}) - the grid keeps its previous tiles.")
+        if tile is not None:
+            folium.GeoJson(
+                tile_geojson(tile, st.session_state.get("map_bounds")),
+                name=f"AQI grid ({grid_level})",
+                style_function=lambda f: {"fillColor": f["properties"]["color"], "color": f["properties"]["color"],
+                                          "weight": 0.5, "fillOpacity": 0.45},
+                tooltip=folium.GeoJsonTooltip(fields=["aqi", "stations"], aliases=["AQI", "Stations"]),
+            ).add_to(m)
+
+    # 1️⃣ Add city marker
+    folium.Marker(
+        location=[lat, lon],
+        popup=f"📍 {st.session_state.city}",
+        tooltip=f"{st.session_state.city} (click to navigate)",
+        icon=folium.Icon(color="blue", icon="info-sign")
+    ).add_to(m)
 
-if click_data.get("last_clicked"):
-    clicked_lat = click_data["last_clicked"]["lat"]
-    clicked_lon = click_data["last_clicked"]["lng"]
-    
-    # Update the coordinates for AQI calculations
-    current_lat, current_lon = clicked_lat, clicked_lon
-    st.info(f"📍 Selected location: {clicked_lat:.4f}, {clicked_lon:.4f}")
-else:
-    current_lat, current_lon = lat, lon
+    # 2️⃣ Add AQI station markers
+    # One latest-by-location request covers every marker; rows are newest first
+    station_pm25 = df_latest_pm25.drop_duplicates("location_id").set_index("location_id")["value"]
+    for _, row in stations_df.iterrows():
+        station_val = station_pm25.get(row["location_id"])
+        aqi_val = calculate_aqi("pm2.5", station_val) if station_val is not None else None
+        color = get_aqi_color(aqi_val)
+        folium.CircleMarker(
+            location=[row["lat"], row["lon"]],
+            radius=12,
+            color=color,
+            fill=True,
+            fill_color=color,
+            fill_opacity=0.8,
+            popup=f"<b>{row['station']}</b><br>AQI: {aqi_val if aqi_val is not None else 'N/A'}",
+            tooltip=f"AQI: {aqi_val if aqi_val is not None else 'N/A'}"
+        ).add_to(m)
+
+    click_data = st_folium(m, width=1525, height=550, key="main_map")
+    if click_data.get("zoom"):
+        st.session_state.map_zoom = click_data["zoom"]
+    if click_data.get("bounds"):
+        b = click_data["bounds"]
+        st.session_state.map_bounds = (b["_southWest"]["lat"], b["_southWest"]["lng"], b["_northEast"]["lat"], b["_northEast"]["lng"])
 
 
 # -----------------------------
 # AQI Boxes & Alerts
 # -----------------------------
-pollutants = ["pm2.5","pm10","no2","o3"]
 if "selected_pollutant" not in st.session_state: st.session_state.selected_pollutant = "pm2.5"
 
 def set_selected_pollutant(p):
     st.session_state.selected_pollutant = p
 
-def render_aqi_boxes(lat, lon):
-    latest_values = {}
-    cols = st.columns(len(pollutants))
-    for i, p in enumerate(pollutants):
-        df_g = fetch_openaq(lat, lon, p)
-        df_m = fetch_meteo_aq(lat, lon, p)
-        if not df_m.empty:
-            df_m["value"] = df_m["value"].apply(lambda x: normalize_meteo_value(x,p))
-        val = None
-        if not df_g.empty and not df_m.empty:
-            # Ensure both datetime columns have the same timezone
-            df_g['datetime'] = pd.to_datetime(df_g['datetime']).dt.tz_localize(None)
-            df_m['datetime'] = pd.to_datetime(df_m['datetime']).dt.tz_localize(None)
-            merged = pd.merge_asof(df_m.sort_values("datetime"),
-                                   df_g.sort_values("datetime"),
-                                   on="datetime",
-                                   tolerance=pd.Timedelta("1h"),
-                                   direction="nearest",
-                                   suffixes=('_meteo', '_openaq'))
-            # Use OpenAQ data if available, otherwise use Meteo data
-            if 'value_openaq' in merged.columns:
-                merged['final_value'] = merged['value_openaq'].fillna(merged['value_meteo'])
-            else:
-                merged['final_value'] = merged['value_meteo']
-            val = merged['final_value'].iloc[-1]
-        elif not df_g.empty:
-            val = df_g["value"].iloc[0]
-        elif not df_m.empty:
-            val = df_m["value"].iloc[-1]
-        latest_values[p] = val
-        aqi_val = calculate_aqi(p,val) if val is not None else None
-        color = get_aqi_color(aqi_val)
-        with cols[i]:
-            if st.button(f"{p.upper()}", key=f"btn_{p}"):
-                set_selected_pollutant(p)
-            bg_card = "#ffffff" if st.session_state.theme == "light" else "#1f1f1f"
-            text_card = "#000000" if st.session_state.theme == "light" else "#ffffff"
-            
-            st.markdown(f"""
-            <div class="floating-card neon-glow" style='
-                background: {'rgba(255,255,255,0.1)' if st.session_state.theme == 'dark' else 'rgba(255,255,255,0.9)'};
-                color: {text_card};
-                padding: 30px;
-                border-radius: 20px;
-                text-align: center;
-                backdrop-filter: blur(20px);
-                border: 2px solid {color};
-                position: relative;
-                overflow: hidden;
-                transition: all 0.3s cubic-bezier(0.4, 0, 0.2, 1);
-            ' title='Latest AQI: {aqi_val if aqi_val is not None else "N/A"}'>
-                <div style="
-                    position: absolute;
-                    top: -50%;
-                    left: -50%;
-                    width: 200%;
-                    height: 200%;
-                    background: linear-gradient(45deg, transparent, rgba(255,255,255,0.1), transparent);
-                    transform: rotate(45deg);
-                    animation: shimmer 3s infinite;
-                "></div>
-                <div style="position: relative; z-index: 1;">
-                    <h4 style='margin-bottom: 15px; font-weight: 600; font-size: 16px;'>{p.upper()}</h4>
-                    <div style='
-                        font-size: 2.5rem;
-                        font-weight: 800;
-                        color: {color};
-                        margin: 15px 0;
-                        text-shadow: 2px 2px 4px rgba(0,0,0,0.3);
-                    '>{aqi_val if aqi_val is not None else 'N/A'}</div>
-                    <div style='
-                        height: 6px;
-                        width: 100%;
-                        background: linear-gradient(90deg, {color}, rgba(255,255,255,0.3));
-                        border-radius: 10px;
-                        margin-top: 15px;
-                        box-shadow: 0 2px 10px rgba(0,0,0,0.2);
-                    '></div>
-                </div>
-            </div>
-            <style>
-                @keyframes shimmer {{
-                    0% {{ transform: translateX(-100%) translateY(-100%) rotate(45deg); }}
-                    100% {{ transform: translateX(100%) translateY(100%) rotate(45deg); }}
-                }}
-            </style>
-            """, unsafe_allow_html=True)
-    return latest_values
-
-latest_values = render_aqi_boxes(current_lat, current_lon)
+def aqi_card_html(p, aqi_val, loading=False):
+    color = get_aqi_color(aqi_val)
+    text_card = "#000000" if st.session_state.theme == "light" else "#ffffff"
+    shown = "..." if loading else aqi_val if aqi_val is not None else "N/A"
+    return f"""
+    <div class="floating-card neon-glow" style='
+        background: {'rgba(255,255,255,0.1)' if st.session_state.theme == 'dark' else 'rgba(255,255,255,0.9)'};
+        color: {text_card};
+        padding: 30px;
+        border-radius: 20px;
+        text-align: center;
+        backdrop-filter: blur(20px);
+        border: 2px solid {color};
+        position: relative;
+        overflow: hidden;
+        transition: all 0.3s cubic-bezier(0.4, 0, 0.2, 1);
+    ' title='Latest AQI: {aqi_val if aqi_val is not None else "N/A"}'>
+        <div style="
+            position: absolute;
+            top: -50%;
+            left: -50%;
+            width: 200%;
+            height: 200%;
+            background: linear-gradient(45deg, transparent, rgba(255,255,255,0.1), transparent);
+            transform: rotate(45deg);
+            animation: shimmer 3s infinite;
+        "></div>
+        <div style="position: relative; z-index: 1;">
+            <h4 style='margin-bottom: 15px; font-weight: 600; font-size: 16px;'>{p.upper()}</h4>
+            <div style='
+                font-size: 2.5rem;
+                font-weight: 800;
+                color: {color};
+                margin: 15px 0;
+                text-shadow: 2px 2px 4px rgba(0,0,0,0.3);
+            '>{shown}</div>
+            <div style='
+                height: 6px;
+                width: 100%;
+                background: linear-gradient(90deg, {color}, rgba(255,255,255,0.3));
+                border-radius: 10px;
+                margin-top: 15px;
+                box-shadow: 0 2px 10px rgba(0,0,0,0.2);
+            '></div>
+        </div>
+    </div>
+    <style>
+        @keyframes shimmer {{
+            0% {{ transform: translateX(-100%) translateY(-100%) rotate(45deg); }}
+            100% {{ transform: translateX(100%) translateY(100%) rotate(45deg); }}
+        }}
+    </style>
+    """
+
+card_slots = {}
+for col, p in zip(st.columns(len(pollutants)), pollutants):
+    with col:
+        if st.button(f"{p.upper()}", key=f"btn_{p}"):
+            set_selected_pollutant(p)
+        card_slots[p] = st.empty()
+        card_slots[p].markdown(aqi_card_html(p, None, loading=True), unsafe_allow_html=True)
+
+# Fill cards and the map in whatever order their fetches finish
+map_drawn = False
+for name, result in page.as_completed():
+    if name in card_slots:
+        val = fused_latest_values(fuse_readings(result, [name]), [name])[name]
+        card_slots[name].markdown(aqi_card_html(name, calculate_aqi(name, val) if val is not None else None),
+                                  unsafe_allow_html=True)
+    if not map_drawn and "stations" in page.results and "map_pm25" in page.results:
+        with map_slot:
+            map_loading.empty()
+            render_map(page.results["stations"], page.results["map_pm25"])
+        map_drawn = True
+
+# Whatever missed the page deadline renders as unavailable; it keeps loading in the background
+for p in pollutants:
+    if p not in page.results:
+        card_slots[p].markdown(aqi_card_html(p, None), unsafe_allow_html=True)
+stations_df = page.get("stations", pd.DataFrame(columns=["lat", "lon", "station", "location_id"]))
+if not map_drawn:
+    with map_slot:
+        map_loading.empty()
+        render_map(stations_df, page.get("map_pm25", pd.DataFrame(columns=["location_id", "value"])))
+
+fused = fuse_readings(pd.concat([page.get(p, pd.DataFrame(columns=["datetime", "value", "pollutant", "source"]))
+                                 for p in pollutants], ignore_index=True), pollutants)
+get_history().record(history_location, current_lat, current_lon, fused)
+st.session_state.openaq_failed = bool((fused.xs("source", axis=1, level=1) == "fallback").any().any()) if not fused.empty else False
+latest_values = fused_latest_values(fused, pollutants)
 
 # Dynamic Alert Banner - Only show when any AQI > 100
 max_aqi = 0
@@ -752,6 +668,27 @@ if latest_values.get("pm2.5") is not None:
         </div>
         """, unsafe_allow_html=True)
 
+# -----------------------------
+# Sudden Changes Nearby
+# -----------------------------
+# Flagged by the streaming detector as readings were ingested (this page's fetches and any
+# other session's): a station far above its own recent level, or doubling within hours,
+# is worth knowing before the AQI band changes. Stuck or broken sensors are listed quietly.
+SPIKE_LOOKBACK = pd.Timedelta(hours=3)
+spikes = get_spike_detector().recent(since=utc_now() - SPIKE_LOOKBACK,
+                                     lat=current_lat, lon=current_lon)
+if not spikes.empty:
+    rising = spikes[spikes["kind"].isin(["spike", "rapid_rise"])].drop_duplicates(["location_id", "pollutant"])
+    for _, ev in rising.head(3).iterrows():
+        verb = "spiked" if ev["kind"] == "spike" else "rose sharply"
+        st.warning(f"⚡ {ev['pollutant'].upper()} at {ev['station'] or ev['location_id']} {verb} to "
+                   f"{ev['value']:.0f} µg/m³ (recent level ~{ev['baseline']:.0f}) at {ev['datetime']:%H:%M} UTC")
+    faulty = spikes[spikes["kind"].isin(["flatline", "out_of_range"])].drop_duplicates(["location_id", "pollutant"])
+    if not faulty.empty:
+        st.caption("Possible sensor faults nearby: " + ", ".join(
+            f"{s or l} ({p.upper()}, {k.replace('_', ' ')})"
+            for s, l, p, k in faulty[["station", "location_id", "pollutant", "kind"]].head(5).itertuples(index=False)))
+
 # -----------------------------
 # Trigger Pushover Alerts
 # -----------------------------
@@ -774,6 +711,18 @@ if st.session_state.city in CITY_EMAIL_RECIPIENTS:
             if aqi_val and aqi_val > AQI_THRESHOLD:
                 send_email_alert(pollutant, aqi_val, st.session_state.city, recipients)
 
+# -----------------------------
+# Trigger Subscription Alerts
+# -----------------------------
+# Subscribers in this location's cell are checked against the readings just fetched,
+# but only the alerts job (airguard_alerts.py) delivers and starts cooldowns - a page
+# view must not mark strangers notified, block on SMTP or show their addresses
+current_aqi = {p: calculate_aqi(p, val) if val is not None else None for p, val in latest_values.items()}
+fired_alerts = get_alert_engine().evaluate_location(current_lat, current_lon, current_aqi, notify=False)
+if not fired_alerts.empty:
+    st.caption(f"🔔 {len(fired_alerts)} alert subscription(s) for this area are over their threshold "
+               f"and will be notified by the alerts job")
+
 # -----------------------------
 # 24h Forecast Charts (keep your original code)
 # -----------------------------
@@ -791,92 +740,92 @@ if st.session_state.city in CITY_EMAIL_RECIPIENTS:
 st.markdown("## 📈 24/7h AQI Mountain Forecast")
 forecast_pollutant = st.session_state.selected_pollutant
 
-df_click_meteo = fetch_meteo_aq(current_lat, current_lon, forecast_pollutant)
-if not df_click_meteo.empty:
-    df_click_meteo["value"] = df_click_meteo["value"].apply(lambda x: normalize_meteo_value(x, forecast_pollutant))
-    df_click_meteo["AQI"] = df_click_meteo["value"].apply(lambda x: calculate_aqi(forecast_pollutant, x))
-    df_forecast = df_click_meteo.rename(columns={"AQI":"forecast"})
+df_forecast = build_forecast(fused, current_lat, current_lon, forecast_pollutant)
+
+if df_forecast.empty:
+    st.info("📡 Forecast data is temporarily unavailable for this location.")
 else:
-    df_forecast = pd.DataFrame({
-        "datetime": pd.date_range(start=datetime.now(timezone.utc), periods=24, freq="H"),
-        "forecast": 50 + np.random.normal(0,5,24).cumsum()
-    })
-
-# Dynamic Y-axis based on AQI
-max_aqi = df_forecast["forecast"].max()
-if max_aqi <= 50: y_max = 60
-elif max_aqi <= 100: y_max = 120
-elif max_aqi <= 200: y_max = 220
-elif max_aqi <= 300: y_max = 320
-elif max_aqi <= 400: y_max = 420
-else: y_max = 520
-
-colorscale = [
-    [0, "green"], [0.2, "yellow"], [0.4, "orange"],
-    [0.6, "red"], [0.8, "purple"], [1, "maroon"]
-]
-
-fig = px.scatter(
-    df_forecast, x="datetime", y="forecast", color="forecast",
-    color_continuous_scale=colorscale,
-    title=f"24h AQI Mountain Forecast ({forecast_pollutant.upper()})",
-    labels={"forecast":"Air Quality Index","datetime":"Time"},
-    template="plotly_dark" if st.session_state.theme=="dark" else "plotly_white"
-)
-fig.update_traces(mode="lines+markers", line=dict(width=3), fill="tozeroy")
-
-bands = [(0,50,"Good","green"),(51,100,"Moderate","yellow"),
-         (101,200,"Unhealthy (SG)","orange"),(201,300,"Unhealthy","red"),
-         (301,400,"Very Unhealthy","purple"),(401,500,"Hazardous","maroon")]
-for low, high, label, color in bands:
-    fig.add_hrect(y0=low, y1=high, fillcolor=color, opacity=0.1, line_width=0,
-                  annotation_text=label, annotation_position="inside top left")
-
-fig.update_layout(
-    margin=dict(l=10,r=10,t=30,b=10),
-    height=400,
-    yaxis=dict(range=[0, y_max]),
-    coloraxis_colorbar=dict(title="AQI Level")
-)
-
-# --- Add Animation Frames ---
-fig.update_layout(
-    updatemenus=[{
-        "type": "buttons", "showactive": False,
-        "buttons": [
-            {"label": "▶ Play","method": "animate",
-             "args": [None, {"frame": {"duration": 500, "redraw": True},
-                             "fromcurrent": True,
-                             "transition": {"duration": 300}}]},
-            {"label": "⏸ Pause","method": "animate",
-             "args": [[None], {"frame": {"duration": 0, "redraw": False},
-                               "mode": "immediate",
-                               "transition": {"duration": 0}}]},
-        ],
-    }],
-    sliders=[{
-        "steps": [
-            {"method": "animate",
-             "args": [[f"{t}"], {"mode": "immediate",
-                                 "frame": {"duration": 0, "redraw": True},
-                                 "transition": {"duration": 0}}],
-             "label": str(t)} for t in range(len(df_forecast))
-        ],
-    }],
-)
-
-frames = [
-    go.Frame(
-        data=[go.Scatter(x=df_forecast["datetime"][:k+1],
-                         y=df_forecast["forecast"][:k+1],
-                         mode="lines+markers",
-                         line=dict(width=3))],
-        name=str(k)
-    ) for k in range(len(df_forecast))
-]
-fig.update(frames=frames)
-
-st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False})
+    # Dynamic Y-axis based on AQI
+    max_aqi = df_forecast["forecast"].max()
+    if max_aqi <= 50: y_max = 60
+    elif max_aqi <= 100: y_max = 120
+    elif max_aqi <= 200: y_max = 220
+    elif max_aqi <= 300: y_max = 320
+    elif max_aqi <= 400: y_max = 420
+    else: y_max = 520
+
+    colorscale = [
+        [0, "green"], [0.2, "yellow"], [0.4, "orange"],
+        [0.6, "red"], [0.8, "purple"], [1, "maroon"]
+    ]
+
+    # Plotted from a reduced copy: chart size stays fixed however many forecast days there are
+    chart_forecast = reduce_series(df_forecast, "datetime", "forecast")
+    fig = px.scatter(
+        chart_forecast, x="datetime", y="forecast", color="forecast",
+        color_continuous_scale=colorscale,
+        title=f"Past 24h + {FORECAST_DAYS*24}h AQI Mountain Forecast ({forecast_pollutant.upper()})",
+        labels={"forecast":"Air Quality Index","datetime":"Time"},
+        template="plotly_dark" if st.session_state.theme=="dark" else "plotly_white"
+    )
+    fig.update_traces(mode="lines+markers", line=dict(width=3), fill="tozeroy")
+    add_envelope(fig, chart_forecast, "datetime", "forecast")
+    # Everything right of this line is model forecast, left of it is observed/bias-corrected history
+    fig.add_vline(x=utc_now(), line_width=2, line_dash="dot", line_color="gray")
+
+    for low, high, label, color in AQI_BANDS:
+        fig.add_hrect(y0=low, y1=high, fillcolor=color, opacity=0.1, line_width=0,
+                      annotation_text=label, annotation_position="inside top left")
+
+    fig.update_layout(
+        margin=dict(l=10,r=10,t=30,b=10),
+        height=400,
+        yaxis=dict(range=[0, y_max]),
+        coloraxis_colorbar=dict(title="AQI Level")
+    )
+
+    # --- Add Animation Frames ---
+    # A fixed number of steps, each revealing more of the reduced line
+    ends = frame_ends(len(chart_forecast))
+    line_trace = len(fig.data) - 1   # the envelope, if any, sits underneath
+    fig.update_layout(
+        updatemenus=[{
+            "type": "buttons", "showactive": False,
+            "buttons": [
+                {"label": "▶ Play","method": "animate",
+                 "args": [None, {"frame": {"duration": 500, "redraw": True},
+                                 "fromcurrent": True,
+                                 "transition": {"duration": 300}}]},
+                {"label": "⏸ Pause","method": "animate",
+                 "args": [[None], {"frame": {"duration": 0, "redraw": False},
+                                   "mode": "immediate",
+                                   "transition": {"duration": 0}}]},
+            ],
+        }],
+        sliders=[{
+            "steps": [
+                {"method": "animate",
+                 "args": [[f"{t}"], {"mode": "immediate",
+                                     "frame": {"duration": 0, "redraw": True},
+                                     "transition": {"duration": 0}}],
+                 "label": str(t)} for t in range(len(ends))
+            ],
+        }],
+    )
+
+    frames = [
+        go.Frame(
+            data=[go.Scatter(x=chart_forecast["datetime"][:end],
+                             y=chart_forecast["forecast"][:end],
+                             mode="lines+markers",
+                             line=dict(width=3))],
+            traces=[line_trace],
+            name=str(k)
+        ) for k, end in enumerate(ends)
+    ]
+    fig.update(frames=frames)
+
+    st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False})
 
 # -----------------------------
 # Interactive Health Recommendations
@@ -1001,8 +950,20 @@ st.markdown("## 🎮 Interactive Features")
 with st.expander("🔔 Set Custom AQI Alerts", expanded=False):
     alert_threshold = st.slider("Alert me when AQI exceeds:", 0, 300, AQI_THRESHOLD, 10)
     alert_pollutants = st.multiselect("Monitor these pollutants:", ["pm2.5", "pm10", "no2", "o3"], ["pm2.5"])
+    alert_channel = st.selectbox("Notify me by:", CHANNELS, format_func=lambda c: {"email": "📧 Email", "pushover": "📱 Pushover"}[c])
+    alert_target = st.text_input("Email address:" if alert_channel == "email" else "Pushover user key:").strip()
     if st.button("📧 Save Alert Settings"):
-        st.success(f"Alert set for AQI > {alert_threshold} for {', '.join(alert_pollutants)}")
+        if not alert_pollutants or not alert_target:
+            st.warning("Pick at least one pollutant and enter where to send the alert.")
+        else:
+            get_alert_store().add(current_lat, current_lon, alert_pollutants, alert_threshold,
+                                  alert_channel, alert_target, city=st.session_state.city)
+            get_alert_engine().reload()
+            st.success(f"Alert set for AQI > {alert_threshold} for {', '.join(alert_pollutants)} in {st.session_state.city}")
+    if alert_target:
+        my_alerts = get_alert_store().for_target(alert_target)
+        if not my_alerts.empty:
+            st.caption(f"{len(my_alerts)} active alert(s) for {alert_target}")
 
 # Quick Actions
 st.markdown("### ⚡ Quick Actions")
@@ -1039,7 +1000,9 @@ with action_cols[2]:
         st.info(f"Found {len(stations_df)} monitoring stations nearby")
 with action_cols[3]:
     if st.button("🔄 Refresh Data"):
-        st.cache_data.clear()
+        # Only this process's caches - the shared upstream cache serves every worker and
+        # session, and its entries expire on their own TTL
+        clear_caches()
         st.success("Data refreshed!")
 
 # -----------------------------
@@ -1058,42 +1021,65 @@ with st.expander("🌤️ Weather Impact on Air Quality", expanded=False):
         st.write("• Humidity affects particle formation")
     with weather_cols[1]:
         if st.button("🌡️ Get Weather Data"):
-            # Simulate weather data (in production, use OpenWeatherMap API)
-            import random
-            temp = random.randint(15, 35)
-            humidity = random.randint(40, 80)
-            wind_speed = random.randint(5, 25)
-            conditions = random.choice(["Clear", "Cloudy", "Rainy", "Foggy"])
-            
-            st.markdown(f"""**Current Weather in {st.session_state.city}:**
-            🌡️ Temperature: {temp}°C
-            💧 Humidity: {humidity}%
-            💨 Wind Speed: {wind_speed} km/h
+            # Same Open-Meteo bundle (and hour) as the AQI cards - no extra request
+            weather = current_weather(current_lat, current_lon)
+            if weather is None:
+                st.info("Weather data is not available for this location right now.")
+            else:
+                def fmt(value, unit, digits=0):
+                    return f"{value:.{digits}f}{unit}" if value is not None else "N/A"
+                wind_speed = weather["wind_speed"]
+                humidity = weather["humidity"]
+                precipitation = weather["precipitation"] or 0
+                conditions = weather["conditions"] or "N/A"
+
+                st.markdown(f"""**Current Weather in {st.session_state.city}** ({weather["datetime"]:%H:%M} UTC):
+            🌡️ Temperature: {fmt(weather["temperature"], "°C", 1)}
+            💧 Humidity: {fmt(humidity, "%")}
+            💨 Wind Speed: {fmt(wind_speed, " km/h")}
+            🌧️ Precipitation: {fmt(precipitation, " mm", 1)}
             ☁️ Conditions: {conditions}
             
             **Impact on Air Quality:**""")
-            
-            if wind_speed > 15:
-                st.success("✅ High wind speed helps disperse pollutants")
-            elif wind_speed < 8:
-                st.warning("⚠️ Low wind speed may trap pollutants")
-            else:
-                st.info("ℹ️ Moderate wind conditions")
-                
-            if conditions == "Rainy":
-                st.success("✅ Rain helps wash out air pollutants")
-            elif conditions == "Foggy":
-                st.warning("⚠️ Fog can worsen air quality perception")
-                
-            if humidity > 70:
-                st.warning("⚠️ High humidity may increase particle formation")
+
+                if wind_speed is not None:
+                    if wind_speed > 15:
+                        st.success("✅ High wind speed helps disperse pollutants")
+                    elif wind_speed < 8:
+                        st.warning("⚠️ Low wind speed may trap pollutants")
+                    else:
+                        st.info("ℹ️ Moderate wind conditions")
+
+                if conditions == "Rainy" or precipitation > 0.2:
+                    st.success("✅ Rain helps wash out air pollutants")
+                elif conditions == "Foggy":
+                    st.warning("⚠️ Fog can worsen air quality perception")
+
+                if humidity is not None and humidity > 70:
+                    st.warning("⚠️ High humidity may increase particle formation")
 
 # AQI History Tracker
 with st.expander("📊 AQI History & Trends", expanded=False):
     history_cols = st.columns(3)
     with history_cols[0]:
-        if st.button("📈 7-Day Trend"):
-            st.line_chart(pd.DataFrame({"AQI": [45, 52, 38, 61, 55, 48, 42]}))
+        trend_days = st.selectbox("Range:", [7, 30, 90, 365], format_func=lambda d: f"{d} days")
+        if st.button("📈 Trend"):
+            # Hourly history from the store, reduced to a fixed number of points for the chart
+            trend = list(get_history().chunks(cities=[history_location], pollutants=[forecast_pollutant],
+                                              start=utc_now() - pd.Timedelta(days=trend_days),
+                                              columns=["datetime", "value"]))
+            if not trend:
+                st.info("No stored history for this location yet.")
+            else:
+                trend = pd.concat(trend, ignore_index=True)
+                trend["aqi"] = calculate_aqi_array(forecast_pollutant, trend["value"].to_numpy(dtype=float))
+                chart_trend = reduce_series(trend, "datetime", "aqi")
+                fig = px.line(chart_trend, x="datetime", y="aqi", labels={"aqi": "AQI", "datetime": "Time"},
+                              title=f"{forecast_pollutant.upper()} AQI, last {trend_days} days",
+                              template="plotly_dark" if st.session_state.theme=="dark" else "plotly_white")
+                add_envelope(fig, chart_trend, "datetime", "aqi")
+                fig.update_layout(margin=dict(l=10,r=10,t=30,b=10), height=300)
+                st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False})
     with history_cols[1]:
         if st.button("📅 Monthly Average"):
             st.bar_chart(pd.DataFrame({"Month": ["Jan", "Feb", "Mar"], "AQI": [58, 45, 52]}).set_index("Month"))
@@ -1101,6 +1087,49 @@ with st.expander("📊 AQI History & Trends", expanded=False):
         if st.button("🔄 Compare Cities"):
             st.info("City comparison feature would show AQI differences")
 
+# Bulk Export
+with st.expander("📦 Export Historical Readings", expanded=False):
+    history = get_history()
+    first_seen, last_seen = history.span()
+    if first_seen is None:
+        st.info("No stored history yet - hourly readings are recorded as locations are viewed.")
+    else:
+        export_cols = st.columns(2)
+        with export_cols[0]:
+            export_cities = st.multiselect("Cities (all if empty):", history.cities())
+            export_pollutants = st.multiselect("Pollutants (all if empty):", ["pm2.5", "pm10", "no2", "o3"])
+            export_range = st.date_input("Date range:", (first_seen.date(), last_seen.date()))
+        with export_cols[1]:
+            export_columns = st.multiselect("Columns:", EXPORT_COLUMNS, EXPORT_COLUMNS)
+            export_format = st.selectbox("Format:", ["csv", "parquet"] if parquet_available() else ["csv"])
+            export_compression = st.selectbox("Compression:", list(CSV_COMPRESSION) if export_format == "csv" else PARQUET_COMPRESSION)
+
+        job = st.session_state.get("export_job")
+        running = job is not None and not job.done
+        if st.button("📦 Start Export", disabled=running or not export_columns):
+            export_range = tuple(export_range) if isinstance(export_range, (tuple, list)) else (export_range,)
+            job = st.session_state.export_job = ExportJob(
+                history, export_format, export_compression,
+                cities=export_cities, pollutants=export_pollutants, columns=export_columns,
+                start=pd.Timestamp(export_range[0]) if export_range else None,
+                end=pd.Timestamp(export_range[-1]) + pd.Timedelta(days=1) if export_range else None)
+            running = True
+
+        if job is not None:
+            if job.error is not None:
+                st.error(f"Export failed: {job.error}")
+            elif running:
+                st.progress(job.fraction, text=f"Exporting {job.rows:,} / {job.total:,} rows in the background...")
+                st.button("🔄 Check Progress")
+            else:
+                size = os.path.getsize(job.path)
+                st.success(f"Exported {job.rows:,} rows to `{job.path}` ({size / MB:.1f} MB)")
+                if size <= MAX_DOWNLOAD_MB * MB:
+                    with open(job.path, "rb") as f:
+                        st.download_button("⬇️ Download Export", f, file_name=os.path.basename(job.path))
+                else:
+                    st.info(f"Too large to download through the browser (> {MAX_DOWNLOAD_MB} MB) - copy it from the server.")
+
 # Emergency Contacts
 with st.expander("🚨 Emergency & Health Contacts", expanded=False):
     emergency_cols = st.columns(2)
@@ -1131,6 +1160,44 @@ with st.expander("💡 Air Quality Improvement Tips", expanded=False):
         st.write("🧹 Regular cleaning")
         st.write("🚭 No smoking indoors")
 
+# Cache & Memory
+with st.expander("🧠 Cache & Memory Usage", expanded=False):
+    report = cache_report()
+    if not report.empty:
+        report["size_mb"] = (report["bytes"] / MB).round(2)
+        report["budget_mb"] = (report["max_bytes"] / MB).round(2)
+        st.dataframe(report[["cache", "entries", "max_entries", "size_mb", "budget_mb",
+                             "hits", "misses", "evictions", "expirations", "oversize"]],
+                     hide_index=True, use_container_width=True)
+    store = get_reading_store()
+    forecaster = get_forecaster()
+    st.caption(f"Reading store: {store.n_slots} series, {store.nbytes() / MB:.1f} MB | "
+               f"Forecast states: {len(forecaster)} (evicted {forecaster.evictions})")
+    registry = get_station_registry()
+    st.caption(f"Station registry: {len(registry)} stations in {len(registry.coverage)} areas, "
+               f"{registry.upstream_fetches} upstream fetches this process")
+    spike_counts = get_spike_detector().counts
+    st.caption("Spike detector: " + ", ".join(f"{n} {k.replace('_', ' ')}" for k, n in spike_counts.items()))
+    hedges = hedge_stats()
+    openaq_p95 = hedges["latency"].get("openaq", {}).get("p95")
+    st.caption(f"Hedged source fetches: {hedges['calls']} calls, {hedges['hedged']} hedged to Open-Meteo, "
+               f"{hedges['alternate_won']} answered by it | OpenAQ p95 "
+               + (f"{openaq_p95:.2f}s" if openaq_p95 is not None else "n/a"))
+    shared = shared_cache.stats()
+    st.caption(f"Shared upstream cache ({shared['backend']}): {shared['hits']} hits, "
+               f"{shared['misses']} misses, {shared['sets']} stored, {shared['errors']} errors")
+    flights = coalesce_stats()
+    st.caption(f"Coalesced fetches: {flights['leaders']} upstream calls, {flights['shared']} joined one already in flight")
+    limits = rate_limit_stats()
+    if limits:
+        st.caption("Rate limit queues: " + " | ".join(
+            f"{s['host']} {s['requests']} requests, {s['rejected']} rejected, wait avg {s['avg_wait']:.2f}s "
+            f"max {s['max_wait']:.2f}s, {s['queued']} queued" for s in limits))
+    breakers = breaker_states()
+    if breakers:
+        st.caption("Circuit breakers: " + " | ".join(
+            f"{b['host']} {b['state']} ({b['failures']} failures, {b['short_circuited']} short-circuited)" for b in breakers))
+
 # -----------------------------
 # Stakeholder Section
 # -----------------------------
@@ -0,0 +1,236 @@
+import argparse
+import os
+import time
+from concurrent import futures
+import numpy as np
+import pandas as pd
+from airguard_history import HistoryStore
+from airguard_synthetic import CITY_CENTERS, haversine_m
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet archives are optional, CSV always works
+    pq = None
+
+
+# -----------------------------
+# Archive backfill
+# -----------------------------
+# Loads OpenAQ-style archive files (CSV, gzipped CSV, Parquet; one row per
+# measurement) from a directory into the persisted history, so trends and
+# exports have data on a fresh deploy without refetching it through the API.
+#   python airguard_backfill.py /data/openaq/india --workers 8
+# Files are parsed in worker processes, each streaming its file in bounded
+# chunks into distinct measurements (location, pollutant, timestamp); the
+# parent is the only SQLite writer. OpenAQ archives hold one file per station
+# per day, so a city-hour is spread over many files: each file's measurements
+# replace whatever that file contributed before, in the same transaction that
+# records the file (with its size and mtime) as imported, and the hourly means
+# are published into the history at the end, counting a measurement once even
+# when overlapping archives both carry it. Re-running skips unchanged files, so
+# an interrupted load simply resumes, and a changed file is re-read rather than
+# added twice. Rows from live fetches are never overwritten.
+# Stations are filed under the nearest known city within CITY_RADIUS_M - the
+# same name the dashboard records a searched city under - or, further out,
+# under their own name; --city puts everything under one name.
+CHUNK_ROWS = 250_000
+CITY_RADIUS_M = 50000   # the dashboard's nearby-stations radius
+ARCHIVE_SUFFIXES = (".csv", ".csv.gz", ".parquet")
+ARCHIVE_SOURCE = "openaq-archive"
+MEASUREMENT_COLUMNS = ["location", "city", "pollutant", "time", "value", "lat", "lon"]
+MEASUREMENT_KEY = ["location", "pollutant", "time"]   # the same reading in two archives counts once
+
+# Canonical column -> names seen in OpenAQ exports (S3 archive, v2/v3 downloads)
+COLUMN_ALIASES = {
+    "location": ["location", "location_name", "locationname", "location_id", "locationid", "locations_id"],
+    "datetime": ["datetime", "datetime_utc", "date.utc", "date_utc", "utc", "timestamp"],
+    "lat": ["lat", "latitude", "coordinates.latitude"],
+    "lon": ["lon", "lng", "longitude", "coordinates.longitude"],
+    "parameter": ["parameter", "pollutant"],
+    "value": ["value"],
+    "unit": ["unit", "units"],
+}
+PARAMETER_NAMES = {"pm25": "pm2.5", "pm2.5": "pm2.5", "pm10": "pm10", "no2": "no2", "o3": "o3"}
+# Gas mixing ratios -> µg/m³ at 25 °C, the unit every AQI breakpoint is in
+UNIT_FACTORS = {("no2", "ppm"): 1880.0, ("no2", "ppb"): 1.88, ("o3", "ppm"): 1960.0, ("o3", "ppb"): 1.96}
+
+
+def archive_files(directory):
+    paths = []
+    for root, _, names in os.walk(directory):
+        paths.extend(os.path.join(root, n) for n in names if n.lower().endswith(ARCHIVE_SUFFIXES))
+    return sorted(paths)
+
+
+def read_chunks(path, chunk_rows=CHUNK_ROWS):
+    if path.lower().endswith(".parquet"):
+        if pq is None:
+            raise RuntimeError("Parquet archives need pyarrow - install it or convert them to CSV")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_rows, compression="infer", low_memory=False)
+
+
+def _offset_minutes(suffix):
+    # "", "Z", ".000Z", "+05:30", "-0400" -> minutes east of UTC; None if unparseable
+    suffix = suffix.lstrip(".0123456789")
+    if suffix in ("", "Z", "z"):
+        return 0
+    sign = {"+": 1, "-": -1}.get(suffix[:1])
+    digits = suffix[1:].replace(":", "")
+    if sign is None or len(digits) not in (2, 4) or not digits.isdigit():
+        return None
+    return sign * (int(digits[:2]) * 60 + int(digits[2:] or 0))
+
+
+def utc_seconds(times):
+    # ISO-8601 strings -> seconds since epoch, UTC (NaN where unparseable). A file repeats a
+    # handful of UTC offsets, so each distinct suffix is parsed once rather than per row.
+    s = times.astype(str)
+    local = pd.to_datetime(s.str[:19], errors="coerce", format="ISO8601")
+    offsets = {suffix: _offset_minutes(suffix) for suffix in s.str[19:].unique()}
+    minutes = s.str[19:].map(offsets).astype(float)
+    utc = local - pd.to_timedelta(minutes, unit="m")
+    seconds = utc.to_numpy().astype("datetime64[s]").astype(np.int64).astype(float)
+    seconds[utc.isna().to_numpy()] = np.nan
+    return seconds
+
+
+def station_cities(location, lat, lon, cities=CITY_CENTERS, radius=CITY_RADIUS_M):
+    # Per row: nearest city within radius, else the station's own name. Computed once per station.
+    frame = pd.DataFrame({"location": location.astype(str), "lat": lat, "lon": lon})
+    stations = frame.drop_duplicates("location")
+    names = stations["location"].to_numpy(dtype=object)
+    if cities:
+        s_lat, s_lon = stations["lat"].to_numpy(dtype=float), stations["lon"].to_numpy(dtype=float)
+        dist = np.stack([haversine_m(c_lat, c_lon, s_lat, s_lon) for _, c_lat, c_lon in cities])
+        nearest = np.nan_to_num(dist, nan=np.inf).argmin(axis=0)
+        near = np.nan_to_num(dist[nearest, np.arange(len(names))], nan=np.inf) <= radius
+        names = np.where(near, np.array([c[0] for c in cities], dtype=object)[nearest], names)
+    return frame["location"].map(dict(zip(stations["location"], names))).to_numpy(dtype=object)
+
+
+def normalize(chunk, city=None):
+    # Raw archive rows -> location, city, pollutant, time (epoch seconds), value (µg/m³), lat, lon;
+    # unusable rows dropped. Without a location column the coordinates identify the station.
+    lower = {c.lower(): c for c in chunk.columns}
+    cols = {}
+    for name, aliases in COLUMN_ALIASES.items():
+        found = next((lower[a] for a in aliases if a in lower), None)
+        if found is not None:
+            cols[name] = chunk[found]
+    missing = [c for c in ("datetime", "parameter", "value") if c not in cols]
+    if missing or (city is None and "location" not in cols):
+        raise ValueError(f"archive has no {', '.join(missing or ['location'])} column")
+
+    pollutant = cols["parameter"].astype(str).str.lower().map(PARAMETER_NAMES)
+    value = pd.to_numeric(cols["value"], errors="coerce")
+    if "unit" in cols:
+        unit = cols["unit"].astype(str).str.lower()
+        for (p, u), factor in UNIT_FACTORS.items():
+            value = value.where(~((pollutant == p) & (unit == u)), value * factor)
+    seconds = utc_seconds(cols["datetime"])
+    keep = pollutant.notna() & value.notna() & (value >= 0) & ~np.isnan(seconds)
+    if not keep.any():
+        return pd.DataFrame(columns=MEASUREMENT_COLUMNS)
+    lat = pd.to_numeric(cols["lat"][keep], errors="coerce").to_numpy() if "lat" in cols else np.full(int(keep.sum()), np.nan)
+    lon = pd.to_numeric(cols["lon"][keep], errors="coerce").to_numpy() if "lon" in cols else np.full(int(keep.sum()), np.nan)
+    if "location" in cols:
+        location = cols["location"][keep].astype(str)
+    else:
+        location = pd.Series(np.round(lat, 4)).astype(str) + "," + pd.Series(np.round(lon, 4)).astype(str)
+    return pd.DataFrame({
+        "location": location.to_numpy(dtype=object),
+        "city": city if city is not None else station_cities(location, lat, lon),
+        "pollutant": pollutant[keep].to_numpy(),
+        "time": seconds[keep.to_numpy()].astype(np.int64),
+        "value": value[keep].to_numpy(dtype=float),
+        "lat": lat,
+        "lon": lon,
+    })
+
+
+def parse_archive(path, city=None, chunk_rows=CHUNK_ROWS):
+    # One archive file -> (its distinct measurements, raw rows read). Runs in a worker
+    # process; each chunk is normalized and deduplicated before the next one is read.
+    parts, rows = [], 0
+    for chunk in read_chunks(path, chunk_rows):
+        rows += len(chunk)
+        df = normalize(chunk, city)
+        if not df.empty:
+            parts.append(df.drop_duplicates(MEASUREMENT_KEY))
+    if not parts:
+        return pd.DataFrame(columns=MEASUREMENT_COLUMNS), rows
+    return pd.concat(parts, ignore_index=True).drop_duplicates(MEASUREMENT_KEY), rows
+
+
+def backfill(directory, history=None, workers=None, city=None, chunk_rows=CHUNK_ROWS, progress=None):
+    # Imports every archive file under directory that is not already in the ledger.
+    # progress(done_files, total_files, path) is called after each file is committed.
+    history = history if history is not None else HistoryStore()
+    workers = workers or os.cpu_count() or 1
+    ledger = history.backfilled()
+    todo, skipped = [], 0
+    for path in archive_files(directory):
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        if ledger.get(key) == (stat.st_size, stat.st_mtime):
+            skipped += 1
+        else:
+            todo.append((key, stat.st_size, stat.st_mtime))
+
+    summary = {"files": len(todo), "skipped": skipped, "failed": 0, "rows_read": 0, "measurements": 0, "written": 0}
+    errors = []
+    pending = {}
+    queue = iter(todo)
+    with futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        def submit():
+            # Keep a bounded number of parsed files waiting for the writer
+            for entry in queue:
+                pending[pool.submit(parse_archive, entry[0], city, chunk_rows)] = entry
+                if len(pending) >= 2 * workers:
+                    break
+        submit()
+        done_files = 0
+        while pending:
+            finished, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            for future in finished:
+                path, size, mtime = pending.pop(future)
+                try:
+                    df, rows = future.result()
+                except Exception as e:
+                    summary["failed"] += 1
+                    errors.append((path, str(e)))
+                    continue
+                summary["rows_read"] += rows
+                summary["measurements"] += len(df)
+                history.add_archive_measurements(df, ledger=(path, size, mtime))
+                done_files += 1
+                if progress:
+                    progress(done_files, len(todo), path)
+            submit()
+    summary["written"] = history.publish_archive(ARCHIVE_SOURCE)
+    summary["errors"] = errors
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill AirGuard history from OpenAQ archive files")
+    parser.add_argument("directory", help="folder with .csv, .csv.gz or .parquet archives (searched recursively)")
+    parser.add_argument("--workers", type=int, default=None, help="parser processes (default: one per core)")
+    parser.add_argument("--city", help="store every reading under this name instead of the nearest known city")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+
+    start = time.monotonic()
+
+    def report(done, total, path):
+        print(f"[{done}/{total}] {os.path.basename(path)} ({time.monotonic() - start:.0f}s)")
+
+    result = backfill(args.directory, workers=args.workers, city=args.city, chunk_rows=args.chunk_rows, progress=report)
+    print(f"{result['files'] - result['failed']} files imported, {result['skipped']} already done, {result['failed']} failed: "
+          f"{result['rows_read']:,} rows -> {result['measurements']:,} measurements, {result['written']:,} history rows written "
+          f"in {time.monotonic() - start:.1f}s")
+    for path, error in result["errors"]:
+        print(f"  failed {path}: {error}")
@@ -0,0 +1,127 @@
+import functools
+import pickle
+import threading
+import time
+from collections import OrderedDict
+import pandas as pd
+
+
+# -----------------------------
+# Bounded LRU caches
+# -----------------------------
+# Drop-in for st.cache_data(ttl=...) with hard limits: every cache has a TTL,
+# a maximum number of entries and a byte budget, and evicts least recently
+# used entries when either limit is hit. Values are stored pickled (like
+# st.cache_data), so each caller gets its own copy and the byte count is exact.
+MB = 1024 * 1024
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 16 * MB
+
+
+class BoundedCache:
+    def __init__(self, name, ttl=None, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.oversize = 0
+        self._data = OrderedDict()  # key -> (expires_at, pickled value)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] is not None and entry[0] <= time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._data.move_to_end(key)
+            self.hits += 1
+            payload = entry[1]
+        return True, pickle.loads(payload)
+
+    def set(self, key, value):
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if self.max_bytes is not None and len(payload) > self.max_bytes:
+            self.oversize += 1
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (expires_at, payload)
+            self.bytes += len(payload)
+            while self._data and (
+                    (self.max_entries is not None and len(self._data) > self.max_entries)
+                    or (self.max_bytes is not None and self.bytes > self.max_bytes)):
+                self._drop(next(iter(self._data)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        _, payload = self._data.pop(key)
+        self.bytes -= len(payload)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"cache": self.name, "entries": len(self._data), "bytes": self.bytes,
+                    "max_entries": self.max_entries, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "expirations": self.expirations, "oversize": self.oversize}
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def register_cache(cache):
+    with _caches_lock:
+        _caches[cache.name] = cache
+    return cache
+
+
+def bounded_cache(ttl=None, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES, name=None):
+    def decorator(fn):
+        cache = register_cache(BoundedCache(name or fn.__qualname__, ttl, max_entries, max_bytes))
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            found, value = cache.get(key)
+            if found:
+                return value
+            value = fn(*args, **kwargs)
+            cache.set(key, value)
+            return value
+        wrapper.cache = cache
+        wrapper.clear = cache.clear
+        return wrapper
+    return decorator
+
+
+def clear_caches():
+    with _caches_lock:
+        caches = list(_caches.values())
+    for cache in caches:
+        cache.clear()
+
+
+def cache_report():
+    with _caches_lock:
+        caches = list(_caches.values())
+    return pd.DataFrame([c.stats() for c in caches])
@@ -0,0 +1,82 @@
+import os
+import numpy as np
+import plotly.graph_objects as go
+
+
+# -----------------------------
+# Chart data reduction
+# -----------------------------
+# Every time-series chart goes through reduce_series before it reaches plotly,
+# so the payload sent to the browser is bounded by CHART_POINTS whatever range
+# is selected. The line is downsampled with Largest-Triangle-Three-Buckets,
+# which keeps the points that carry the visual shape; each bucket also reports
+# the min and max of everything it dropped, drawn as a shaded envelope so a
+# one-hour peak in a year-long range is still visible.
+CHART_POINTS = int(os.environ.get("AIRGUARD_CHART_POINTS", 400))
+ANIMATION_FRAMES = 40   # animated charts replay the reduced line in this many steps
+
+
+def _bucket_edges(n, n_out):
+    # Interior points 1..n-2 split into n_out - 2 contiguous, non-empty buckets
+    return np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+
+
+def lttb(x, y, n_out):
+    # Indices of the n_out points of (x, y) that keep the line's shape; x ascending, no NaNs
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float) - float(x[0])
+    y = np.asarray(y, dtype=float)
+    edges = _bucket_edges(n, n_out)
+    # Each bucket's partner is the mean of the next bucket, so those can be computed up front
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts
+    mean_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts
+    next_x = np.r_[mean_x[1:], x[-1]]
+    next_y = np.r_[mean_y[1:], y[-1]]
+
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - next_x[i]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y[i] - y[a]))
+        a = lo + int(np.argmax(area))
+        idx[i + 1] = a
+    return idx
+
+
+def reduce_series(df, x="datetime", y="value", points=CHART_POINTS):
+    # df sorted by x -> at most `points` rows of it, plus {y}_min / {y}_max: the range of
+    # the original values each kept row stands for (equal to y where nothing was dropped)
+    df = df[df[y].notna()]
+    values = df[y].to_numpy(dtype=float)
+    n = len(df)
+    if n <= points or points < 3:
+        return df.assign(**{f"{y}_min": values, f"{y}_max": values}).reset_index(drop=True)
+    xs = df[x].to_numpy()
+    xs = xs.astype("datetime64[ns]").astype(np.int64) if np.issubdtype(xs.dtype, np.datetime64) else xs
+    idx = lttb(xs, values, points)
+    starts = _bucket_edges(n, points)[:-1]
+    low = np.r_[values[0], np.minimum.reduceat(values[1:n - 1], starts - 1), values[-1]]
+    high = np.r_[values[0], np.maximum.reduceat(values[1:n - 1], starts - 1), values[-1]]
+    return df.iloc[idx].assign(**{f"{y}_min": low, f"{y}_max": high}).reset_index(drop=True)
+
+
+def add_envelope(fig, reduced, x="datetime", y="value", color="rgba(128,128,128,0.25)", name="range"):
+    # Shaded min/max band behind a reduced line; nothing is drawn if no points were dropped
+    if (reduced[f"{y}_min"] == reduced[f"{y}_max"]).all():
+        return fig
+    fig.add_trace(go.Scatter(x=reduced[x], y=reduced[f"{y}_max"], mode="lines", line=dict(width=0),
+                             hoverinfo="skip", showlegend=False))
+    fig.add_trace(go.Scatter(x=reduced[x], y=reduced[f"{y}_min"], mode="lines", line=dict(width=0),
+                             fill="tonexty", fillcolor=color, name=name, hoverinfo="skip", showlegend=False))
+    # The band goes under the line it belongs to
+    fig.data = fig.data[-2:] + fig.data[:-2]
+    return fig
+
+
+def frame_ends(n, frames=ANIMATION_FRAMES):
+    # Prefix lengths for an animation that reveals n points in at most `frames` steps
+    return np.unique(np.linspace(1, n, min(n, frames)).round().astype(np.int64)) if n else np.array([], dtype=np.int64)
@@ -0,0 +1,460 @@
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from airguard_alerts import AlertEngine, SubscriptionStore
+from airguard_cache import MB, BoundedCache, bounded_cache, register_cache
+from airguard_forecast import BiasForecaster, to_utc_naive, utc_now
+from airguard_fusion import (SOURCE_TOLERANCE_HOURS, fuse_readings, latest_values as fused_latest_values,
+                             source_series)
+from airguard_history import HistoryStore
+from airguard_spikes import SpikeDetector
+from airguard_stations import StationRegistry
+from airguard_store import ReadingStore
+from airguard_synthetic import KM_PER_DEGREE, SyntheticNetwork
+from airguard_upstream import BACKGROUND, coalesce, hedged, json_loads, upstream_get
+
+
+# -----------------------------
+# Data layer shared by the dashboard and the JSON API
+# -----------------------------
+# Fetching, fusion and AQI maths with no Streamlit in it, so airguard_app.py
+# and airguard_api.py serve the same numbers from the same caches.
+# OpenAQ API keys - using fallback system
+OPENAQ_API_KEYS = [None]  # Works without keys for most endpoints
+
+# OpenAQ v3 parameter ids (µg/m³ variants) and how old a "latest" reading may be
+OPENAQ_PARAMETER_IDS = {"pm10": 1, "pm2.5": 2, "o3": 3, "no2": 5}
+OPENAQ_MAX_AGE_HOURS = 24
+
+# Forecast horizon requested from Open-Meteo (observed history is always the past day)
+FORECAST_DAYS = 3
+
+# Open-Meteo variables fetched together for a point: every pollutant in one air-quality
+# request and the weather in one forecast request, issued side by side
+METEO_AQ_PARAMS = {"pm2.5": "pm2_5", "pm10": "pm10", "no2": "nitrogen_dioxide", "o3": "ozone"}
+WEATHER_PARAMS = {"temperature_2m": "temperature", "relative_humidity_2m": "humidity",
+                  "wind_speed_10m": "wind_speed", "precipitation": "precipitation", "weather_code": "weather_code"}
+# Hourly model series are kept per location. Each time the bundle cache expires (10 min) only a
+# trailing window is requested - the last METEO_RECENT_HOURS hours, the next few, and any hours
+# past the newest stored one - and merged in, so the hours the cards show stay current; a full
+# re-fetch picks up revised later forecast hours once per model-run interval
+METEO_PAST_DAYS = 1
+METEO_RECENT_HOURS = 6
+METEO_FULL_REFRESH_SECONDS = 6 * 3600
+# WMO weather interpretation codes -> the conditions the weather hints know about
+WEATHER_CONDITIONS = [((0, 1), "Clear"), ((2, 3), "Cloudy"), ((45, 48), "Foggy"), ((51, 67), "Rainy"),
+                      ((71, 77), "Snowy"), ((80, 82), "Rainy"), ((85, 86), "Snowy"), ((95, 99), "Stormy")]
+
+# "live" talks to the real upstreams, "synthetic" serves everything from the
+# deterministic test network (for scale/load testing without any network)
+DATA_SOURCE = os.environ.get("AIRGUARD_DATA_SOURCE", "live")
+SYNTHETIC_STATIONS = int(os.environ.get("AIRGUARD_SYNTHETIC_STATIONS", 10000))
+FALLBACK_STATIONS = 3
+NEARBY_STATIONS = 50  # map markers per location, for live and synthetic alike
+# Per pollutant, ask Open-Meteo only when OpenAQ is slower than usual (0 = always ask both, in turn)
+HEDGED_SOURCES = os.environ.get("AIRGUARD_HEDGED_SOURCES", "1") != "0"
+
+# -----------------------------
+# Fetching, fusion and AQI helpers
+# -----------------------------
+@coalesce
+@bounded_cache(ttl=3600, max_entries=4, max_bytes=64 * 1024)
+def get_user_location():
+    try:
+        resp = upstream_get("https://ipinfo.io/json", timeout=5).json()
+        city = resp.get("city", "Delhi")
+        loc = resp.get("loc", "28.6139,77.2090").split(",")
+        return city, float(loc[0]), float(loc[1])
+    except:
+        return "Delhi", 28.6139, 77.2090
+
+@coalesce
+@bounded_cache(ttl=3600, max_entries=1024, max_bytes=1 * MB)
+def get_coordinates(city_name):
+    url = f"https://nominatim.openstreetmap.org/search?q={city_name}&format=json&limit=1"
+    resp = upstream_get(url, headers={"User-Agent": "AirGuardApp"}, timeout=5, cache_ttl=3600)
+    if resp.status_code != 200 or len(resp.json()) == 0:
+        return None, None
+    data = resp.json()[0]
+    return float(data["lat"]), float(data["lon"])
+
+@coalesce
+@bounded_cache(ttl=3600, max_entries=1024, max_bytes=4 * MB)
+def search_places(query):
+    # Nominatim allows ~1 req/s for everyone - every session shares the same cached answers
+    url = f"https://nominatim.openstreetmap.org/search?q={query}&format=json&limit=5"
+    resp = upstream_get(url, headers={"User-Agent": "VayuMitra"}, timeout=5, cache_ttl=3600)
+    resp.raise_for_status()
+    return resp.json()
+
+@functools.lru_cache(maxsize=None)
+def get_synthetic_network():
+    return SyntheticNetwork(n_stations=SYNTHETIC_STATIONS)
+
+def openaq_headers():
+    key = next((k for k in OPENAQ_API_KEYS if k), None)
+    return {"X-API-Key": key} if key else {}
+
+def parse_openaq_latest(content, max_age_hours=OPENAQ_MAX_AGE_HOURS):
+    # Column arrays straight from the decoded payload - no per-row dicts or DataFrame rows
+    payload = json_loads(content) if isinstance(content, (bytes, str)) else content
+    results = payload.get("results") or []
+    n = len(results)
+    location_id = np.fromiter((r["locationsId"] for r in results), dtype=np.int64, count=n)
+    value = np.fromiter((r["value"] for r in results), dtype=float, count=n)
+    when = np.array([r["datetime"]["utc"][:19] for r in results], dtype="datetime64[s]")
+    coords = [r.get("coordinates") or {} for r in results]
+    lat = np.fromiter((c.get("latitude", np.nan) for c in coords), dtype=float, count=n)
+    lon = np.fromiter((c.get("longitude", np.nan) for c in coords), dtype=float, count=n)
+
+    # Dead sensors keep reporting their last value forever, and negative values are error codes
+    cutoff = np.datetime64(utc_now().to_datetime64(), "s") - np.timedelta64(max_age_hours, "h")
+    keep = (when >= cutoff) & (value >= 0)
+    order = np.argsort(when[keep])[::-1]
+    return pd.DataFrame({
+        "location_id": location_id[keep][order],
+        "value": value[keep][order],
+        "datetime": when[keep][order].astype("datetime64[ns]"),
+        "lat": lat[keep][order],
+        "lon": lon[keep][order],
+    })
+
+@functools.lru_cache(maxsize=None)
+def get_reading_store():
+    # Every measurement this process has seen, as per-station ring buffers
+    store = ReadingStore()
+    register_cache(store.queries)
+    get_spike_detector().attach(store)
+    return store
+
+@functools.lru_cache(maxsize=None)
+def get_spike_detector():
+    # Rolling per-station statistics over every reading the store ingests
+    return SpikeDetector()
+
+@functools.lru_cache(maxsize=None)
+def get_history():
+    # Persisted hourly history behind the bulk export
+    return HistoryStore()
+
+@coalesce
+def fetch_openaq(lat, lon, parameter, radius=50000, limit=100):
+    # Latest reading per sensor near the point, newest first. Cached as a list of
+    # store slots rather than a pinned DataFrame per coordinate.
+    store = get_reading_store()
+    key = (lat, lon, parameter, radius, limit)
+    slots = store.recall(key)
+    if slots is not None:
+        return store.latest(slots)
+
+    df = None
+    if DATA_SOURCE == "synthetic":
+        df = get_synthetic_network().latest(lat, lon, parameter, radius=radius, limit=limit)
+    else:
+        parameter_id = OPENAQ_PARAMETER_IDS.get(parameter, 2)
+        url = f"https://api.openaq.org/v3/parameters/{parameter_id}/latest?coordinates={lat},{lon}&radius={radius}&limit={limit}"
+        try:
+            resp = upstream_get(url, headers=openaq_headers(), timeout=5, cache_ttl=600)
+            if resp.status_code == 200:
+                df = parse_openaq_latest(resp.content)
+        except Exception:
+            pass
+    if df is not None and not df.empty:
+        store.remember(key, store.ingest("openaq", parameter, df))
+        return store.latest(store.recall(key))
+    
+    # Generate realistic fallback data - deterministic for the same location across processes
+    network = SyntheticNetwork.around(lat, lon, n_stations=FALLBACK_STATIONS)
+    df = network.latest(lat, lon, parameter, limit=min(limit, FALLBACK_STATIONS))
+    df.attrs["fallback"] = True  # never fit the forecast against made-up readings
+    return df
+
+_meteo_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="airguard-meteo")
+meteo_series = register_cache(BoundedCache("meteo_series", ttl=METEO_FULL_REFRESH_SECONDS,
+                                           max_entries=512, max_bytes=32 * MB))  # key -> (full fetch time, frame)
+
+def _fetch_meteo_hourly(url, variables):
+    # Open-Meteo hourly block as datetime + one column per variable (GMT timestamps)
+    try:
+        resp = upstream_get(url, timeout=10, cache_ttl=600)
+        if resp.status_code == 200:
+            hourly = json_loads(resp.content).get("hourly") or {}
+            if "time" in hourly:
+                df = pd.DataFrame({"datetime": pd.to_datetime(hourly["time"])})
+                for name, column in variables.items():
+                    df[column] = pd.to_numeric(pd.Series(hourly.get(name, [None] * len(df))), errors="coerce")
+                return df
+    except Exception:
+        pass
+    return pd.DataFrame(columns=["datetime"] + list(variables.values()))
+
+def fetch_region_latest(bbox, parameter, page_size=1000, max_pages=20):
+    # Latest reading of every station inside (south, west, north, east) - for background jobs
+    # like the tile builder, so it queues behind interactive requests. Raises if any page
+    # fails rather than returning part of the region.
+    south, west, north, east = bbox
+    if DATA_SOURCE == "synthetic":
+        network = get_synthetic_network()
+        inside = np.flatnonzero((network.lat >= south) & (network.lat <= north) & (network.lon >= west) & (network.lon <= east))
+        now = pd.Timestamp(utc_now()).floor("h")
+        return pd.DataFrame({"lat": network.lat[inside], "lon": network.lon[inside],
+                             "value": network.values(inside, [now], parameter)[:, 0].astype(float)})
+    parameter_id = OPENAQ_PARAMETER_IDS.get(parameter, 2)
+    frames = []
+    for page in range(1, max_pages + 1):
+        url = (f"https://api.openaq.org/v3/parameters/{parameter_id}/latest"
+               f"?bbox={west},{south},{east},{north}&limit={page_size}&page={page}")
+        resp = upstream_get(url, headers=openaq_headers(), timeout=30, priority=BACKGROUND, cache_ttl=600)
+        if resp.status_code != 200:
+            raise RuntimeError(f"OpenAQ latest {parameter} page {page} returned {resp.status_code}")
+        payload = json_loads(resp.content)
+        frames.append(parse_openaq_latest(payload))
+        if len(payload.get("results") or []) < page_size:
+            break
+    if not frames:
+        return pd.DataFrame(columns=["lat", "lon", "value"])
+    df = pd.concat(frames, ignore_index=True).drop_duplicates("location_id")
+    return df[["lat", "lon", "value"]].dropna()
+
+@coalesce
+@bounded_cache(ttl=600, max_entries=512, max_bytes=16 * MB)
+def fetch_meteo_bundle(lat, lon, forecast_days=FORECAST_DAYS):
+    # Every pollutant plus the weather for a point on one hourly index, cached as one entry,
+    # so the AQI cards, forecast and weather panel all read the same hours
+    if DATA_SOURCE == "synthetic":
+        network = get_synthetic_network()
+        df = None
+        for p in METEO_AQ_PARAMS:
+            series = network.model_series(lat, lon, p, forecast_days=forecast_days).rename(columns={"value": p})
+            df = series if df is None else df.merge(series, on="datetime", how="outer")
+        for column in WEATHER_PARAMS.values():
+            df[column] = np.nan  # the synthetic network has no weather
+        return df
+    # Same window a past_days/forecast_days request returns: whole GMT days
+    today = utc_now().normalize()
+    first = today - pd.Timedelta(days=METEO_PAST_DAYS)
+    last = today + pd.Timedelta(days=forecast_days) - pd.Timedelta(hours=1)
+    key = (lat, lon, forecast_days)
+    found, entry = meteo_series.get(key)
+    if found and time.time() - entry[0] < METEO_FULL_REFRESH_SECONDS and not entry[1].empty:
+        fetched_at, series = entry
+        now_hour = utc_now().floor("h")
+        start = max(now_hour - pd.Timedelta(hours=METEO_RECENT_HOURS), first)
+        # New hours past the newest stored one (GMT day rollover), else just the hours around now
+        end = last if series["datetime"].max() < last else min(now_hour + pd.Timedelta(hours=METEO_RECENT_HOURS), last)
+        window = f"start_hour={start:%Y-%m-%dT%H:%M}&end_hour={end:%Y-%m-%dT%H:%M}"
+        aq, wx = _fetch_meteo_window(lat, lon, window)
+        # Half a delta would leave holes nobody re-requests - keep what we have instead
+        if not aq.empty and not wx.empty:
+            series = pd.concat([series, aq.merge(wx, on="datetime", how="outer")], ignore_index=True)
+        series = series[(series["datetime"] >= first) & (series["datetime"] <= last)].drop_duplicates("datetime", keep="last")
+        series = series.sort_values("datetime", ignore_index=True)
+        meteo_series.set(key, (fetched_at, series))
+        return series
+
+    aq, wx = _fetch_meteo_window(lat, lon, f"past_days={METEO_PAST_DAYS}&forecast_days={forecast_days}")
+    series = aq.merge(wx, on="datetime", how="outer").sort_values("datetime", ignore_index=True)
+    if not aq.empty and not wx.empty:
+        meteo_series.set(key, (time.time(), series))
+    return series
+
+def _fetch_meteo_window(lat, lon, window):
+    # Air quality and weather for the same hours, side by side
+    aq_url = (f"https://air-quality-api.open-meteo.com/v1/air-quality?latitude={lat}&longitude={lon}&{window}"
+              f"&hourly={','.join(METEO_AQ_PARAMS.values())}")
+    wx_url = (f"https://api.open-meteo.com/v1/forecast?latitude={lat}&longitude={lon}&{window}"
+              f"&hourly={','.join(WEATHER_PARAMS)}&wind_speed_unit=kmh")
+    aq = _meteo_pool.submit(_fetch_meteo_hourly, aq_url, {v: k for k, v in METEO_AQ_PARAMS.items()})
+    wx = _meteo_pool.submit(_fetch_meteo_hourly, wx_url, WEATHER_PARAMS)
+    return aq.result(), wx.result()
+
+def fetch_meteo_aq(lat, lon, parameter, forecast_days=FORECAST_DAYS):
+    bundle = fetch_meteo_bundle(lat, lon, forecast_days)
+    if parameter not in bundle:
+        return pd.DataFrame()
+    df = bundle[["datetime", parameter]].rename(columns={parameter: "value"})
+    # Filter out null values
+    return df.dropna(subset=["value"]).reset_index(drop=True)
+
+def weather_condition(code):
+    if code is None or np.isnan(code):
+        return None
+    return next((name for (low, high), name in WEATHER_CONDITIONS if low <= code <= high), "Cloudy")
+
+def current_weather(lat, lon, now=None):
+    # Weather at the same hour the AQI cards show (latest hour at or before now), or None
+    bundle = fetch_meteo_bundle(lat, lon)
+    now = now if now is not None else utc_now()
+    past = bundle[bundle["datetime"] <= now.round("h")].dropna(subset=["temperature", "wind_speed"], how="all")
+    if past.empty:
+        return None
+    row = past.iloc[-1]
+    weather = {column: (float(row[column]) if pd.notna(row[column]) else None) for column in WEATHER_PARAMS.values()}
+    weather["conditions"] = weather_condition(weather["weather_code"])
+    weather["datetime"] = row["datetime"]
+    return weather
+
+def normalize_meteo_value(value, pollutant="pm2.5"):
+    limits = {"pm2.5":10,"pm10":20,"no2":10,"o3":20}
+    return max(value, limits.get(pollutant,10))
+
+AQI_BREAKPOINTS = {
+    "pm2.5":[(0,30,0,50),(31,60,51,100),(61,90,101,200),(91,120,201,300),(121,250,301,400),(251,500,401,500)],
+    "pm10":[(0,50,0,50),(51,100,51,100),(101,250,101,200),(251,350,201,300),(351,430,301,400),(431,1000,401,500)],
+    "no2":[(0,40,0,50),(41,80,51,100),(81,180,101,200),(181,280,201,300),(281,400,301,400),(401,1000,401,500)],
+    "o3":[(0,50,0,50),(51,100,51,100),(101,168,101,200),(169,208,201,300),(209,748,301,400),(749,1000,401,500)]
+}
+
+# AQI band -> label and colour; the dashboard chart and the JSON API both name AQI values from here
+AQI_BANDS = [(0,50,"Good","green"),(51,100,"Moderate","yellow"),
+             (101,200,"Unhealthy (SG)","orange"),(201,300,"Unhealthy","red"),
+             (301,400,"Very Unhealthy","purple"),(401,500,"Hazardous","maroon")]
+
+def calculate_aqi(pollutant,c):
+    if c is None:  # no reading (e.g. its fetch missed the page deadline)
+        return None
+    for low, high, a_low, a_high in AQI_BREAKPOINTS.get(pollutant,[]):
+        if low <= c <= high:
+            return round((a_high-a_low)/(high-low)*(c-low)+a_low)
+    return None
+
+def calculate_aqi_array(pollutant, values):
+    # calculate_aqi over a whole array at once; NaN wherever the scalar version returns None
+    values = np.asarray(values, dtype=float)
+    out = np.full(values.shape, np.nan)
+    for low, high, a_low, a_high in AQI_BREAKPOINTS.get(pollutant, []):
+        band = (values >= low) & (values <= high) & np.isnan(out)
+        out[band] = np.round((a_high - a_low) / (high - low) * (values[band] - low) + a_low)
+    return out
+
+def latest_aqi(lat, lon, pollutants=tuple(METEO_AQ_PARAMS)):
+    # {pollutant: AQI or None} for the newest fused reading at a point
+    values = fused_latest_values(fuse_location(lat, lon, tuple(pollutants)), list(pollutants))
+    return {p: calculate_aqi(p, v) if v is not None else None for p, v in values.items()}
+
+def get_aqi_color(aqi):
+    if aqi is None: return "gray"
+    if aqi<=50: return "green"
+    elif aqi<=100: return "yellow"
+    elif aqi<=200: return "orange"
+    elif aqi<=300: return "red"
+    elif aqi<=400: return "purple"
+    else: return "maroon"
+
+def aqi_category(aqi):
+    if aqi is None:
+        return None
+    return next((label for _, high, label, _ in AQI_BANDS if aqi <= high), AQI_BANDS[-1][2])
+
+@functools.lru_cache(maxsize=None)
+def get_station_registry():
+    # Station metadata, long-lived and snapshotted to disk; measurements are cached separately
+    return StationRegistry()
+
+@functools.lru_cache(maxsize=None)
+def get_forecaster():
+    # One model state per server process, shared by every session
+    return BiasForecaster()
+
+@functools.lru_cache(maxsize=None)
+def get_alert_store():
+    return SubscriptionStore()
+
+@functools.lru_cache(maxsize=None)
+def get_alert_engine():
+    # Every active subscription as NumPy columns, reloaded when they change
+    return AlertEngine(get_alert_store())
+
+def openaq_readings(lat, lon, p):
+    df_g = fetch_openaq(lat, lon, p)
+    source = "fallback" if df_g.attrs.get("fallback") else "openaq"
+    return df_g.reindex(columns=["datetime", "value"]).assign(pollutant=p, source=source)
+
+def meteo_readings(lat, lon, p):
+    df_m = fetch_meteo_aq(lat, lon, p)
+    if not df_m.empty:
+        df_m = df_m.assign(value=df_m["value"].apply(lambda x: normalize_meteo_value(x, p)))
+    return df_m.reindex(columns=["datetime", "value"]).assign(pollutant=p, source="open-meteo")
+
+def has_real_readings(df, now=None):
+    # An answer is a real (not made-up fallback) reading that fusion would still show as the
+    # current hour: at or before now, and no older than its source's carry-forward tolerance
+    if df is None or df.empty:
+        return False
+    real = df[df["source"] != "fallback"]
+    if real.empty:
+        return False
+    now_hour = (now if now is not None else utc_now()).round("h")
+    hours = to_utc_naive(real["datetime"]).dt.round("h").to_numpy()
+    tolerance = pd.to_timedelta(real["source"].map(SOURCE_TOLERANCE_HOURS).fillna(0).to_numpy(), unit="h")
+    return bool(((hours <= now_hour) & (hours >= now_hour - tolerance)).any())
+
+@coalesce
+def pollutant_readings(lat, lon, p):
+    # Every source's series for one pollutant that answered in time, in the long format
+    # fuse_readings takes. Hedged: OpenAQ is asked first and Open-Meteo only once OpenAQ runs
+    # past its usual p95, and the first real readings win - fusion still ranks OpenAQ above
+    # Open-Meteo when both are in. Not cached here: both sources cache on their own, and a
+    # reading that lost the race should show up on the next render, not after a TTL.
+    if HEDGED_SOURCES:
+        frames = list(hedged(("openaq", openaq_readings, lat, lon, p), ("open-meteo", meteo_readings, lat, lon, p),
+                             valid=has_real_readings).values())
+    else:
+        frames = [openaq_readings(lat, lon, p), meteo_readings(lat, lon, p)]
+    frames = [f for f in frames if not f.empty]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["datetime", "value", "pollutant", "source"])
+
+def fuse_location(lat, lon, pollutants):
+    # One hourly frame with every pollutant from every source - cards, alerts,
+    # forecast, comparison and the report all read from this
+    return fuse_readings(pd.concat([pollutant_readings(lat, lon, p) for p in pollutants], ignore_index=True),
+                         list(pollutants))
+
+def build_forecast(fused, lat, lon, pollutant):
+    df_m = source_series(fused, pollutant, "open-meteo")
+    if df_m.empty:
+        # A hedged fetch may have settled on OpenAQ alone - the model series is still needed here
+        df_m = meteo_readings(lat, lon, pollutant)[["datetime", "value"]]
+    df_g = source_series(fused, pollutant, "openaq")
+    forecaster = get_forecaster()
+    key = (round(lat, 2), round(lon, 2), pollutant)
+    forecaster.update(key, df_m, df_g)
+    df = forecaster.forecast(key, df_m, df_g)
+    df["forecast"] = df["value"].apply(lambda x: calculate_aqi(pollutant, x))
+    return df.dropna(subset=["forecast"])
+
+def fetch_station_locations(lat, lon, radius):
+    # Station metadata around a point from OpenAQ (the circle's bounding box, so the
+    # radius is not capped by the API), or None when the upstream failed
+    try:
+        dlat = radius / (KM_PER_DEGREE * 1000)
+        dlon = dlat / max(np.cos(np.radians(lat)), 1e-6)
+        bbox = f"{lon - dlon:.4f},{lat - dlat:.4f},{lon + dlon:.4f},{lat + dlat:.4f}"
+        url = f"https://api.openaq.org/v3/locations?bbox={bbox}&limit=1000"
+        resp = upstream_get(url, headers=openaq_headers(), timeout=5)
+        if resp.status_code != 200:
+            return None
+        stations = [{"location_id": item["id"], "lat": item["coordinates"]["latitude"],
+                     "lon": item["coordinates"]["longitude"], "station": item.get("name") or str(item["id"])}
+                    for item in json_loads(resp.content).get("results", []) if item.get("coordinates")]
+        return pd.DataFrame(stations, columns=["location_id", "lat", "lon", "station"])
+    except Exception:
+        return None
+
+@coalesce
+def fetch_nearby_stations(lat, lon, radius=50000):
+    if DATA_SOURCE == "synthetic":
+        return get_synthetic_network().nearby(lat, lon, radius, limit=NEARBY_STATIONS)[["lat", "lon", "station", "location_id"]]
+    try:
+        stations = get_station_registry().nearby(lat, lon, radius, fetch=fetch_station_locations, limit=NEARBY_STATIONS)
+        if not stations.empty:
+            return stations[["lat", "lon", "station", "location_id"]]
+    except Exception:
+        pass
+
+    # Generate fallback stations around the location
+    network = SyntheticNetwork.around(lat, lon, n_stations=FALLBACK_STATIONS)
+    return network.nearby(lat, lon, radius)[["lat", "lon", "station", "location_id"]]
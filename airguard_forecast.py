@@ -0,0 +1,130 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+
+# -----------------------------
+# Bias-corrected AQI forecast
+# -----------------------------
+# Open-Meteo gives us the hourly model horizon, OpenAQ gives us what was
+# actually measured. We keep an exponentially smoothed bias (observed - model)
+# per location/pollutant and only fold in observations newer than the last
+# fit, so a refresh is a few array ops instead of a refit from scratch.
+SMOOTHING_ALPHA = 0.3
+BIAS_HALF_LIFE_HOURS = 12
+MAX_FORECAST_KEYS = 4096  # least recently updated locations are forgotten first
+
+
+def to_utc_naive(values):
+    # Open-Meteo returns naive GMT, OpenAQ returns aware UTC - treat naive as UTC
+    return pd.to_datetime(pd.Series(values), utc=True).dt.tz_localize(None)
+
+
+def utc_now():
+    return pd.Timestamp.now(tz="UTC").tz_localize(None)
+
+
+def _hourly_means(df):
+    # Collapse raw readings (possibly several stations per hour) to one value per hour
+    hours = to_utc_naive(df["datetime"]).values.astype("datetime64[h]")
+    values = df["value"].to_numpy(dtype=float)
+    keep = ~np.isnan(values)
+    hours, values = hours[keep], values[keep]
+    uniq, inverse = np.unique(hours, return_inverse=True)
+    sums = np.bincount(inverse, weights=values, minlength=len(uniq))
+    counts = np.bincount(inverse, minlength=len(uniq))
+    return uniq, sums / np.maximum(counts, 1)
+
+
+def _match_hours(model_hours, hours):
+    # Index of each hour in the (sorted) model series, -1 when the model has no such hour
+    idx = np.searchsorted(model_hours, hours)
+    idx = np.clip(idx, 0, max(len(model_hours) - 1, 0))
+    found = len(model_hours) > 0
+    matched = (model_hours[idx] == hours) if found else np.zeros(len(hours), dtype=bool)
+    return np.where(matched, idx, -1)
+
+
+class BiasForecaster:
+    def __init__(self, alpha=SMOOTHING_ALPHA, half_life=BIAS_HALF_LIFE_HOURS, max_keys=MAX_FORECAST_KEYS):
+        self.alpha = alpha
+        self.half_life = half_life
+        self.max_keys = max_keys
+        self.evictions = 0
+        self._state = OrderedDict()  # key -> (bias, last observation time, observations folded)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._state)
+
+    def bias(self, key):
+        return self._state.get(key, (0.0, None, 0))[0]
+
+    def update(self, key, model_df, obs_df):
+        if model_df is None or obs_df is None or model_df.empty or obs_df.empty:
+            return self.bias(key)
+        with self._lock:
+            bias, last_seen, folded = self._state.get(key, (0.0, None, 0))
+            obs_times = to_utc_naive(obs_df["datetime"])
+            fresh = obs_df[(obs_times > last_seen).to_numpy()] if last_seen is not None else obs_df
+            if fresh.empty:
+                return bias
+
+            model_hours = to_utc_naive(model_df["datetime"]).values.astype("datetime64[h]")
+            order = np.argsort(model_hours)
+            model_hours = model_hours[order]
+            model_values = model_df["value"].to_numpy(dtype=float)[order]
+
+            obs_hours, obs_values = _hourly_means(fresh)
+            idx = _match_hours(model_hours, obs_hours)
+            residuals = obs_values[idx >= 0] - model_values[idx[idx >= 0]]
+            residuals = residuals[~np.isnan(residuals)]
+
+            # Closed form of n sequential EWMA steps: b_n = (1-a)^n b_0 + sum a(1-a)^(n-1-i) r_i
+            n = len(residuals)
+            if n:
+                decay = 1.0 - self.alpha
+                weights = self.alpha * decay ** np.arange(n - 1, -1, -1)
+                bias = decay ** n * bias + float(weights @ residuals)
+
+            self._state[key] = (bias, obs_times.max(), folded + n)
+            self._state.move_to_end(key)
+            while len(self._state) > self.max_keys:
+                self._state.popitem(last=False)
+                self.evictions += 1
+            return bias
+
+    def forecast(self, key, model_df, obs_df=None, now=None):
+        columns = ["datetime", "value", "kind"]
+        now = now if now is not None else utc_now()
+
+        if model_df is not None and not model_df.empty:
+            out = pd.DataFrame({
+                "datetime": to_utc_naive(model_df["datetime"]).values,
+                "value": model_df["value"].to_numpy(dtype=float),
+            }).sort_values("datetime", ignore_index=True)
+            lead_hours = ((out["datetime"] - now) / pd.Timedelta("1h")).to_numpy()
+            # The bias we learnt from recent hours fades out further into the horizon
+            weight = np.power(0.5, np.clip(lead_hours, 0, None) / self.half_life)
+            out["value"] = np.clip(out["value"].to_numpy() + self.bias(key) * weight, 0, None)
+            out["kind"] = np.where(lead_hours > 0, "forecast", "history")
+
+            if obs_df is not None and not obs_df.empty:
+                # Past hours show what was measured wherever we have it
+                obs_hours, obs_values = _hourly_means(obs_df)
+                model_hours = out["datetime"].values.astype("datetime64[h]")
+                idx = _match_hours(obs_hours, model_hours)
+                observed = (idx >= 0) & (lead_hours <= 0)
+                out.loc[observed, "value"] = obs_values[idx[observed]]
+                out.loc[observed, "kind"] = "observed"
+            return out[columns]
+
+        if obs_df is not None and not obs_df.empty:
+            obs_hours, obs_values = _hourly_means(obs_df)
+            return pd.DataFrame({
+                "datetime": obs_hours.astype("datetime64[ns]"),
+                "value": obs_values,
+                "kind": "observed",
+            })
+        return pd.DataFrame(columns=columns)
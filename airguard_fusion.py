@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+from airguard_forecast import to_utc_naive, utc_now
+
+
+# -----------------------------
+# Multi-pollutant, multi-source fusion
+# -----------------------------
+# Every reading from every source goes into one long frame
+# (datetime, pollutant, source, value). We round timestamps onto a shared
+# hourly index, pivot everything in one go, let each source carry its last
+# value forward for up to its tolerance, and then pick the first available
+# source per hour/pollutant in priority order.
+SOURCE_PRIORITY = ["openaq", "open-meteo", "fallback"]
+SOURCE_TOLERANCE_HOURS = {"openaq": 1, "open-meteo": 0, "fallback": 1}
+FIELDS = ["value", "source"]
+
+
+def empty_fused(pollutants, priority=SOURCE_PRIORITY):
+    columns = pd.MultiIndex.from_product([pollutants, list(priority) + FIELDS])
+    return pd.DataFrame(index=pd.DatetimeIndex([], name="datetime"), columns=columns)
+
+
+def fuse_readings(readings, pollutants, priority=SOURCE_PRIORITY, tolerance=SOURCE_TOLERANCE_HOURS):
+    priority = list(priority)
+    df = readings.dropna(subset=["value"])
+    df = df[df["pollutant"].isin(pollutants) & df["source"].isin(priority)]
+    if df.empty:
+        return empty_fused(pollutants, priority)
+
+    hours = to_utc_naive(df["datetime"]).dt.round("h").values
+    index = pd.date_range(hours.min(), hours.max(), freq="h", name="datetime")
+    raw = (df.assign(datetime=hours)
+             .pivot_table(index="datetime", columns=["pollutant", "source"], values="value", aggfunc="mean")
+             .reindex(index=index, columns=pd.MultiIndex.from_product([pollutants, priority])))
+
+    # Tolerance: a source may stand in for the following hours it did not report
+    filled = raw.copy()
+    for src in priority:
+        limit = tolerance.get(src, 0)
+        if limit:
+            cols = [(p, src) for p in pollutants]
+            filled[cols] = filled[cols].ffill(limit=limit)
+
+    # hours x pollutants x sources, sources in priority order
+    stack = filled.to_numpy(dtype=float).reshape(len(index), len(pollutants), len(priority))
+    valid = ~np.isnan(stack)
+    first = valid.argmax(axis=2)
+    has_value = valid.any(axis=2)
+    value = np.take_along_axis(stack, first[..., None], axis=2)[..., 0]
+    value[~has_value] = np.nan
+    source = np.array(priority, dtype=object)[first]
+    source[~has_value] = None
+
+    fused = {}
+    for j, p in enumerate(pollutants):
+        for src in priority:
+            fused[(p, src)] = raw[(p, src)].to_numpy()
+        fused[(p, "value")] = value[:, j]
+        fused[(p, "source")] = source[:, j]
+    return pd.DataFrame(fused, index=index)
+
+
+def latest_readings(fused, pollutants, now=None):
+    # Most recent fused (datetime, value, source) at or before now - the horizon beyond is forecast, not a reading
+    now = now if now is not None else utc_now()
+    past = fused[fused.index <= now.round("h")]
+    latest = {}
+    for p in pollutants:
+        if p not in fused.columns.get_level_values(0):
+            latest[p] = None
+            continue
+        col = past[(p, "value")].dropna()
+        latest[p] = (col.index[-1], float(col.iloc[-1]), past.loc[col.index[-1], (p, "source")]) if not col.empty else None
+    return latest
+
+
+def latest_values(fused, pollutants, now=None):
+    return {p: r[1] if r else None for p, r in latest_readings(fused, pollutants, now).items()}
+
+
+def source_series(fused, pollutant, source):
+    # One source's hourly readings as a (datetime, value) frame, e.g. for the forecaster
+    if (pollutant, source) not in fused.columns:
+        return pd.DataFrame(columns=["datetime", "value"])
+    col = fused[(pollutant, source)].dropna()
+    return pd.DataFrame({"datetime": col.index, "value": col.to_numpy(dtype=float)})
@@ -0,0 +1,317 @@
+import bz2
+import gzip
+import lzma
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+import pandas as pd
+from airguard_forecast import utc_now
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional, CSV always works
+    pa = None
+    pq = None
+
+
+# -----------------------------
+# Persisted hourly history
+# -----------------------------
+# Every fused hourly value the app shows is appended to a small SQLite file
+# (one row per city, pollutant and hour), so history outlives the 10-minute
+# caches and the in-memory rings. Exports read it back with a single ordered
+# query and stream it out chunk by chunk - memory stays at one chunk no matter
+# how many locations or months are selected.
+HISTORY_DB = os.environ.get("AIRGUARD_HISTORY_DB", "airguard_history.sqlite")
+EXPORT_DIR = os.environ.get("AIRGUARD_EXPORT_DIR", "exports")
+EXPORT_CHUNK_ROWS = 100_000
+REWRITE_HOURS = 2  # recent hours get rewritten - late readings can still change them
+EXPORT_COLUMNS = ["city", "lat", "lon", "pollutant", "datetime", "value", "source"]
+CSV_COMPRESSION = {"none": (open, ""), "gzip": (gzip.open, ".gz"), "bz2": (bz2.open, ".bz2"), "xz": (lzma.open, ".xz")}
+PARQUET_COMPRESSION = ["snappy", "zstd", "gzip", "none"]
+PARQUET_TYPES = {"city": "string", "lat": "float64", "lon": "float64", "pollutant": "string",
+                 "datetime": "timestamp[ns]", "value": "float64", "source": "string"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    city TEXT NOT NULL,
+    pollutant TEXT NOT NULL,
+    hour INTEGER NOT NULL,          -- hours since epoch, UTC
+    value REAL NOT NULL,
+    source TEXT,
+    lat REAL,
+    lon REAL,
+    PRIMARY KEY (city, pollutant, hour)
+) WITHOUT ROWID
+"""
+# Archive files already loaded by the backfill importer, so an interrupted run resumes
+LEDGER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS backfill_files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    rows INTEGER NOT NULL,
+    imported REAL NOT NULL
+)
+"""
+# Every archive measurement imported so far, per file - one station-day file is only part
+# of a city-hour, so means are published over all files, and a re-imported file replaces
+# exactly its own rows. Overlapping files may hold the same measurement; it counts once.
+MEASUREMENTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS backfill_measurements (
+    location TEXT NOT NULL,
+    pollutant TEXT NOT NULL,
+    time INTEGER NOT NULL,          -- seconds since epoch, UTC
+    path TEXT NOT NULL,
+    city TEXT NOT NULL,
+    value REAL NOT NULL,
+    lat REAL,
+    lon REAL,
+    PRIMARY KEY (location, pollutant, time, path)
+) WITHOUT ROWID
+"""
+MEASUREMENTS_INDEX = "CREATE INDEX IF NOT EXISTS backfill_measurements_path ON backfill_measurements (path)"
+
+
+def parquet_available():
+    return pq is not None
+
+
+def to_hours(times):
+    t = pd.to_datetime(pd.Series(times), utc=True).dt.tz_localize(None)
+    return t.values.astype("datetime64[h]").astype(np.int64)
+
+
+def from_hours(hours):
+    return np.asarray(hours, dtype=np.int64).astype("datetime64[h]").astype("datetime64[ns]")
+
+
+class HistoryStore:
+    def __init__(self, path=HISTORY_DB):
+        self.path = path
+        self._local = threading.local()
+        self._written = {}  # city -> newest hour already written by this process
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(SCHEMA)
+            conn.execute(LEDGER_SCHEMA)
+            conn.execute(MEASUREMENTS_SCHEMA)
+            conn.execute(MEASUREMENTS_INDEX)
+            self._local.conn = conn
+        return conn
+
+    def record(self, city, lat, lon, fused, now=None):
+        # Past hours of a fused frame (see airguard_fusion) - the forecast horizon is not history
+        if fused.empty:
+            return 0
+        now = now if now is not None else utc_now()
+        past = fused[fused.index <= now.floor("h")]
+        if past.empty:
+            return 0
+        hours = past.index.values.astype("datetime64[h]").astype(np.int64)
+        with self._lock:
+            newest = self._written.get(city)
+        if newest is not None:
+            keep = hours > newest - REWRITE_HOURS
+            past, hours = past[keep], hours[keep]
+
+        rows = []
+        for p in past.columns.get_level_values(0).unique():
+            values = past[(p, "value")].to_numpy(dtype=float)
+            sources = past[(p, "source")].to_numpy()
+            ok = ~np.isnan(values) & (sources != "fallback")   # made-up stations are never history
+            rows.extend(zip([city] * int(ok.sum()), [p] * int(ok.sum()), hours[ok].tolist(),
+                            values[ok].tolist(), sources[ok].tolist(),
+                            [float(lat)] * int(ok.sum()), [float(lon)] * int(ok.sum())))
+        if rows:
+            conn = self._connect()
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO readings (city, pollutant, hour, value, source, lat, lon) "
+                                 "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        if len(hours):
+            with self._lock:
+                self._written[city] = max(self._written.get(city, hours.max()), int(hours.max()))
+        return len(rows)
+
+    def append(self, df, replace=True):
+        # Bulk insert of an already-long frame: city, pollutant, datetime, value (+ source, lat, lon).
+        # replace=False keeps rows already stored. Returns the number of rows actually written.
+        n = len(df)
+        conn = self._connect()
+        with conn:
+            before = conn.total_changes
+            if n:
+                cols = [df["city"].astype(str).tolist(), df["pollutant"].astype(str).tolist(),
+                        to_hours(df["datetime"]).tolist(), df["value"].astype(float).tolist()]
+                for name, default in (("source", None), ("lat", None), ("lon", None)):
+                    cols.append(df[name].tolist() if name in df else [default] * n)
+                conn.executemany(f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO readings "
+                                 "(city, pollutant, hour, value, source, lat, lon) VALUES (?, ?, ?, ?, ?, ?, ?)", zip(*cols))
+            written = conn.total_changes - before
+        return written
+
+    def add_archive_measurements(self, df, ledger):
+        # df: location, city, pollutant, time, value, lat, lon - one archive file's distinct
+        # measurements. They replace that file's earlier import (it may have been re-downloaded
+        # or corrected) in the same transaction that records the file as imported.
+        path, size, mtime = ledger
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM backfill_measurements WHERE path = ?", (path,))
+            conn.executemany(
+                "INSERT OR REPLACE INTO backfill_measurements (location, pollutant, time, path, city, value, lat, lon) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                zip(df["location"].astype(str).tolist(), df["pollutant"].astype(str).tolist(),
+                    df["time"].astype(np.int64).tolist(), [path] * len(df), df["city"].astype(str).tolist(),
+                    df["value"].astype(float).tolist(), df["lat"].tolist(), df["lon"].tolist()))
+            conn.execute("INSERT OR REPLACE INTO backfill_files (path, size, mtime, rows, imported) VALUES (?, ?, ?, ?, ?)",
+                         (path, int(size), float(mtime), len(df), time.time()))
+
+    def publish_archive(self, source):
+        # Hourly archive means into the history, each distinct (location, pollutant, time)
+        # counted once however many files carry it. Rows from live fetches are kept as they
+        # are; rows this source wrote before are updated, so files added later still count.
+        conn = self._connect()
+        with conn:
+            before = conn.total_changes
+            conn.execute(
+                "INSERT INTO readings (city, pollutant, hour, value, source, lat, lon) "
+                "SELECT city, pollutant, time / 3600 AS hour, avg(value), ?, min(lat), min(lon) FROM ("
+                "    SELECT city, pollutant, time, value, lat, lon FROM backfill_measurements "
+                "    GROUP BY location, pollutant, time) "
+                "WHERE true GROUP BY city, pollutant, hour "
+                "ON CONFLICT (city, pollutant, hour) DO UPDATE SET value = excluded.value, "
+                "lat = excluded.lat, lon = excluded.lon WHERE readings.source = excluded.source "
+                "AND readings.value IS NOT excluded.value", (source,))
+            return conn.total_changes - before
+
+    def backfilled(self):
+        # path -> (size, mtime) of every archive file already imported
+        return {path: (size, mtime) for path, size, mtime in
+                self._connect().execute("SELECT path, size, mtime FROM backfill_files")}
+
+    def cities(self):
+        return [r[0] for r in self._connect().execute("SELECT DISTINCT city FROM readings ORDER BY city")]
+
+    def span(self):
+        lo, hi = self._connect().execute("SELECT MIN(hour), MAX(hour) FROM readings").fetchone()
+        if lo is None:
+            return None, None
+        return pd.Timestamp(from_hours([lo])[0]), pd.Timestamp(from_hours([hi])[0])
+
+    def _select(self, cities, pollutants, start, end):
+        where, params = [], []
+        if cities:
+            where.append(f"city IN ({','.join('?' * len(cities))})")
+            params.extend(cities)
+        if pollutants:
+            where.append(f"pollutant IN ({','.join('?' * len(pollutants))})")
+            params.extend(pollutants)
+        if start is not None:
+            where.append("hour >= ?")
+            params.append(int(to_hours([start])[0]))
+        if end is not None:
+            where.append("hour < ?")
+            params.append(int(to_hours([end])[0]))
+        sql = "SELECT city, lat, lon, pollutant, hour, value, source FROM readings"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        return sql + " ORDER BY city, pollutant, hour", params
+
+    def count(self, cities=None, pollutants=None, start=None, end=None):
+        sql, params = self._select(cities, pollutants, start, end)
+        return self._connect().execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+
+    def chunks(self, cities=None, pollutants=None, start=None, end=None, columns=EXPORT_COLUMNS,
+               chunk_rows=EXPORT_CHUNK_ROWS):
+        # Yields DataFrames of at most chunk_rows rows, in (city, pollutant, datetime) order
+        sql, params = self._select(cities, pollutants, start, end)
+        cursor = self._connect().execute(sql, params)
+        names = [d[0] for d in cursor.description]
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            df = pd.DataFrame.from_records(rows, columns=names)
+            df["datetime"] = from_hours(df.pop("hour").to_numpy())
+            yield df[list(columns)]
+
+
+def export_history(history, path, fmt="csv", compression="none", progress=None, **query):
+    # Streams history.chunks(**query) into path; returns the number of rows written
+    written = 0
+    if fmt == "csv":
+        opener, _ = CSV_COMPRESSION[compression]
+        with opener(path, "wt", newline="", encoding="utf-8") as f:
+            for df in history.chunks(**query):
+                df.to_csv(f, header=written == 0, index=False, date_format="%Y-%m-%dT%H:%M:%SZ")
+                written += len(df)
+                if progress:
+                    progress(written)
+    elif fmt == "parquet":
+        if pq is None:
+            raise RuntimeError("Parquet export needs pyarrow - install it or export CSV")
+        columns = query.get("columns", EXPORT_COLUMNS)
+        # Fixed schema - a chunk whose source column is all NULL must not decide the type
+        schema = pa.schema([(c, pa.type_for_alias(PARQUET_TYPES[c])) for c in columns])
+        with pq.ParquetWriter(path, schema, compression=None if compression == "none" else compression) as writer:
+            for df in history.chunks(**query):
+                writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+                written += len(df)
+                if progress:
+                    progress(written)
+    else:
+        raise ValueError(f"unknown export format: {fmt}")
+    return written
+
+
+def export_filename(fmt, compression, now=None):
+    now = now or pd.Timestamp.now()
+    if fmt == "csv":
+        return f"airguard_history_{now:%Y%m%d_%H%M%S}.csv{CSV_COMPRESSION[compression][1]}"
+    return f"airguard_history_{now:%Y%m%d_%H%M%S}.parquet"
+
+
+class ExportJob:
+    # Runs one export in a background thread so the page stays responsive
+    def __init__(self, history, fmt="csv", compression="none", export_dir=EXPORT_DIR, **query):
+        os.makedirs(export_dir, exist_ok=True)
+        self.path = os.path.join(export_dir, export_filename(fmt, compression))
+        self.fmt = fmt
+        self.total = history.count(**{k: v for k, v in query.items() if k in ("cities", "pollutants", "start", "end")})
+        self.rows = 0
+        self.error = None
+        self.started = time.monotonic()
+        self.finished = None
+        self._thread = threading.Thread(target=self._run, args=(history, fmt, compression, query),
+                                        name="airguard-export", daemon=True)
+        self._thread.start()
+
+    def _run(self, history, fmt, compression, query):
+        try:
+            export_history(history, self.path, fmt, compression, progress=self._progress, **query)
+        except Exception as e:
+            self.error = e
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        finally:
+            self.finished = time.monotonic()
+
+    def _progress(self, rows):
+        self.rows = rows
+
+    @property
+    def done(self):
+        return self.finished is not None
+
+    @property
+    def fraction(self):
+        return min(self.rows / self.total, 1.0) if self.total else 1.0
@@ -0,0 +1,301 @@
+import argparse
+import contextlib
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+
+# -----------------------------
+# Concurrent-session load test
+# -----------------------------
+# Drives N simulated users through airguard_app.py at once, each its own
+# Streamlit AppTest session in this process (so they share every cache, pool,
+# breaker and rate limiter exactly like sessions on one server do), and reports
+# rerun latency percentiles per interaction, throughput and memory over time.
+#   python airguard_loadtest.py --sessions 16 --duration 120
+# Nothing leaves the machine: measurements come from the synthetic network
+# (AIRGUARD_DATA_SOURCE=synthetic) and the remaining upstreams - geolocation,
+# Nominatim, Pushover - are answered by a stub transport with injected latency.
+# Databases, snapshots and tiles go to a throwaway directory.
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "airguard_app.py")
+RERUN_TIMEOUT = 120
+
+# Interaction -> relative weight after a session's first page load
+ACTIONS = {"rerun": 3, "pollutant": 4, "map_click": 3, "search": 2, "refresh": 1}
+POLLUTANTS = ["pm2.5", "pm10", "no2", "o3"]
+
+
+def _prepare_environment(workdir):
+    # Must run before anything imports airguard_data - it reads these at import time
+    os.environ.setdefault("AIRGUARD_DATA_SOURCE", "synthetic")
+    os.environ.setdefault("AIRGUARD_SHARED_CACHE", f"sqlite:///{os.path.join(workdir, 'shared_cache.sqlite')}")
+    os.environ.setdefault("AIRGUARD_HISTORY_DB", os.path.join(workdir, "history.sqlite"))
+    os.environ.setdefault("AIRGUARD_ALERTS_DB", os.path.join(workdir, "alerts.sqlite"))
+    # Always private, even if the shell sets it: the rate-limit buckets are shared host-wide,
+    # and stub traffic must neither spend a real server's budget nor queue behind its calls
+    os.environ["AIRGUARD_RATELIMIT_DB"] = os.path.join(workdir, "ratelimit.sqlite")
+    os.environ.setdefault("AIRGUARD_STATION_SNAPSHOT", os.path.join(workdir, "stations.npz"))
+    os.environ.setdefault("AIRGUARD_TILE_DIR", os.path.join(workdir, "tiles"))
+
+
+# -----------------------------
+# Stub upstreams
+# -----------------------------
+class StubTransport:
+    # Stands in for requests.request under airguard_upstream, so breaker, rate
+    # limiter, coalescing and caches all run as in production
+    def __init__(self, latency_ms=150, seed=0):
+        from airguard_synthetic import CITY_CENTERS
+        self.cities = CITY_CENTERS
+        self.latency = latency_ms / 1000
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _sleep(self):
+        if self.latency:
+            with self._lock:
+                delay = self._rng.lognormvariate(np.log(self.latency), 0.5)
+            time.sleep(delay)
+
+    def __call__(self, method, url, **kwargs):
+        import requests
+        from urllib.parse import parse_qs, urlsplit
+        from airguard_upstream import json_dumps
+
+        with self._lock:
+            self.calls += 1
+        self._sleep()
+        parts = urlsplit(url)
+        query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        status, payload = 404, {"error": "not stubbed"}
+        if parts.netloc == "ipinfo.io":
+            name, lat, lon = self.cities[0]
+            status, payload = 200, {"city": name, "loc": f"{lat},{lon}"}
+        elif parts.netloc == "nominatim.openstreetmap.org":
+            q = query.get("q", "").lower()
+            status, payload = 200, [{"display_name": f"{name}, India", "lat": str(lat), "lon": str(lon)}
+                                    for name, lat, lon in self.cities if q and q in name.lower()][:int(query.get("limit", 5))]
+        elif parts.netloc == "api.pushover.net":
+            status, payload = 200, {"status": 1}
+
+        resp = requests.Response()
+        resp.status_code = status
+        resp._content = json_dumps(payload)
+        resp.headers["Content-Type"] = "application/json"
+        resp.url = url
+        resp.encoding = "utf-8"
+        return resp
+
+
+# -----------------------------
+# Simulated sessions
+# -----------------------------
+_shared_components = None
+
+
+def _allow_concurrent_sessions():
+    # AppTest is built for one test at a time: each run installs its own mock Runtime
+    # and flips the global appTest option, undoes both when it ends (under any run
+    # still going) and compiles the script again. Give every session one mock Runtime,
+    # one compiled script and one component registry, as sessions of a real server share them.
+    # The script is compiled up front: concurrent ast.parse calls can fail on Python 3.11.
+    global _shared_components
+    from streamlit import config
+    from streamlit.testing.v1 import app_test
+
+    runtime = app_test.MagicMock(spec=app_test.Runtime)
+    runtime.media_file_mgr = app_test.MediaFileManager(app_test.MemoryMediaFileStorage("/mock/media"))
+    runtime.dataframe_source_mgr = app_test.DataframeSourceManager()
+    runtime.cache_storage_manager = app_test.MemoryCacheStorageManager()
+    _shared_components = app_test.BidiComponentManager()
+    _shared_components.discover_and_register_components(start_file_watching=False)
+    runtime.bidi_component_registry = _shared_components
+    app_test.Runtime.instance = classmethod(lambda cls: runtime)
+    app_test.Runtime.exists = classmethod(lambda cls: True)
+
+    config.set_option("global.appTest", True)
+    app_test.patch_config_options = lambda options: contextlib.nullcontext()
+    script_cache = app_test.ScriptCache()
+    script_cache.get_bytecode(APP_PATH)
+    app_test.ScriptCache = lambda: script_cache
+
+
+def rss_mb():
+    # Current resident set size; peak RSS where /proc is not available
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+class Session:
+    def __init__(self, sid, stub, think, seed):
+        from airguard_synthetic import CITY_CENTERS
+        self.sid = sid
+        self.stub = stub
+        self.think = think
+        self.cities = CITY_CENTERS
+        self.rng = random.Random(seed)
+        self.at = None
+        self.records = []
+
+    def _button(self, label=None, key=None):
+        for b in self.at.button:
+            if (key is not None and b.key == key) or (label is not None and b.label == label):
+                return b
+        return None
+
+    def _run(self, action):
+        start = time.perf_counter()
+        error = None
+        try:
+            self.at.run(timeout=RERUN_TIMEOUT)
+            if len(self.at.exception):
+                error = self.at.exception[0].message
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        self.records.append({"session": self.sid, "action": action, "start": start,
+                             "latency": time.perf_counter() - start, "error": error})
+
+    def step(self, action):
+        if action == "load":
+            from streamlit.testing.v1 import AppTest
+            self.at = AppTest.from_file(APP_PATH, default_timeout=RERUN_TIMEOUT)
+            self.at._bidi_component_manager = _shared_components
+        elif action == "pollutant":
+            button = self._button(key=f"btn_{self.rng.choice(POLLUTANTS)}")
+            if button is not None:
+                button.click()
+        elif action == "map_click":
+            lat, lon = self.at.session_state["lat"], self.at.session_state["lon"]
+            self.at.session_state["main_map"] = {
+                "last_clicked": {"lat": lat + self.rng.uniform(-0.2, 0.2), "lng": lon + self.rng.uniform(-0.2, 0.2)},
+                "zoom": 10}
+        elif action == "search":
+            # Typing the name is one rerun, picking the result another
+            name = self.rng.choice(self.cities)[0]
+            self.at.text_input[0].input(name)
+            self._run("search")
+            button = self._button(label="📍 Use This Location")
+            if button is None:
+                return
+            button.click()
+            action = "search_select"
+        elif action == "refresh":
+            button = self._button(label="🔄 Refresh Data")
+            if button is not None:
+                button.click()
+        self._run(action)
+
+    def loop(self, deadline):
+        self.step("load")
+        actions, weights = list(ACTIONS), list(ACTIONS.values())
+        while time.perf_counter() < deadline:
+            if self.think:
+                time.sleep(self.rng.expovariate(1 / self.think))
+            if time.perf_counter() >= deadline:
+                break
+            self.step(self.rng.choices(actions, weights)[0])
+
+
+def run_load_test(sessions=8, duration=60, think=1.0, latency_ms=150, sample_every=1.0, ramp=0.0, seed=0):
+    import airguard_upstream
+    from airguard_cache import cache_report
+
+    stub = StubTransport(latency_ms, seed)
+    airguard_upstream.requests.request = stub
+    _allow_concurrent_sessions()
+    workers = [Session(i, stub, think, seed * 1000 + i) for i in range(sessions)]
+    t0 = time.perf_counter()
+    deadline = t0 + duration
+
+    memory = []
+    done = threading.Event()
+
+    def sample():
+        while True:
+            report = cache_report()
+            memory.append({"t": time.perf_counter() - t0, "rss_mb": rss_mb(),
+                           "cache_mb": float(report["bytes"].sum()) / 2 ** 20 if not report.empty else 0.0,
+                           "reruns": sum(len(w.records) for w in workers),
+                           "threads": threading.active_count()})
+            if done.wait(sample_every):
+                return
+
+    sampler = threading.Thread(target=sample, name="loadtest-memory", daemon=True)
+    sampler.start()
+    threads = []
+    for i, w in enumerate(workers):
+        threads.append(threading.Thread(target=w.loop, args=(deadline,), name=f"loadtest-session-{i}", daemon=True))
+        threads[-1].start()
+        if ramp:
+            time.sleep(ramp / sessions)
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    done.set()
+    sampler.join()
+
+    records = pd.DataFrame([r for w in workers for r in w.records],
+                           columns=["session", "action", "start", "latency", "error"])
+    records["start"] -= t0
+    return records, pd.DataFrame(memory), {"wall": wall, "upstream_calls": stub.calls}
+
+
+def summarize(records):
+    # p50/p95/p99 rerun latency per interaction and overall, in milliseconds
+    def row(df):
+        ms = df["latency"].to_numpy() * 1000
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99]) if len(ms) else (np.nan,) * 3
+        return {"reruns": len(df), "errors": int(df["error"].notna().sum()),
+                "p50_ms": round(p50), "p95_ms": round(p95), "p99_ms": round(p99), "max_ms": round(ms.max()) if len(ms) else np.nan}
+    rows = [{"action": a, **row(df)} for a, df in records.groupby("action")]
+    rows.append({"action": "all", **row(records)})
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent-session load test for airguard_app.py")
+    parser.add_argument("--sessions", type=int, default=8, help="simulated users at once")
+    parser.add_argument("--duration", type=float, default=60, help="seconds to keep every session busy")
+    parser.add_argument("--think", type=float, default=1.0, help="mean seconds between a user's interactions (0 = none)")
+    parser.add_argument("--latency", type=float, default=150, help="median stub upstream latency in ms")
+    parser.add_argument("--ramp", type=float, default=0, help="seconds over which sessions start")
+    parser.add_argument("--sample", type=float, default=1.0, help="seconds between memory samples")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--csv", help="also write every rerun to this CSV")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch databases and tiles")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="airguard-loadtest-")
+    _prepare_environment(workdir)
+    records, memory, info = run_load_test(args.sessions, args.duration, args.think, args.latency,
+                                          args.sample, args.ramp, args.seed)
+    if args.csv:
+        records.to_csv(args.csv, index=False)
+
+    print(f"{args.sessions} sessions for {info['wall']:.1f}s, {len(records)} reruns "
+          f"({len(records) / info['wall']:.2f}/s), {info['upstream_calls']} stub upstream calls")
+    print(summarize(records).to_string(index=False))
+    if not memory.empty:
+        step = max(len(memory) // 10, 1)
+        print("\nmemory over time")
+        print(memory.iloc[::step].round(1).to_string(index=False))
+        print(f"peak RSS {memory['rss_mb'].max():.0f} MB, caches {memory['cache_mb'].max():.1f} MB")
+    errors = records["error"].dropna()
+    if len(errors):
+        print(f"\n{len(errors)} failed reruns, e.g.: {errors.iloc[0]}")
+    if args.keep:
+        print(f"\nscratch files in {workdir}")
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,352 @@
+import hashlib
+import os
+import socket
+import socketserver
+import sqlite3
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+# -----------------------------
+# Shared cross-process cache
+# -----------------------------
+# st.cache_data and bounded_cache live inside one server process. Behind a
+# load balancer every worker would fetch the same upstream data again, so raw
+# upstream responses also go into a cache all workers can see. Two backends
+# with the same small interface (get/set/delete/clear/stats):
+#   sqlite:///path   - one WAL-mode file, for workers on the same host (default)
+#   redis://host:port/db - any Redis-protocol server, for workers on many hosts
+# A broken backend only ever costs a miss - it never fails the fetch.
+SHARED_CACHE = os.environ.get("AIRGUARD_SHARED_CACHE", "sqlite")
+SHARED_CACHE_DB = os.environ.get("AIRGUARD_SHARED_CACHE_DB", os.path.join(tempfile.gettempdir(), "airguard_shared_cache.sqlite"))
+KEY_PREFIX = "airguard:v1:"
+PURGE_EVERY = 500  # sets between sweeps of expired SQLite rows
+REDIS_TIMEOUT = 0.5
+
+
+def cache_key(*parts):
+    return KEY_PREFIX + hashlib.sha1("\x1f".join(str(p) for p in parts).encode()).hexdigest()
+
+
+class SharedCache:
+    name = "none"
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.errors = 0
+        self._stats_lock = threading.Lock()
+
+    def _count(self, field):
+        with self._stats_lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def get(self, key):
+        try:
+            value = self._get(key)
+        except Exception:
+            self._count("errors")
+            value = None
+        self._count("misses" if value is None else "hits")
+        return value
+
+    def set(self, key, value, ttl):
+        try:
+            self._set(key, value, ttl)
+            self._count("sets")
+        except Exception:
+            self._count("errors")
+
+    def delete(self, key):
+        try:
+            self._delete(key)
+        except Exception:
+            self._count("errors")
+
+    def clear(self):
+        try:
+            self._clear()
+        except Exception:
+            self._count("errors")
+
+    def stats(self):
+        with self._stats_lock:
+            return {"backend": self.name, "hits": self.hits, "misses": self.misses,
+                    "sets": self.sets, "errors": self.errors}
+
+    # Backends override these
+    def _get(self, key):
+        return None
+
+    def _set(self, key, value, ttl):
+        pass
+
+    def _delete(self, key):
+        pass
+
+    def _clear(self):
+        pass
+
+
+class SQLiteCache(SharedCache):
+    name = "sqlite"
+
+    def __init__(self, path=SHARED_CACHE_DB):
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+        self._since_purge = 0
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, expires REAL NOT NULL, value BLOB NOT NULL)")
+            self._local.conn = conn
+        return conn
+
+    def _get(self, key):
+        row = self._connect().execute("SELECT value FROM cache WHERE key = ? AND expires > ?",
+                                      (key, time.time())).fetchone()
+        return bytes(row[0]) if row else None
+
+    def _set(self, key, value, ttl):
+        conn = self._connect()
+        conn.execute("INSERT OR REPLACE INTO cache (key, expires, value) VALUES (?, ?, ?)",
+                     (key, time.time() + ttl, sqlite3.Binary(value)))
+        self._since_purge += 1
+        if self._since_purge >= PURGE_EVERY:
+            self._since_purge = 0
+            conn.execute("DELETE FROM cache WHERE expires <= ?", (time.time(),))
+
+    def _delete(self, key):
+        self._connect().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def _clear(self):
+        self._connect().execute("DELETE FROM cache")
+
+
+class RespError(Exception):
+    pass
+
+
+class RespConnection:
+    # Just enough RESP2 for GET/SET/DEL/SCAN - no pipelining, no pub/sub
+    def __init__(self, host, port, timeout=REDIS_TIMEOUT):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.file = self.sock.makefile("rb")
+
+    def command(self, *args):
+        out = [b"*%d\r\n" % len(args)]
+        for a in args:
+            a = a if isinstance(a, bytes) else str(a).encode()
+            out.append(b"$%d\r\n%s\r\n" % (len(a), a))
+        self.sock.sendall(b"".join(out))
+        return self._reply()
+
+    def _reply(self):
+        line = self.file.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("connection closed by server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RespError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            n = int(rest)
+            if n < 0:
+                return None
+            data = self.file.read(n + 2)
+            return data[:-2]
+        if kind == b"*":
+            n = int(rest)
+            return None if n < 0 else [self._reply() for _ in range(n)]
+        raise RespError(f"unexpected reply {line!r}")
+
+    def close(self):
+        try:
+            self.file.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisCache(SharedCache):
+    name = "redis"
+
+    def __init__(self, url="redis://localhost:6379/0", timeout=REDIS_TIMEOUT):
+        super().__init__()
+        parts = urlsplit(url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 6379
+        self.password = parts.password
+        self.db = int(parts.path.strip("/") or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = RespConnection(self.host, self.port, self.timeout)
+            if self.password:
+                conn.command("AUTH", self.password)
+            if self.db:
+                conn.command("SELECT", self.db)
+            self._local.conn = conn
+        return conn
+
+    def _command(self, *args):
+        try:
+            return self._connect().command(*args)
+        except (OSError, ConnectionError):
+            # Drop the socket so the next call reconnects instead of reading a half reply
+            conn = getattr(self._local, "conn", None)
+            if conn is not None:
+                conn.close()
+            self._local.conn = None
+            raise
+
+    def _get(self, key):
+        return self._command("GET", key)
+
+    def _set(self, key, value, ttl):
+        self._command("SET", key, value, "PX", max(int(ttl * 1000), 1))
+
+    def _delete(self, key):
+        self._command("DEL", key)
+
+    def _clear(self):
+        # Only our own keys - the server may be shared with other apps
+        cursor = b"0"
+        while True:
+            cursor, keys = self._command("SCAN", cursor, "MATCH", KEY_PREFIX + "*", "COUNT", 500)
+            if keys:
+                self._command("DEL", *keys)
+            if cursor in (b"0", "0", 0):
+                break
+
+
+def open_shared_cache(spec=SHARED_CACHE):
+    spec = (spec or "none").strip()
+    if spec in ("none", "off", ""):
+        return SharedCache()
+    if spec == "sqlite":
+        return SQLiteCache()
+    if spec.startswith("sqlite:///"):
+        return SQLiteCache(spec[len("sqlite:///"):])
+    if spec.startswith("redis://"):
+        return RedisCache(spec)
+    raise ValueError(f"unknown shared cache backend: {spec}")
+
+
+# -----------------------------
+# Redis-protocol stand-in
+# -----------------------------
+# A tiny in-memory server speaking the subset of RESP that RedisCache uses, for
+# local multi-worker and load tests without installing Redis:
+#   python airguard_sharedcache.py 6379
+class _StandInHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        conn = RespConnection.__new__(RespConnection)
+        conn.file = self.rfile
+        while True:
+            try:
+                args = conn._reply()
+            except (ConnectionError, OSError, ValueError):
+                return
+            if not args:
+                return
+            try:
+                reply = self.server.execute([a if isinstance(a, bytes) else str(a).encode() for a in args])
+            except RespError as e:
+                reply = e
+            self.wfile.write(_encode(reply))
+
+
+def _encode(value):
+    if isinstance(value, RespError):
+        return b"-ERR %s\r\n" % str(value).encode()
+    if value is None:
+        return b"$-1\r\n"
+    if value is True:
+        return b"+OK\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(_encode(v) for v in value)
+    return b"+%s\r\n" % str(value).encode()
+
+
+class RespStandIn(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0)):
+        super().__init__(address, _StandInHandler)
+        self.data = {}  # key -> (expires_at or None, value)
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="resp-stand-in", daemon=True).start()
+        return self
+
+    def _live(self, key):
+        entry = self.data.get(key)
+        if entry is not None and entry[0] is not None and entry[0] <= time.monotonic():
+            del self.data[key]
+            entry = None
+        return entry
+
+    def execute(self, args):
+        cmd = args[0].upper()
+        with self.lock:
+            if cmd == b"PING":
+                return "PONG"
+            if cmd in (b"AUTH", b"SELECT"):
+                return True
+            if cmd == b"GET":
+                entry = self._live(args[1])
+                return entry[1] if entry else None
+            if cmd == b"SET":
+                expires = None
+                opts = [a.upper() for a in args[3:]]
+                if b"PX" in opts:
+                    expires = time.monotonic() + int(args[3 + opts.index(b"PX") + 1]) / 1000
+                elif b"EX" in opts:
+                    expires = time.monotonic() + int(args[3 + opts.index(b"EX") + 1])
+                self.data[args[1]] = (expires, args[2])
+                return True
+            if cmd == b"DEL":
+                return sum(self.data.pop(k, None) is not None for k in args[1:])
+            if cmd == b"SCAN":
+                opts = [a.upper() for a in args]
+                prefix = args[opts.index(b"MATCH") + 1].rstrip(b"*") if b"MATCH" in opts else b""
+                return [b"0", [k for k in list(self.data) if k.startswith(prefix) and self._live(k)]]
+            if cmd == b"FLUSHDB":
+                self.data.clear()
+                return True
+            if cmd == b"DBSIZE":
+                return len(self.data)
+        raise RespError(f"unknown command '{cmd.decode()}'")
+
+
+if __name__ == "__main__":
+    import sys
+    server = RespStandIn(("127.0.0.1", int(sys.argv[1]) if len(sys.argv) > 1 else 6379))
+    print(f"Redis-protocol stand-in listening on {server.url}")
+    server.serve_forever()
@@ -0,0 +1,150 @@
+import collections
+import threading
+import numpy as np
+import pandas as pd
+from airguard_store import EMPTY_TIME, INITIAL_SLOTS, from_minutes
+from airguard_synthetic import haversine_m
+
+
+# -----------------------------
+# Streaming spike detection
+# -----------------------------
+# Watches every reading the ReadingStore ingests. Each (station, pollutant)
+# slot keeps a fixed handful of numbers - exponentially weighted mean and
+# variance, last value, time and rate of change, and a flat-line counter - so
+# memory is O(1) per station however long it runs. A batch is checked with
+# array operations across all its slots at once (one pass per reading rank
+# within a slot), and flags:
+#   spike         far above the station's own recent level
+#   rapid_rise    at least doubled within a few hours, before any fixed threshold is hit
+#   flatline      the exact same value over and over - a stuck sensor
+#   out_of_range  negative or physically implausible - a broken sensor (never learned from)
+KINDS = ["spike", "rapid_rise", "flatline", "out_of_range"]
+HALF_LIFE_READINGS = 24      # the running level forgets a reading's weight by half after a day of hourly data
+MIN_SAMPLES = 6              # no spike verdicts before a slot has a baseline
+SPIKE_SIGMAS = 4.0
+RISE_FACTOR = 2.0
+RISE_WINDOW_MINUTES = 180
+FLATLINE_READINGS = 8
+MAX_VALID = 2000.0           # µg/m³
+MIN_JUMP = {"pm2.5": 20.0, "pm10": 30.0, "no2": 20.0, "o3": 20.0}  # smaller moves are never flagged
+DEFAULT_MIN_JUMP = 20.0
+MAX_EVENTS = 10000
+ALPHA = 1 - 0.5 ** (1 / HALF_LIFE_READINGS)
+
+
+class SpikeDetector:
+    def __init__(self, initial_slots=INITIAL_SLOTS):
+        self.mean = np.zeros(initial_slots)
+        self.var = np.zeros(initial_slots)
+        self.n = np.zeros(initial_slots, dtype=np.int32)
+        self.last_value = np.full(initial_slots, np.nan)
+        self.last_time = np.full(initial_slots, EMPTY_TIME, dtype=np.int32)
+        self.rate = np.zeros(initial_slots)                      # per hour, last step
+        self.same = np.zeros(initial_slots, dtype=np.int16)      # repeats of last_value
+        self.events = collections.deque(maxlen=MAX_EVENTS)      # (minutes, slot, kind, value, baseline)
+        self.counts = dict.fromkeys(KINDS, 0)
+        self.store = None
+        self._lock = threading.Lock()
+
+    def _ensure(self, n_slots):
+        if n_slots <= len(self.n):
+            return
+        extra = max(n_slots, 2 * len(self.n)) - len(self.n)
+        for name, fill in (("mean", 0.0), ("var", 0.0), ("n", 0), ("last_value", np.nan),
+                           ("last_time", EMPTY_TIME), ("rate", 0.0), ("same", 0)):
+            arr = getattr(self, name)
+            setattr(self, name, np.concatenate([arr, np.full(extra, fill, dtype=arr.dtype)]))
+
+    def attach(self, store):
+        # Called for every fresh reading the store writes
+        self.store = store
+        store.listeners.append(self.update)
+
+    def update(self, store, slots, minutes, values):
+        # slots/minutes/values: the readings a batch added, sorted by slot then time
+        if not len(slots):
+            return
+        jump_by_code = np.array([MIN_JUMP.get(p, DEFAULT_MIN_JUMP) for p in store.pollutants] or [DEFAULT_MIN_JUMP])
+        jump = jump_by_code[store.slot_pollutant[slots]]
+        starts = np.r_[0, np.flatnonzero(np.diff(slots)) + 1]
+        sizes = np.diff(np.r_[starts, len(slots)])
+        rank = np.arange(len(slots)) - np.repeat(starts, sizes)
+        with self._lock:
+            self._ensure(store.n_slots)
+            # EWMA state is sequential per slot, so a slot's k-th reading of the batch goes in pass k;
+            # each pass covers every slot at once (a live batch is a single pass)
+            for r in range(int(sizes.max())):
+                sel = rank == r
+                self._step(slots[sel], minutes[sel], values[sel].astype(float), jump[sel])
+
+    def _step(self, s, t, v, jump):
+        mean, std, n = self.mean[s], np.sqrt(self.var[s]), self.n[s]
+        last_v, last_t = self.last_value[s], self.last_time[s]
+        valid = (v >= 0) & (v <= MAX_VALID)
+        has_last = last_t != EMPTY_TIME
+
+        spike = valid & (n >= MIN_SAMPLES) & (v - mean > np.maximum(SPIKE_SIGMAS * std, jump))
+        rise = (valid & ~spike & has_last & (t - last_t <= RISE_WINDOW_MINUTES)
+                & (v >= RISE_FACTOR * last_v) & (v - last_v >= jump))
+        same = np.where(valid, np.where(v == last_v, self.same[s] + 1, 0), self.same[s])
+        flatline = valid & (same == FLATLINE_READINGS - 1)   # once, when the run gets long enough
+        out_of_range = ~valid & ~np.isnan(v)
+
+        # Learn from valid readings only
+        ok = s[valid]
+        alpha = np.maximum(1.0 / (n[valid] + 1), ALPHA)   # plain average until the EWMA has warmed up
+        delta = v[valid] - mean[valid]
+        self.mean[ok] = mean[valid] + alpha * delta
+        self.var[ok] = (1 - alpha) * (self.var[ok] + alpha * delta ** 2)
+        self.n[ok] = n[valid] + 1
+        hours = np.maximum((t[valid] - last_t[valid]) / 60, 1.0)
+        self.rate[ok] = np.where(has_last[valid], (v[valid] - last_v[valid]) / hours, 0.0)
+        self.last_value[ok] = v[valid]
+        self.last_time[ok] = t[valid]
+        self.same[s] = same
+
+        for kind, flag in zip(KINDS, (spike, rise, flatline, out_of_range)):
+            if flag.any():
+                self.counts[kind] += int(flag.sum())
+                self.events.extend(zip(t[flag].tolist(), s[flag].tolist(), [kind] * int(flag.sum()),
+                                       v[flag].tolist(), mean[flag].tolist()))
+
+    def stats(self, slots=None):
+        # Current per-slot statistics: running mean, standard deviation, rate of change
+        with self._lock:
+            n = self.store.n_slots if self.store is not None else len(self.n)
+            slots = np.arange(min(n, len(self.n))) if slots is None else np.asarray(slots)
+            return pd.DataFrame({"slot": slots, "mean": self.mean[slots], "std": np.sqrt(self.var[slots]),
+                                 "rate_per_hour": self.rate[slots], "samples": self.n[slots]})
+
+    def recent(self, since=None, lat=None, lon=None, radius=50000, kinds=None):
+        # Flagged readings as a DataFrame, newest first; optionally only since a time and near a point
+        columns = ["datetime", "kind", "pollutant", "station", "location_id", "lat", "lon", "value", "baseline"]
+        with self._lock:
+            events = list(self.events)
+        if not events or self.store is None:
+            return pd.DataFrame(columns=columns)
+        minutes, slots, kind, value, baseline = (np.array(c) for c in zip(*events))
+        keep = np.ones(len(slots), dtype=bool)
+        if since is not None:
+            keep &= minutes >= int(pd.Timestamp(since).value // 60_000_000_000)
+        if kinds is not None:
+            keep &= np.isin(kind, list(kinds))
+        store = self.store
+        with store._lock:
+            rows = store.slot_station[slots]
+            station_lat = np.array(store.station_lat, dtype=float)[rows]
+            station_lon = np.array(store.station_lon, dtype=float)[rows]
+            if lat is not None:
+                keep &= haversine_m(lat, lon, station_lat, station_lon) <= radius
+            idx = np.flatnonzero(keep)[::-1]
+            return pd.DataFrame({
+                "datetime": from_minutes(minutes[idx]),
+                "kind": kind[idx],
+                "pollutant": [store.pollutants[c] for c in store.slot_pollutant[slots[idx]]],
+                "station": [store.station_names[r] for r in rows[idx]],
+                "location_id": [store.station_keys[r][1] for r in rows[idx]],
+                "lat": station_lat[idx], "lon": station_lon[idx],
+                "value": value[idx].astype(float), "baseline": baseline[idx].astype(float),
+            }, columns=columns)
@@ -0,0 +1,149 @@
+import os
+import tempfile
+import threading
+import time
+import numpy as np
+import pandas as pd
+from airguard_synthetic import KM_PER_DEGREE, haversine_m
+
+
+# -----------------------------
+# Station registry
+# -----------------------------
+# Station names and coordinates almost never change, so they are kept apart
+# from measurements: fetched once per area, trusted for days, snapshotted to
+# disk so a restarted worker does not re-download them, and queried locally
+# (bounding box, then exact distance). An area past its TTL is still served
+# from the registry while a background refresh runs - the map never waits on
+# station metadata after the first visit to an area.
+STATION_SNAPSHOT = os.environ.get("AIRGUARD_STATION_SNAPSHOT", "airguard_stations.npz")
+STATION_TTL_SECONDS = 3 * 24 * 3600
+COVERAGE_PRECISION = 1   # ~11 km - nearby lookups inside one cell share a fetch
+COLUMNS = ["location_id", "lat", "lon", "station"]
+
+
+class StationRegistry:
+    def __init__(self, path=STATION_SNAPSHOT, ttl=STATION_TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self.stations = pd.DataFrame({"location_id": np.array([], dtype=np.int64), "lat": np.array([], dtype=float),
+                                      "lon": np.array([], dtype=float), "station": np.array([], dtype=object)})
+        self.coverage = {}   # (lat, lon, radius) -> wall-clock time it was fetched
+        self.upstream_fetches = 0
+        self._refreshing = set()
+        self._lock = threading.RLock()
+        self.load()
+
+    def __len__(self):
+        return len(self.stations)
+
+    # -- snapshot ------------------------------------------------------------
+    def load(self):
+        try:
+            with np.load(self.path) as z:
+                stations = pd.DataFrame({"location_id": z["location_id"], "lat": z["lat"], "lon": z["lon"],
+                                         "station": z["station"].astype(object)})
+                coverage = {(float(a), float(b), int(r)): float(t)
+                            for a, b, r, t in zip(z["cov_lat"], z["cov_lon"], z["cov_radius"], z["cov_time"])}
+        except (OSError, KeyError, ValueError):
+            return False
+        with self._lock:
+            self.stations = stations
+            self.coverage = coverage
+        return True
+
+    def save(self):
+        with self._lock:
+            s = self.stations
+            cov = list(self.coverage.items())
+            arrays = {
+                "location_id": s["location_id"].to_numpy(dtype=np.int64),
+                "lat": s["lat"].to_numpy(dtype=float), "lon": s["lon"].to_numpy(dtype=float),
+                "station": s["station"].fillna("").to_numpy(dtype=str),
+                "cov_lat": np.array([k[0] for k, _ in cov], dtype=float),
+                "cov_lon": np.array([k[1] for k, _ in cov], dtype=float),
+                "cov_radius": np.array([k[2] for k, _ in cov], dtype=np.int64),
+                "cov_time": np.array([t for _, t in cov], dtype=float),
+            }
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        # A temp file of our own per write - several workers may save at the same moment
+        with tempfile.NamedTemporaryFile(dir=directory, prefix=os.path.basename(self.path) + ".",
+                                         suffix=".tmp", delete=False) as f:
+            tmp = f.name
+            try:
+                np.savez_compressed(f, **arrays)
+            except BaseException:
+                f.close()
+                os.unlink(tmp)
+                raise
+        os.replace(tmp, self.path)
+
+    # -- writes --------------------------------------------------------------
+    def upsert(self, df):
+        df = df[COLUMNS].astype({"location_id": np.int64, "lat": float, "lon": float})
+        with self._lock:
+            merged = pd.concat([self.stations, df], ignore_index=True)
+            self.stations = merged.drop_duplicates("location_id", keep="last").reset_index(drop=True)
+
+    def _coverage_key(self, lat, lon, radius):
+        return round(float(lat), COVERAGE_PRECISION), round(float(lon), COVERAGE_PRECISION), int(radius)
+
+    def _refresh(self, key, fetch):
+        # Coverage is keyed by a rounded centre, so fetch with the radius padded by that
+        # rounding to be sure every exact circle filed under the key is inside it
+        lat, lon, radius = key
+        pad = 0.5 * 10 ** -COVERAGE_PRECISION * KM_PER_DEGREE * 1000 * 1.5
+        df = fetch(lat, lon, radius + pad)
+        self.upstream_fetches += 1
+        if df is None:
+            return False
+        self.upsert(df)
+        with self._lock:
+            self.coverage[key] = time.time()
+        self.save()
+        return True
+
+    def _refresh_in_background(self, key, fetch):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                self._refresh(key, fetch)
+            except Exception:
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+        threading.Thread(target=run, name="airguard-stations", daemon=True).start()
+
+    # -- reads ---------------------------------------------------------------
+    def bbox(self, south, west, north, east):
+        with self._lock:
+            s = self.stations
+        lat, lon = s["lat"].to_numpy(), s["lon"].to_numpy()
+        inside = (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+        return s[inside].reset_index(drop=True)
+
+    def nearby(self, lat, lon, radius=50000, fetch=None, limit=None):
+        # Stations within radius metres, nearest first. fetch(lat, lon, radius) -> DataFrame
+        # (COLUMNS) or None on failure; only called for areas the registry has not seen or
+        # whose TTL ran out.
+        if fetch is not None:
+            key = self._coverage_key(lat, lon, radius)
+            fetched_at = self.coverage.get(key)
+            if fetched_at is None:
+                self._refresh(key, fetch)
+            elif time.time() - fetched_at > self.ttl:
+                self._refresh_in_background(key, fetch)
+
+        dlat = radius / (KM_PER_DEGREE * 1000)
+        dlon = dlat / max(np.cos(np.radians(lat)), 1e-6)
+        candidates = self.bbox(lat - dlat, lon - dlon, lat + dlat, lon + dlon)
+        dist = haversine_m(lat, lon, candidates["lat"].to_numpy(), candidates["lon"].to_numpy())
+        order = np.argsort(dist, kind="stable")
+        order = order[dist[order] <= radius][:limit]
+        return candidates.iloc[order].assign(distance=dist[order]).reset_index(drop=True)
@@ -0,0 +1,212 @@
+import threading
+import numpy as np
+import pandas as pd
+from airguard_cache import BoundedCache
+
+
+# -----------------------------
+# In-memory reading store
+# -----------------------------
+# One fixed-size ring buffer per (station, pollutant) "slot", all slots packed
+# into two 2-D NumPy arrays (float32 values, int32 minutes since epoch).
+# Station ids/names/coordinates and units are interned once in side tables,
+# so a reading costs 8 bytes instead of a DataFrame row with its own strings.
+RING_CAPACITY = 168          # one week of hourly readings per slot
+INITIAL_SLOTS = 256
+QUERY_TTL_SECONDS = 600
+MAX_QUERIES = 4096
+EMPTY_TIME = np.iinfo(np.int32).min
+
+
+def to_minutes(times):
+    t = pd.to_datetime(pd.Series(times), utc=True).dt.tz_localize(None)
+    return (t.values.astype("datetime64[m]").astype(np.int64)).astype(np.int32)
+
+
+def from_minutes(minutes):
+    return np.asarray(minutes, dtype=np.int64).astype("datetime64[m]").astype("datetime64[ns]")
+
+
+class ReadingStore:
+    def __init__(self, capacity=RING_CAPACITY, initial_slots=INITIAL_SLOTS):
+        self.capacity = capacity
+        self.n_slots = 0
+        self.values = np.full((initial_slots, capacity), np.nan, dtype=np.float32)
+        self.times = np.full((initial_slots, capacity), EMPTY_TIME, dtype=np.int32)
+        self.head = np.zeros(initial_slots, dtype=np.int32)       # next write position
+        self.count = np.zeros(initial_slots, dtype=np.int32)
+        self.last_time = np.full(initial_slots, EMPTY_TIME, dtype=np.int32)
+        self.slot_station = np.zeros(initial_slots, dtype=np.int32)
+        self.slot_pollutant = np.zeros(initial_slots, dtype=np.int8)
+        self.slot_unit = np.zeros(initial_slots, dtype=np.int8)
+
+        # Interned metadata
+        self.station_keys = []       # (source, location_id)
+        self.station_names = []
+        self.station_lat = []
+        self.station_lon = []
+        self.pollutants = []
+        self.units = []
+        self._station_index = {}
+        self._slot_index = {}
+        self.queries = BoundedCache("ReadingStore.queries", ttl=QUERY_TTL_SECONDS,
+                                    max_entries=MAX_QUERIES, max_bytes=None)  # fetch key -> slots
+        self.listeners = []          # fn(store, slots, minutes, values) per batch of fresh readings
+        self._lock = threading.RLock()
+
+    # -- interning ---------------------------------------------------------
+    def _intern(self, table, value):
+        if value not in table:
+            table.append(value)
+        return table.index(value)
+
+    def _station(self, source, location_id, name=None, lat=np.nan, lon=np.nan):
+        key = (source, int(location_id))
+        row = self._station_index.get(key)
+        if row is None:
+            row = self._station_index[key] = len(self.station_keys)
+            self.station_keys.append(key)
+            self.station_names.append(name)
+            self.station_lat.append(float(lat))
+            self.station_lon.append(float(lon))
+        elif name is not None and self.station_names[row] is None:
+            self.station_names[row] = name
+        return row
+
+    def _grow(self):
+        new = max(len(self.head) * 2, INITIAL_SLOTS)
+        extra = new - len(self.head)
+        self.values = np.vstack([self.values, np.full((extra, self.capacity), np.nan, dtype=np.float32)])
+        self.times = np.vstack([self.times, np.full((extra, self.capacity), EMPTY_TIME, dtype=np.int32)])
+        for name, fill in (("head", 0), ("count", 0), ("last_time", EMPTY_TIME),
+                           ("slot_station", 0), ("slot_pollutant", 0), ("slot_unit", 0)):
+            arr = getattr(self, name)
+            setattr(self, name, np.concatenate([arr, np.full(extra, fill, dtype=arr.dtype)]))
+
+    def _slot(self, station_row, pollutant, unit):
+        p = self._intern(self.pollutants, pollutant)
+        slot = self._slot_index.get((station_row, p))
+        if slot is None:
+            if self.n_slots == len(self.head):
+                self._grow()
+            slot = self._slot_index[(station_row, p)] = self.n_slots
+            self.n_slots += 1
+            self.slot_station[slot] = station_row
+            self.slot_pollutant[slot] = p
+            self.slot_unit[slot] = self._intern(self.units, unit)
+        return slot
+
+    # -- writes --------------------------------------------------------------
+    def ingest(self, source, pollutant, df, unit="µg/m³"):
+        # df: location_id, value, datetime (+ optional lat, lon, station). Returns the slots touched.
+        if df.empty:
+            return np.array([], dtype=np.int32)
+        location_id = df["location_id"].to_numpy()
+        lat = df["lat"].to_numpy() if "lat" in df else np.full(len(df), np.nan)
+        lon = df["lon"].to_numpy() if "lon" in df else np.full(len(df), np.nan)
+        names = df["station"].to_numpy() if "station" in df else None
+        minutes = to_minutes(df["datetime"])
+        values = df["value"].to_numpy(dtype=np.float32)
+
+        with self._lock:
+            uniq, first, inverse = np.unique(location_id, return_index=True, return_inverse=True)
+            uniq_slots = np.array([
+                self._slot(self._station(source, loc, names[i] if names is not None else None, lat[i], lon[i]),
+                           pollutant, unit)
+                for loc, i in zip(uniq, first)], dtype=np.int32)
+            slots = uniq_slots[inverse]
+
+            # Only readings newer than what each ring already holds, one per (slot, minute)
+            order = np.lexsort((minutes, slots))
+            slots, minutes, values = slots[order], minutes[order], values[order]
+            fresh = minutes > self.last_time[slots]
+            fresh[1:] &= ~((slots[1:] == slots[:-1]) & (minutes[1:] == minutes[:-1]))
+            slots, minutes, values = slots[fresh], minutes[fresh], values[fresh]
+            if len(slots):
+                starts = np.r_[0, np.flatnonzero(np.diff(slots)) + 1]
+                sizes = np.diff(np.r_[starts, len(slots)])
+                rank = np.arange(len(slots)) - np.repeat(starts, sizes)
+                # A batch longer than the ring only keeps its newest `capacity` readings
+                keep = rank >= np.repeat(sizes, sizes) - self.capacity
+                pos = (self.head[slots] + rank - np.repeat(np.maximum(sizes - self.capacity, 0), sizes)) % self.capacity
+                self.values[slots[keep], pos[keep]] = values[keep]
+                self.times[slots[keep], pos[keep]] = minutes[keep]
+
+                touched = slots[starts]
+                written = np.minimum(sizes, self.capacity)
+                self.head[touched] = (self.head[touched] + written) % self.capacity
+                self.count[touched] = np.minimum(self.count[touched] + written, self.capacity)
+                self.last_time[touched] = minutes[starts + sizes - 1]
+                for listener in self.listeners:
+                    listener(self, slots, minutes, values)
+            return uniq_slots
+
+    # -- fetch cache ---------------------------------------------------------
+    def remember(self, key, slots):
+        self.queries.set(key, np.asarray(slots, dtype=np.int32))
+
+    def recall(self, key):
+        found, slots = self.queries.get(key)
+        return slots if found else None
+
+    def clear_queries(self):
+        self.queries.clear()
+
+    # -- reads ---------------------------------------------------------------
+    def latest(self, slots):
+        # One row per slot with its newest reading, newest first (like OpenAQ's latest endpoint)
+        slots = np.asarray(slots, dtype=np.int32)
+        with self._lock:
+            slots = slots[self.count[slots] > 0]
+            pos = (self.head[slots] - 1) % self.capacity
+            minutes = self.times[slots, pos]
+            values = self.values[slots, pos]
+            rows = self.slot_station[slots]
+            order = np.argsort(minutes, kind="stable")[::-1]
+            return pd.DataFrame({
+                "location_id": np.array([self.station_keys[r][1] for r in rows], dtype=np.int64)[order],
+                "value": values.astype(float)[order],
+                "datetime": from_minutes(minutes)[order],
+                "lat": np.array(self.station_lat, dtype=float)[rows][order],
+                "lon": np.array(self.station_lon, dtype=float)[rows][order],
+            })
+
+    def history(self, source, location_id, pollutant):
+        # Time-ordered copy of one ring
+        with self._lock:
+            row = self._station_index.get((source, int(location_id)))
+            p = self.pollutants.index(pollutant) if pollutant in self.pollutants else None
+            slot = self._slot_index.get((row, p))
+            if slot is None:
+                return pd.DataFrame(columns=["datetime", "value"])
+            n, head = self.count[slot], self.head[slot]
+            idx = (np.arange(head - n, head)) % self.capacity
+            return pd.DataFrame({"datetime": from_minutes(self.times[slot, idx]),
+                                 "value": self.values[slot, idx].astype(float)})
+
+    def view(self):
+        # Every stored cell as a DataFrame over the ring arrays themselves (no copy).
+        # Rows are in ring order; empty cells have value NaN - dropna()/sort as needed.
+        n = self.n_slots
+        return pd.DataFrame({
+            "slot": np.repeat(np.arange(n, dtype=np.int64), self.capacity),
+            "minutes": self.times[:n].reshape(-1),
+            "value": self.values[:n].reshape(-1),
+        }, copy=False)
+
+    def slot_metadata(self):
+        n = self.n_slots
+        rows = self.slot_station[:n]
+        return pd.DataFrame({
+            "slot": np.arange(n),
+            "source": [self.station_keys[r][0] for r in rows],
+            "location_id": [self.station_keys[r][1] for r in rows],
+            "station": [self.station_names[r] for r in rows],
+            "pollutant": pd.Categorical.from_codes(self.slot_pollutant[:n], self.pollutants) if self.pollutants else [],
+            "unit": pd.Categorical.from_codes(self.slot_unit[:n], self.units) if self.units else [],
+            "count": self.count[:n],
+        })
+
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.values, self.times, self.head, self.count, self.last_time,
+                                      self.slot_station, self.slot_pollutant, self.slot_unit))
@@ -0,0 +1,181 @@
+import zlib
+import numpy as np
+import pandas as pd
+
+
+# -----------------------------
+# Deterministic synthetic station network
+# -----------------------------
+# Every value is a pure function of (seed, station, pollutant, hour), so any
+# window of any station can be regenerated identically in any process without
+# storing it. Used as the fallback when upstreams fail and as a full data
+# source for scale tests (AIRGUARD_DATA_SOURCE=synthetic).
+SYNTHETIC_SEED = 2024
+POLLUTANTS = ["pm2.5", "pm10", "no2", "o3"]
+POLLUTANT_BASE = {"pm2.5": 45, "pm10": 65, "no2": 35, "o3": 55}
+
+# (local peak hour, daily amplitude, twice-daily amplitude) - traffic gives PM/NO2 a second peak
+DIURNAL = {"pm2.5": (22, 0.30, 0.15), "pm10": (21, 0.30, 0.15), "no2": (20, 0.30, 0.20), "o3": (15, 0.45, 0.0)}
+# (peak day of year, amplitude) - PM peaks in the North Indian winter, ozone before the monsoon
+SEASONAL = {"pm2.5": (15, 0.45), "pm10": (15, 0.40), "no2": (15, 0.25), "o3": (135, 0.20)}
+WEEKEND_DIP = {"pm2.5": 0.05, "pm10": 0.08, "no2": 0.15, "o3": 0.0}
+
+CITY_CENTERS = [
+    ("Delhi", 28.6139, 77.2090), ("Mumbai", 19.0760, 72.8777), ("Bangalore", 12.9716, 77.5946),
+    ("Kolkata", 22.5726, 88.3639), ("Chennai", 13.0827, 80.2707), ("Hyderabad", 17.3850, 78.4867),
+    ("Pune", 18.5204, 73.8567), ("Ahmedabad", 23.0225, 72.5714), ("Lucknow", 26.8467, 80.9462),
+    ("Jaipur", 26.9124, 75.7873), ("Patna", 25.5941, 85.1376), ("Kanpur", 26.4499, 80.3319),
+]
+
+SLOW_COMPONENTS = 3      # multi-day weather-like swings per station
+HOURLY_NOISE = 0.12      # log-space sd of hour-to-hour noise
+KM_PER_DEGREE = 111.0
+
+
+def stable_seed(*parts):
+    # hash() is salted per process; crc32 of the rounded inputs is not
+    return zlib.crc32("|".join(str(p) for p in parts).encode())
+
+
+def _mix64(x):
+    # splitmix64 finaliser, wraps modulo 2**64
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _hash_normal(keys, hours):
+    # Standard normal per (key, hour) without an RNG stream to keep in sync
+    with np.errstate(over="ignore"):
+        x = _mix64(keys.astype(np.uint64)[:, None] * np.uint64(0x9E3779B97F4A7C15) + hours.astype(np.uint64)[None, :])
+    u1 = ((x >> np.uint64(40)).astype(np.float32) + 0.5) / np.float32(1 << 24)
+    u2 = ((x & np.uint64(0xFFFFFF)).astype(np.float32) + 0.5) / np.float32(1 << 24)
+    return np.sqrt(-2.0 * np.log(u1)) * np.cos(np.float32(2 * np.pi) * u2)
+
+
+def _hours_since_epoch(times):
+    return np.asarray(pd.to_datetime(times, utc=True).tz_localize(None).values.astype("datetime64[h]").astype(np.int64))
+
+
+def haversine_m(lat, lon, lats, lons):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat, lon, lats, lons))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371000.0 * np.arcsin(np.sqrt(a))
+
+
+class SyntheticNetwork:
+    def __init__(self, n_stations=10000, seed=SYNTHETIC_SEED, centers=CITY_CENTERS, spread_km=20.0, prefix="SYN"):
+        rng = np.random.default_rng(seed)
+        n = int(n_stations)
+        self.seed = seed
+        center_lat = np.array([c[1] for c in centers])
+        center_lon = np.array([c[2] for c in centers])
+        city = rng.integers(0, len(centers), n)
+        spread = spread_km / KM_PER_DEGREE
+        self.lat = center_lat[city] + rng.normal(0, spread, n)
+        self.lon = center_lon[city] + rng.normal(0, spread, n) / np.cos(np.radians(center_lat[city]))
+        self.city = np.array([c[0] for c in centers], dtype=object)[city]
+        self.names = np.char.add(f"{prefix}-", np.char.zfill(np.arange(n).astype(str), 5))
+        self.keys = np.arange(n, dtype=np.uint64) + np.uint64((seed << 32) & 0xFFFFFFFFFFFFFFFF)
+
+        shape = (n, len(POLLUTANTS))
+        base = np.array([POLLUTANT_BASE[p] for p in POLLUTANTS], dtype=np.float32)
+        self.base = (base * rng.lognormal(0, 0.35, shape)).astype(np.float32)
+        self.diurnal_scale = rng.uniform(0.6, 1.4, shape).astype(np.float32)
+        self.peak_shift = rng.normal(0, 1.0, shape).astype(np.float32)
+        self.slow_amp = rng.uniform(0.05, 0.2, (n, SLOW_COMPONENTS)).astype(np.float32)
+        self.slow_period = rng.uniform(36, 240, (n, SLOW_COMPONENTS)).astype(np.float32)
+        self.slow_phase = rng.uniform(0, 2 * np.pi, (n, SLOW_COMPONENTS)).astype(np.float32)
+
+    @classmethod
+    def around(cls, lat, lon, n_stations=3, seed=SYNTHETIC_SEED, spread_km=5.0):
+        # Small local network for any coordinate, identical for the same rounded point
+        local_seed = stable_seed(seed, f"{lat:.4f}", f"{lon:.4f}")
+        return cls(n_stations, seed=local_seed, centers=[("", lat, lon)], spread_km=spread_km, prefix="Station")
+
+    def __len__(self):
+        return len(self.lat)
+
+    @property
+    def stations(self):
+        return pd.DataFrame({"location_id": np.arange(len(self)), "station": self.names,
+                             "lat": self.lat, "lon": self.lon, "city": self.city})
+
+    def values(self, idx, times, pollutant, smooth=False):
+        # (len(idx), len(times)) float32 concentrations
+        idx = np.asarray(idx)
+        hours = _hours_since_epoch(times)
+        j = POLLUTANTS.index(pollutant)
+        peak, daily, twice = DIURNAL[pollutant]
+        season_peak, season_amp = SEASONAL[pollutant]
+
+        t = hours.astype(np.float32)[None, :]
+        local_hour = (hours[None, :] % 24 + (self.lon[idx] / 15.0)[:, None]).astype(np.float32)
+        phase = np.float32(2 * np.pi / 24) * (local_hour - peak - self.peak_shift[idx, j][:, None])
+        diurnal = 1 + self.diurnal_scale[idx, j][:, None] * (daily * np.cos(phase) + twice * np.cos(2 * phase))
+
+        days = hours // 24
+        weekend = ((days + 3) % 7 >= 5).astype(np.float32)  # 1970-01-01 was a Thursday
+        doy = (days % 365.25).astype(np.float32)
+        seasonal = 1 + season_amp * np.cos(np.float32(2 * np.pi / 365.25) * (doy - season_peak))
+        calendar = (seasonal * (1 - WEEKEND_DIP[pollutant] * weekend))[None, :]
+
+        slow = np.zeros((len(idx), len(hours)), dtype=np.float32)
+        for k in range(SLOW_COMPONENTS):
+            slow += self.slow_amp[idx, k][:, None] * np.sin(
+                np.float32(2 * np.pi) * t / self.slow_period[idx, k][:, None] + self.slow_phase[idx, k][:, None])
+
+        out = self.base[idx, j][:, None] * diurnal * calendar * (1 + slow)
+        if not smooth:
+            out *= np.exp(HOURLY_NOISE * _hash_normal(self.keys[idx] * np.uint64(8) + np.uint64(j), hours))
+        return np.maximum(out, 1.0).astype(np.float32)
+
+    def nearby(self, lat, lon, radius=50000, limit=None):
+        dist = haversine_m(lat, lon, self.lat, self.lon)
+        idx = np.flatnonzero(dist <= radius)
+        idx = idx[np.argsort(dist[idx], kind="stable")][:limit]
+        return pd.DataFrame({"lat": self.lat[idx], "lon": self.lon[idx], "station": self.names[idx],
+                             "location_id": idx, "distance": dist[idx]})
+
+    def latest(self, lat, lon, pollutant, radius=50000, limit=100, now=None):
+        # Shaped like OpenAQ's latest endpoint: one current reading per station, nearest first
+        now = pd.Timestamp(now if now is not None else pd.Timestamp.now(tz="UTC"))
+        now = (now.tz_convert("UTC").tz_localize(None) if now.tzinfo else now).floor("h")
+        near = self.nearby(lat, lon, radius, limit=limit)
+        idx = near["location_id"].to_numpy()
+        return pd.DataFrame({
+            "location_id": idx.astype(np.int64),
+            "value": self.values(idx, [now], pollutant)[:, 0].astype(float),
+            "datetime": np.full(len(idx), now.to_datetime64(), dtype="datetime64[ns]"),
+            "lat": near["lat"].to_numpy(),
+            "lon": near["lon"].to_numpy(),
+        })
+
+    def model_series(self, lat, lon, pollutant, past_days=1, forecast_days=3, now=None, k=5):
+        # Shaped like an Open-Meteo hourly series: noise-free mean of the nearest stations
+        now = pd.Timestamp(now if now is not None else pd.Timestamp.now(tz="UTC")).floor("h")
+        start = now.normalize() - pd.Timedelta(days=past_days)
+        times = pd.date_range(start, periods=24 * (past_days + forecast_days), freq="h")
+        idx = np.argsort(haversine_m(lat, lon, self.lat, self.lon))[:k]
+        vals = self.values(idx, times, pollutant, smooth=True).mean(axis=0)
+        return pd.DataFrame({"datetime": times.tz_localize(None), "value": vals.astype(float)})
+
+    def readings(self, start, end, pollutants=POLLUTANTS, idx=None, chunk_hours=24 * 7):
+        # Long (location_id, datetime, pollutant, value) frames, one chunk of hours at a time.
+        # Station names/coordinates live in .stations, keyed by location_id.
+        idx = np.arange(len(self)) if idx is None else np.asarray(idx)
+        times = pd.date_range(pd.Timestamp(start).floor("h"), pd.Timestamp(end).floor("h"), freq="h")
+        for lo in range(0, len(times), chunk_hours):
+            chunk = times[lo:lo + chunk_hours]
+            location_id = np.repeat(idx.astype(np.int32), len(chunk))
+            datetimes = np.tile(chunk.values, len(idx))
+            for p in pollutants:
+                codes = np.full(len(location_id), POLLUTANTS.index(p), dtype=np.int8)
+                yield pd.DataFrame({
+                    "location_id": location_id,
+                    "datetime": datetimes,
+                    "pollutant": pd.Categorical.from_codes(codes, POLLUTANTS),
+                    "value": self.values(idx, chunk, p).ravel(),
+                })
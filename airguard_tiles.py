@@ -0,0 +1,191 @@
+import argparse
+import functools
+import logging
+import os
+import tempfile
+import threading
+import time
+import numpy as np
+import pandas as pd
+from airguard_data import calculate_aqi_array, fetch_region_latest, get_aqi_color
+
+
+# -----------------------------
+# Pre-aggregated AQI grid tiles
+# -----------------------------
+# A background job pulls the latest reading of every station in a region once,
+# bins them into square cells at a few zoom levels and writes one small .npz
+# tile per (region, pollutant, level): int16 cell row/col, uint16 AQI and
+# station count. The map draws a tile directly, so a country-wide view costs
+# no upstream calls per request - just a file read cached on its mtime.
+# A pollutant whose fetch fails keeps its previous tiles: old data on the map
+# beats an empty grid stamped as fresh.
+TILE_DIR = os.environ.get("AIRGUARD_TILE_DIR", "tiles")
+TILE_MAX_AGE_SECONDS = 3600
+TILE_RETRY_SECONDS = 300   # after a failed build, wait before the dashboard starts another
+
+# name -> (south, west, north, east)
+REGIONS = {"india": (6.0, 68.0, 37.5, 98.0)}
+# level -> cell size in degrees (~110 km, ~28 km, ~5.5 km)
+LEVELS = {"country": 1.0, "state": 0.25, "city": 0.05}
+POLLUTANTS = ["pm2.5", "pm10", "no2", "o3"]
+
+log = logging.getLogger(__name__)
+
+
+def level_for_zoom(zoom):
+    # Leaflet zoom -> grid level; at street zoom the stations themselves are on the map
+    if zoom is None or zoom <= 5:
+        return "country"
+    return "state" if zoom <= 8 else "city"
+
+
+def tile_path(region, pollutant, level, tile_dir=TILE_DIR):
+    return os.path.join(tile_dir, region, f"{pollutant}_{level}.npz")
+
+
+def aggregate(df, bbox, cell_deg, pollutant):
+    # df: lat, lon, value -> one entry per non-empty cell (mean concentration, AQI, count)
+    south, west, north, east = bbox
+    inside = df[(df["lat"] >= south) & (df["lat"] < north) & (df["lon"] >= west) & (df["lon"] < east)]
+    n_cols = int(np.ceil((east - west) / cell_deg))
+    row = ((inside["lat"].to_numpy() - south) // cell_deg).astype(np.int64)
+    col = ((inside["lon"].to_numpy() - west) // cell_deg).astype(np.int64)
+    cells, inverse = np.unique(row * n_cols + col, return_inverse=True)
+    count = np.bincount(inverse, minlength=len(cells))
+    mean = np.bincount(inverse, weights=inside["value"].to_numpy(dtype=float), minlength=len(cells)) / np.maximum(count, 1)
+    aqi = calculate_aqi_array(pollutant, mean)
+    return {
+        "row": (cells // n_cols).astype(np.int16),
+        "col": (cells % n_cols).astype(np.int16),
+        "value": mean.astype(np.float32),
+        "aqi": np.nan_to_num(aqi, nan=0).astype(np.uint16),   # 0 = no AQI band for the value
+        "count": np.minimum(count, np.iinfo(np.uint16).max).astype(np.uint16),
+    }
+
+
+def save_tile(path, bbox, cell_deg, pollutant, cells, generated=None):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # A temp file of our own per write - another worker's job may be saving the same tile
+    with tempfile.NamedTemporaryFile(dir=directory, prefix=os.path.basename(path) + ".",
+                                     suffix=".tmp", delete=False) as f:
+        tmp = f.name
+        try:
+            np.savez_compressed(f, bbox=np.array(bbox, dtype=float), cell_deg=np.float64(cell_deg),
+                                pollutant=np.array(pollutant), generated=np.float64(generated or time.time()), **cells)
+        except BaseException:
+            f.close()
+            os.unlink(tmp)
+            raise
+    os.replace(tmp, path)  # readers never see a half-written tile
+
+
+@functools.lru_cache(maxsize=64)
+def _read_tile(path, mtime):
+    with np.load(path) as z:
+        return {k: z[k] for k in z.files}
+
+
+def load_tile(region, pollutant, level, tile_dir=TILE_DIR):
+    path = tile_path(region, pollutant, level, tile_dir)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    return _read_tile(path, mtime)
+
+
+def tile_geojson(tile, bounds=None):
+    # GeoJSON squares for folium.GeoJson, optionally only those inside (south, west, north, east)
+    south, west = tile["bbox"][0], tile["bbox"][1]
+    cell = float(tile["cell_deg"])
+    s = south + tile["row"] * cell
+    w = west + tile["col"] * cell
+    keep = tile["aqi"] > 0
+    if bounds is not None:
+        b_south, b_west, b_north, b_east = bounds
+        keep &= (s + cell >= b_south) & (s <= b_north) & (w + cell >= b_west) & (w <= b_east)
+    features = []
+    for si, wi, aqi, count in zip(s[keep], w[keep], tile["aqi"][keep], tile["count"][keep]):
+        si, wi, aqi = float(si), float(wi), int(aqi)
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "Polygon", "coordinates": [[[wi, si], [wi + cell, si], [wi + cell, si + cell], [wi, si + cell], [wi, si]]]},
+            "properties": {"aqi": aqi, "stations": int(count), "color": get_aqi_color(aqi)},
+        })
+    return {"type": "FeatureCollection", "features": features}
+
+
+def build_tiles(region="india", pollutants=POLLUTANTS, levels=LEVELS, tile_dir=TILE_DIR, fetch=fetch_region_latest):
+    # One regional fetch per pollutant, then every level is binned from the same points.
+    # A failed or empty fetch leaves that pollutant's tiles as they were; the summary says why.
+    bbox = REGIONS[region]
+    summary = []
+    for p in pollutants:
+        try:
+            df = fetch(bbox, p)
+            if df.empty:
+                raise RuntimeError("no stations returned")
+        except Exception as e:
+            log.warning("tiles for %s/%s not rebuilt: %s", region, p, e)
+            summary.append({"pollutant": p, "level": None, "stations": 0, "cells": 0, "error": str(e)})
+            continue
+        generated = time.time()
+        for level, cell_deg in levels.items():
+            cells = aggregate(df, bbox, cell_deg, p)
+            save_tile(tile_path(region, p, level, tile_dir), bbox, cell_deg, p, cells, generated)
+            summary.append({"pollutant": p, "level": level, "stations": len(df), "cells": len(cells["aqi"]), "error": None})
+    return pd.DataFrame(summary, columns=["pollutant", "level", "stations", "cells", "error"])
+
+
+class TileJob:
+    # build_tiles in a background thread so the page never waits on a country-wide fetch.
+    # last_error is the newest failure, kept until a build succeeds.
+    _lock = threading.Lock()
+    _running = None
+    last_error = None
+    _failed_at = None
+
+    @classmethod
+    def start(cls, region="india", **kwargs):
+        with cls._lock:
+            if cls._running is not None and cls._running.is_alive():
+                return False
+            if cls._failed_at is not None and time.monotonic() - cls._failed_at < TILE_RETRY_SECONDS:
+                return False
+            cls._running = threading.Thread(target=cls._run, args=(region,), kwargs=kwargs,
+                                            name="airguard-tiles", daemon=True)
+            cls._running.start()
+            return True
+
+    @classmethod
+    def _run(cls, region, **kwargs):
+        try:
+            summary = build_tiles(region, **kwargs)
+            errors = summary["error"].dropna()
+            error = "; ".join(f"{p}: {e}" for p, e in zip(summary.loc[errors.index, "pollutant"], errors)) or None
+        except Exception as e:
+            log.exception("tile build for %s failed", region)
+            error = str(e)
+        cls.last_error = error
+        cls._failed_at = time.monotonic() if error else None
+
+    @classmethod
+    def running(cls):
+        return cls._running is not None and cls._running.is_alive()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build AirGuard AQI grid tiles")
+    parser.add_argument("--region", default="india", choices=sorted(REGIONS))
+    parser.add_argument("--pollutants", default=",".join(POLLUTANTS))
+    parser.add_argument("--interval", type=int, default=0, help="rebuild every N seconds (0 = once)")
+    args = parser.parse_args()
+    while True:
+        start = time.monotonic()
+        print(build_tiles(args.region, args.pollutants.split(",")).to_string(index=False))
+        print(f"built in {time.monotonic() - start:.1f}s -> {os.path.join(TILE_DIR, args.region)}")
+        if not args.interval:
+            break
+        time.sleep(max(args.interval - (time.monotonic() - start), 0))
@@ -0,0 +1,584 @@
+import collections
+import copy
+import functools
+import heapq
+import inspect
+import itertools
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent import futures
+from urllib.parse import urlsplit
+import requests
+from requests.structures import CaseInsensitiveDict
+from airguard_sharedcache import cache_key, open_shared_cache
+
+try:
+    import orjson
+    json_loads = orjson.loads
+
+    def json_dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+except ImportError:  # plain json is fine, just slower on big payloads
+    import json
+    json_loads = json.loads
+
+    def json_dumps(obj):
+        return json.dumps(obj, separators=(",", ":"), default=str).encode()
+
+
+# -----------------------------
+# Per-host circuit breaker
+# -----------------------------
+# After FAILURE_THRESHOLD consecutive failures a host is "open": calls fail
+# immediately (callers fall back) instead of each waiting out its timeout.
+# Once the cooldown passes the breaker goes "half-open" and lets a single
+# probe through; success closes it, failure re-opens it with a longer cooldown.
+FAILURE_THRESHOLD = 3
+COOLDOWN_SECONDS = 30
+MAX_COOLDOWN_SECONDS = 600
+
+
+class CircuitOpenError(requests.RequestException):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, host, failure_threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN_SECONDS,
+                 max_cooldown=MAX_COOLDOWN_SECONDS):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.cooldown = cooldown
+        self.opened_at = 0.0
+        self.probing = False
+        self.short_circuited = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = "half-open"
+            if self.state == "half-open" and not self.probing:
+                self.probing = True
+                return True
+            self.short_circuited += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self.cooldown = self.base_cooldown
+            self.probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half-open":
+                # Probe failed - back off harder before the next one
+                self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+                self._open()
+            elif self.failures >= self.failure_threshold:
+                self._open()
+
+    def release_probe(self):
+        with self._lock:
+            self.probing = False
+
+    def _open(self):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.probing = False
+
+    def snapshot(self):
+        with self._lock:
+            return {"host": self.host, "state": self.state, "failures": self.failures,
+                    "cooldown": self.cooldown, "short_circuited": self.short_circuited}
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(host):
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(host)
+        return _breakers[host]
+
+
+def breaker_states():
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [b.snapshot() for b in breakers]
+
+
+def is_upstream_failure(resp):
+    # Throttling and server errors count against the host; 4xx "no such thing" does not
+    return resp.status_code == 429 or resp.status_code >= 500
+
+
+# -----------------------------
+# Shared per-host rate limiter
+# -----------------------------
+# A token bucket per host, kept as a GCRA "theoretical arrival time" in a
+# small SQLite file so every session thread and every server process draws
+# from the same budget. Within a process callers queue by priority (interactive
+# lookups before background jobs); the head of the queue reserves the next
+# slot and sleeps until it, so bursts are spread out instead of hitting 429s.
+INTERACTIVE = 0
+BACKGROUND = 1
+MAX_QUEUE_WAIT = 10.0
+RATE_LIMIT_DB = os.environ.get("AIRGUARD_RATELIMIT_DB", os.path.join(tempfile.gettempdir(), "airguard_ratelimit.sqlite"))
+
+# host -> (requests per second, burst)
+RATE_LIMITS = {
+    "nominatim.openstreetmap.org": (1.0, 1),
+    "api.openaq.org": (5.0, 10),
+    "air-quality-api.open-meteo.com": (10.0, 20),
+    "api.open-meteo.com": (10.0, 20),
+}
+
+
+class RateLimitedError(requests.RequestException):
+    pass
+
+
+class RateLimiter:
+    def __init__(self, path=RATE_LIMIT_DB, limits=RATE_LIMITS):
+        self.path = path
+        self.limits = limits
+        self._queues = {}
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._local = threading.local()
+        self._fallback_tat = {}  # used only if the shared file is unusable
+        self.stats = {}
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (host TEXT PRIMARY KEY, tat REAL NOT NULL)")
+            self._local.conn = conn
+        return conn
+
+    def _update_tat(self, host, fn):
+        # fn(stored tat or None, now) -> (new tat or None to leave it, result)
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT tat FROM buckets WHERE host = ?", (host,)).fetchone()
+                new_tat, result = fn(row[0] if row else None, now)
+                if new_tat is not None:
+                    conn.execute("INSERT OR REPLACE INTO buckets (host, tat) VALUES (?, ?)", (host, new_tat))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return result
+        except sqlite3.Error:
+            with self._cond:
+                new_tat, result = fn(self._fallback_tat.get(host), now)
+                if new_tat is not None:
+                    self._fallback_tat[host] = new_tat
+                return result
+
+    def _reserve(self, host, budget):
+        rate, burst = self.limits[host]
+        interval = 1.0 / rate
+
+        def reserve(tat, now):
+            tat = max(tat or now, now)
+            wait = max(0.0, tat - (burst - 1) * interval - now)
+            if wait > budget:
+                return None, None
+            return tat + interval, wait
+        return self._update_tat(host, reserve)
+
+    def penalize(self, host, seconds):
+        # Upstream told us to back off (429 Retry-After) - push everyone's next slot out
+        if host in self.limits:
+            self._update_tat(host, lambda tat, now: (max(tat or now, now + seconds), None))
+
+    def acquire(self, host, priority=INTERACTIVE, max_wait=MAX_QUEUE_WAIT):
+        if host not in self.limits:
+            return 0.0
+        start = time.monotonic()
+        ticket = (priority, next(self._seq))
+        with self._cond:
+            queue = self._queues.setdefault(host, [])
+            heapq.heappush(queue, ticket)
+            try:
+                while queue[0] != ticket:
+                    remaining = max_wait - (time.monotonic() - start)
+                    if remaining <= 0:
+                        raise RateLimitedError(f"rate limit queue for {host} is full")
+                    self._cond.wait(remaining)
+            except BaseException:
+                queue.remove(ticket)
+                heapq.heapify(queue)
+                self._cond.notify_all()
+                self._record(host, time.monotonic() - start, rejected=True)
+                raise
+        try:
+            wait = self._reserve(host, max_wait - (time.monotonic() - start))
+            if wait is None:
+                self._record(host, time.monotonic() - start, rejected=True)
+                raise RateLimitedError(f"rate limit for {host} exceeded")
+            time.sleep(wait)
+        finally:
+            # Our own ticket - a higher-priority caller may have jumped ahead while we were
+            # in flight, so it is not necessarily the one at the top of the heap any more
+            with self._cond:
+                queue.remove(ticket)
+                heapq.heapify(queue)
+                self._cond.notify_all()
+        waited = time.monotonic() - start
+        self._record(host, waited)
+        return waited
+
+    def _record(self, host, waited, rejected=False):
+        with self._cond:
+            s = self.stats.setdefault(host, {"requests": 0, "rejected": 0, "total_wait": 0.0, "max_wait": 0.0})
+            s["rejected" if rejected else "requests"] += 1
+            s["total_wait"] += waited
+            s["max_wait"] = max(s["max_wait"], waited)
+
+    def snapshot(self):
+        with self._cond:
+            out = []
+            for host, s in self.stats.items():
+                handled = s["requests"] + s["rejected"]
+                out.append({"host": host, "queued": len(self._queues.get(host, [])),
+                            "avg_wait": s["total_wait"] / handled if handled else 0.0, **s})
+            return out
+
+
+rate_limiter = RateLimiter()
+
+
+def rate_limit_stats():
+    return rate_limiter.snapshot()
+
+
+def retry_after_seconds(resp, default=5.0):
+    try:
+        return float(resp.headers.get("Retry-After", default))
+    except (TypeError, ValueError):
+        return default
+
+
+# -----------------------------
+# Shared response cache
+# -----------------------------
+# Successful GET bodies are kept in the cross-process cache, keyed by URL, so
+# every worker behind the load balancer reuses one worker's upstream call.
+shared_cache = open_shared_cache()
+
+
+def shared_cache_stats():
+    return shared_cache.stats()
+
+
+def _cached_response(url):
+    payload = shared_cache.get(cache_key("GET", url))
+    if payload is None:
+        return None
+    content_type, _, content = payload.partition(b"\n")
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.url = url
+    resp._content = content
+    resp.headers = CaseInsensitiveDict({"Content-Type": content_type.decode(), "X-AirGuard-Cache": "shared"})
+    resp.encoding = "utf-8"
+    return resp
+
+
+def _store_response(url, resp, ttl):
+    content_type = resp.headers.get("Content-Type", "application/json").replace("\n", " ")
+    shared_cache.set(cache_key("GET", url), content_type.encode() + b"\n" + resp.content, ttl)
+
+
+def upstream_request(method, url, priority=INTERACTIVE, cache_ttl=None, **kwargs):
+    # cache_ttl: seconds a successful GET may be served to any worker from the shared cache
+    shared = bool(cache_ttl) and method == "GET"
+    if shared:
+        resp = _cached_response(url)
+        if resp is not None:
+            return resp
+    host = urlsplit(url).netloc
+    breaker = get_breaker(host)
+    if not breaker.allow():
+        raise CircuitOpenError(f"circuit open for {breaker.host}")
+    try:
+        rate_limiter.acquire(host, priority)
+    except RateLimitedError:
+        breaker.release_probe()
+        raise
+    try:
+        resp = requests.request(method, url, **kwargs)
+    except requests.RequestException:
+        breaker.record_failure()
+        raise
+    except Exception:
+        # Not the upstream's fault - just don't leave a half-open probe hanging
+        breaker.release_probe()
+        raise
+    if resp.status_code == 429:
+        rate_limiter.penalize(host, retry_after_seconds(resp))
+    if is_upstream_failure(resp):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    if shared and resp.status_code == 200:
+        _store_response(url, resp, cache_ttl)
+    return resp
+
+
+def upstream_get(url, **kwargs):
+    return upstream_request("GET", url, **kwargs)
+
+
+def upstream_post(url, **kwargs):
+    return upstream_request("POST", url, **kwargs)
+
+
+# -----------------------------
+# Single-flight request coalescing
+# -----------------------------
+# Concurrent callers asking for the same thing share one upstream call: the
+# first caller runs it, everyone else arriving while it is in flight waits
+# and gets a copy of the same result (or the same exception). Coordinates are
+# quantized first so nearby clicks/sessions land on the same key - and the
+# same st.cache_data entry underneath.
+COORD_PRECISION = 3  # ~110 m
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.shared += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+_flights = SingleFlight()
+
+
+def coalesce_stats():
+    return {"leaders": _flights.leaders, "shared": _flights.shared}
+
+
+def quantize_coords(lat, lon, precision=COORD_PRECISION):
+    return round(float(lat), precision), round(float(lon), precision)
+
+
+def coalesce(fn):
+    signature = inspect.signature(fn)
+    name = f"{fn.__module__}.{fn.__qualname__}"
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        if "lat" in bound.arguments and "lon" in bound.arguments:
+            bound.arguments["lat"], bound.arguments["lon"] = quantize_coords(
+                bound.arguments["lat"], bound.arguments["lon"])
+        key = (name, tuple(bound.arguments.items()))
+        return _flights.do(key, fn, *bound.args, **bound.kwargs)
+    return wrapper
+
+
+# -----------------------------
+# Page fan-out
+# -----------------------------
+# A page's fetches do not depend on each other, so they all start at once on a
+# shared pool and the page renders each result as it lands - the first card
+# costs the fastest upstream, not the sum of them. One deadline covers the
+# whole page: anything still running when it passes is dropped from this
+# render and finishes in the background, warming the caches for the next one.
+PAGE_DEADLINE_SECONDS = 10
+PAGE_WORKERS = 32
+
+_page_pool = futures.ThreadPoolExecutor(max_workers=PAGE_WORKERS, thread_name_prefix="airguard-page")
+
+
+class FanOut:
+    def __init__(self, jobs, deadline=PAGE_DEADLINE_SECONDS):
+        # jobs: name -> (fn, *args); every job is submitted right away
+        self.deadline = time.monotonic() + deadline
+        self.futures = {_page_pool.submit(job[0], *job[1:]): name for name, job in jobs.items()}
+        self.results = {}
+        self.failed = set()
+
+    def as_completed(self):
+        # (name, value) in completion order, on the caller's thread; failed jobs and
+        # jobs still running at the deadline are recorded in .failed and skipped
+        try:
+            for future in futures.as_completed(self.futures, timeout=max(self.deadline - time.monotonic(), 0)):
+                name = self.futures[future]
+                try:
+                    value = future.result()
+                except Exception:
+                    self.failed.add(name)
+                    continue
+                self.results[name] = value
+                yield name, value
+        except futures.TimeoutError:
+            self.failed.update(name for future, name in self.futures.items() if not future.done())
+
+    def get(self, name, default=None):
+        return self.results.get(name, default)
+
+
+# -----------------------------
+# Hedged requests
+# -----------------------------
+# When two sources can answer the same question, the primary is asked first and
+# the alternate only once the primary has run past its own recent p95 latency;
+# whichever valid answer lands first is used. Latency is recorded for every
+# call, including ones that finish after the hedge has moved on, so the delay
+# follows what the primary really costs - a slow tail costs one p95 plus the
+# alternate instead of a full timeout. Abandoned calls still complete in the
+# background and warm the caches for the next request.
+HEDGE_WINDOW = 200           # latency samples kept per source
+HEDGE_MIN_SAMPLES = 20       # until then the default delay is used
+HEDGE_PERCENTILE = 0.95
+HEDGE_DEFAULT_DELAY = 1.5
+HEDGE_MIN_DELAY = 0.2
+HEDGE_MAX_DELAY = 5.0
+HEDGE_WORKERS = 16
+
+_hedge_pool = futures.ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="airguard-hedge")
+
+
+class LatencyTracker:
+    def __init__(self, window=HEDGE_WINDOW):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self._lock:
+            self._samples.setdefault(name, collections.deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, name, q):
+        with self._lock:
+            samples = sorted(self._samples.get(name, ()))
+        if not samples:
+            return None
+        return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+    def hedge_delay(self, name):
+        with self._lock:
+            n = len(self._samples.get(name, ()))
+        if n < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return min(max(self.percentile(name, HEDGE_PERCENTILE), HEDGE_MIN_DELAY), HEDGE_MAX_DELAY)
+
+    def stats(self):
+        with self._lock:
+            names = list(self._samples)
+        return {name: {"samples": len(self._samples[name]), "p50": self.percentile(name, 0.5),
+                       "p95": self.percentile(name, HEDGE_PERCENTILE), "hedge_delay": self.hedge_delay(name)}
+                for name in names}
+
+
+latency = LatencyTracker()
+_hedge_counts = {"calls": 0, "hedged": 0, "alternate_won": 0}
+_hedge_lock = threading.Lock()
+
+
+def hedge_stats():
+    with _hedge_lock:
+        return dict(_hedge_counts, latency=latency.stats())
+
+
+def _timed(name, fn, *args):
+    start = time.monotonic()
+    try:
+        return fn(*args)
+    finally:
+        latency.record(name, time.monotonic() - start)
+
+
+def hedged(primary, alternate, valid=bool, delay=None, deadline=PAGE_DEADLINE_SECONDS):
+    # primary/alternate: (name, fn, *args). Returns {name: value} of every call that had
+    # finished when a valid value arrived (or when both were done / the deadline passed),
+    # so the caller can still rank them; calls that raised are left out.
+    start = time.monotonic()
+    delay = latency.hedge_delay(primary[0]) if delay is None else delay
+    pending = {_hedge_pool.submit(_timed, *primary): primary[0]}
+    results = {}
+    fired = False
+    while pending:
+        until = start + (deadline if fired else delay)
+        done, _ = futures.wait(pending, timeout=max(until - time.monotonic(), 0),
+                               return_when=futures.FIRST_COMPLETED)
+        for future in done:
+            name = pending.pop(future)
+            try:
+                results[name] = future.result()
+            except Exception:
+                pass
+        if any(valid(v) for v in results.values()):
+            break
+        if not fired:
+            # Primary is slow, or already answered with nothing usable
+            pending[_hedge_pool.submit(_timed, *alternate)] = alternate[0]
+            fired = True
+        elif time.monotonic() >= start + deadline:
+            break
+    for future, name in pending.items():
+        if future.done() and future.exception() is None:
+            results[name] = future.result()
+    with _hedge_lock:
+        _hedge_counts["calls"] += 1
+        _hedge_counts["hedged"] += fired
+        _hedge_counts["alternate_won"] += bool(alternate[0] in results and valid(results[alternate[0]])
+                                               and not (primary[0] in results and valid(results[primary[0]])))
+    return results
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+from airguard_alerts import ALERT_COOLDOWN_SECONDS, POLLUTANTS, AlertEngine, SubscriptionStore
+
+
+def random_subscriptions(rng, n, cells):
+    # Subscribers scattered around the given cell centres, never near a cell edge
+    at = rng.integers(0, len(cells), n)
+    return pd.DataFrame({
+        "lat": cells[at, 0] + rng.uniform(-0.003, 0.003, n),
+        "lon": cells[at, 1] + rng.uniform(-0.003, 0.003, n),
+        "pollutants": rng.integers(0, 16, n),          # mask 0 asks for nothing and never fires
+        "threshold": rng.integers(0, 300, n),
+        "channel": rng.choice(["email", "pushover"], n),
+        "target": [f"user{i}@example.com" for i in range(n)],
+    })
+
+
+def brute_force(subs, cell_aqi, now, cooldown):
+    by_cell = {(round(r.lat, 2), round(r.lon, 2)): r for r in cell_aqi.itertuples(index=False)}
+    fired = {}
+    for s in subs.itertuples(index=False):
+        cell = by_cell.get((round(s.lat, 2), round(s.lon, 2)))
+        if cell is None or now - s.last_notified < cooldown:
+            continue
+        worst, worst_aqi = None, None
+        for i, p in enumerate(POLLUTANTS):
+            aqi = getattr(cell, p.replace(".", "_"))
+            if s.pollutants >> i & 1 and not np.isnan(aqi) and (worst_aqi is None or aqi > worst_aqi):
+                worst, worst_aqi = p, aqi
+        if worst is not None and worst_aqi > s.threshold:
+            fired[s.id] = (worst, int(worst_aqi))
+    return fired
+
+
+def test_evaluate_matches_plain_loop(tmp_path):
+    rng = np.random.default_rng(7)
+    now = 1_800_000_000.0
+    cells = np.round(np.column_stack([rng.uniform(8, 35, 40), rng.uniform(70, 95, 40)]), 2)
+    store = SubscriptionStore(str(tmp_path / "alerts.sqlite"))
+    store.add_many(random_subscriptions(rng, 3000, cells))
+    ids = store.load()["id"].to_numpy()
+    # Some subscriptions still cooling down, some just past it
+    store.mark_notified(rng.choice(ids, 500, replace=False), now - ALERT_COOLDOWN_SECONDS / 2)
+    store.mark_notified(rng.choice(ids, 500, replace=False), now - ALERT_COOLDOWN_SECONDS)
+
+    # Readings for most cells (one cell has none at all), gaps per pollutant, integer AQIs with ties
+    cell_aqi = pd.DataFrame({"lat": cells[:-1, 0], "lon": cells[:-1, 1]})
+    for p in POLLUTANTS:
+        values = rng.integers(0, 400, len(cell_aqi)).astype(float)
+        values[rng.random(len(cell_aqi)) < 0.2] = np.nan
+        cell_aqi[p] = values
+    cell_aqi.loc[len(cell_aqi)] = [50.0, 50.0] + [500.0] * len(POLLUTANTS)   # nobody subscribed here
+
+    engine = AlertEngine(store)
+    fired = engine.evaluate(cell_aqi, now=now, notify=False)
+    expected = brute_force(store.load(), cell_aqi.rename(columns=lambda c: c.replace(".", "_")), now, engine.cooldown)
+
+    assert len(expected) > 100
+    assert fired["id"].is_unique
+    assert {r.id: (r.pollutant, r.aqi) for r in fired.itertuples(index=False)} == expected
+    targets = store.load().set_index("id")["target"]
+    assert (fired["target"].to_numpy() == targets.loc[fired["id"]].to_numpy()).all()
+
+
+def test_notify_starts_cooldown(tmp_path):
+    store = SubscriptionStore(str(tmp_path / "alerts.sqlite"))
+    first = store.add(28.61, 77.21, ["pm2.5"], 100, "email", "a@example.com")
+    store.add(28.61, 77.21, ["o3"], 100, "email", "b@example.com")
+    engine = AlertEngine(store)
+    aqi = {"pm2.5": 180, "pm10": None, "no2": None, "o3": 90}
+    now = 1_800_000_000.0
+
+    fired = engine.evaluate_location(28.612, 77.208, aqi, now=now, notify=False)
+    assert fired["id"].tolist() == [first]
+    assert engine.evaluate_location(28.612, 77.208, aqi, now=now)["id"].tolist() == [first]
+
+    later = now + ALERT_COOLDOWN_SECONDS
+    assert engine.evaluate_location(28.612, 77.208, aqi, now=later - 1).empty
+    assert store.load().set_index("id").loc[first, "last_notified"] == now
+    assert engine.evaluate_location(28.612, 77.208, aqi, now=later)["id"].tolist() == [first]
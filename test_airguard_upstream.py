@@ -0,0 +1,93 @@
+import threading
+import time
+import airguard_upstream
+from airguard_upstream import BACKGROUND, INTERACTIVE, RateLimiter
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out waiting"
+        time.sleep(0.005)
+
+
+class GatedCondition(threading.Condition):
+    # Holds one thread back, with the lock released, right after its first wake-up
+    def __init__(self, thread_name):
+        super().__init__()
+        self.thread_name = thread_name
+        self.woken = threading.Event()
+        self.gate = threading.Event()
+
+    def wait(self, timeout=None):
+        result = super().wait(timeout)
+        if threading.current_thread().name == self.thread_name and not self.woken.is_set():
+            self.woken.set()
+            self.release()
+            self.gate.wait(5)
+            self.acquire()
+        return result
+
+
+def test_rate_limiter_in_flight_finishes_remove_own_ticket(tmp_path, monkeypatch):
+    # B1 (background) and I0 (interactive) are both past the queue, I1 waits behind I0.
+    # I0 finishes and wakes I1, but B1 finishes before I1 looks at the queue again:
+    # B1 must take out its own ticket, not I1's from the top of the heap.
+    host = "example.org"
+    limiter = RateLimiter(path=str(tmp_path / "rl.sqlite"), limits={host: (1000.0, 1000)})
+    limiter._cond = cond = GatedCondition("I1")
+    entered = {name: threading.Event() for name in ("B1", "I0", "I1")}
+    release = {name: threading.Event() for name in ("B1", "I0")}
+
+    def reserve(host, budget):
+        name = threading.current_thread().name
+        if name in entered:
+            entered[name].set()
+        if name in release:
+            release[name].wait(5)
+        return 0.0
+    monkeypatch.setattr(limiter, "_reserve", reserve)
+
+    errors = []
+
+    def caller(priority):
+        try:
+            limiter.acquire(host, priority, max_wait=2.0)
+        except Exception as e:
+            errors.append(e)
+
+    threads = {}
+    for name, priority in (("B1", BACKGROUND), ("I0", INTERACTIVE), ("I1", INTERACTIVE)):
+        threads[name] = threading.Thread(target=caller, args=(priority,), name=name)
+        threads[name].start()
+        if name != "I1":
+            assert entered[name].wait(5)
+    wait_for(lambda: len(limiter._queues[host]) == 3)
+
+    release["I0"].set()
+    threads["I0"].join(5)
+    assert cond.woken.wait(5)
+    release["B1"].set()
+    threads["B1"].join(5)
+    cond.gate.set()
+    for t in threads.values():
+        t.join(5)
+
+    assert errors == []
+    assert entered["I1"].is_set()
+    assert limiter._queues[host] == []
+    # A later background caller is not stuck behind a leaked ticket
+    assert limiter.acquire(host, BACKGROUND, max_wait=0.5) >= 0
+
+
+def test_rate_limiter_timeout_is_rate_limited_error(tmp_path):
+    host = "example.org"
+    limiter = RateLimiter(path=str(tmp_path / "rl.sqlite"), limits={host: (1.0, 1)})
+    limiter.acquire(host)
+    try:
+        limiter.acquire(host, max_wait=0.1)
+    except airguard_upstream.RateLimitedError:
+        pass
+    else:
+        raise AssertionError("second call within the interval should be rejected")
+    assert limiter._queues[host] == []